@@ -56,3 +56,13 @@ class RouteAdmin(admin.ModelAdmin):
 
     autocomplete_fields = ('author', )
     inlines = (RoutePlaceInline, RouteCriterionInline, )
+
+
+@admin.register(models.RouteBuildJob)
+class RouteBuildJobAdmin(admin.ModelAdmin):
+    """ Администраторская страница для заданий на построение маршрутов """
+    search_fields = ('route__uuid', 'route__name', 'author__username', )
+    list_display = ('route', 'author', 'status', 'requested_at', 'published_at', 'finished_at', )
+    list_filter = ('status', )
+    ordering = ('-requested_at', )
+    readonly_fields = ('route', 'author', 'fingerprint', 'status', 'requested_at', 'published_at', 'finished_at', )
@@ -1,20 +1,24 @@
+import asyncio
 import uuid
 from typing import List, Optional
 
 from asgiref.sync import sync_to_async
 
-from django.shortcuts import render
+from django.db.models import prefetch_related_objects
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from django.contrib import auth
 
 from ninja import NinjaAPI, Query, pagination, errors
 from ninja.security import django_auth
 
-from route_settings_builder import models, schemas, filters, models_utils, gateways, security
+from route_settings_builder import (blobs, guides, models, schemas, filters, models_utils, gateways, security,
+                                    paginators, responses, serializers, versions)
 
 SYNC_AUTH = [security.HttpBasicDjangoAuth(), django_auth]
 ASYNC_AUTH = [security.AsyncHttpBasicDjangoAuth(), django_auth]
 
-api = NinjaAPI(auth=SYNC_AUTH, urls_namespace='api')
+api = NinjaAPI(auth=SYNC_AUTH, urls_namespace='api', renderer=responses.CachingJSONRenderer())
 
 
 @api.get('/health', auth=None)
@@ -38,7 +42,10 @@ def login(request, payload: schemas.LoginSchema):
 
 
 @api.get('/places', response={200: List[schemas.PlaceSchema]})
-@pagination.paginate()
+@versions.conditional(versions.PLACES)
+@responses.cached(versions.PLACES)
+@serializers.fast_list(schemas.PlaceSchema)
+@pagination.paginate(paginators.CursorPagination, ordering=('id', ))
 def get_places(request, request_filters: filters.PlaceFilterSchema = Query(...)):
     """ Получение перечня мест """
     places = models.Place.objects.all()
@@ -46,12 +53,31 @@ def get_places(request, request_filters: filters.PlaceFilterSchema = Query(...))
     return places
 
 
+@api.get('/places/nearby', response=List[schemas.NearbyPlaceSchema])
+@versions.conditional(versions.PLACES)
+def get_nearby_places(request, latitude: float = Query(..., ge=-90, le=90),
+                      longitude: float = Query(..., ge=-180, le=180),
+                      radius_m: float = Query(..., gt=0),
+                      limit: int = Query(100, ge=1, le=1000)):
+    """ Получение мест в пределах радиуса, отсортированных по расстоянию """
+    return models.Place.objects.nearby(latitude, longitude, radius_m, limit)
+
+
+@api.get('/places/nearest', response=List[schemas.NearbyPlaceSchema])
+@versions.conditional(versions.PLACES)
+def get_nearest_places(request, latitude: float = Query(..., ge=-90, le=90),
+                       longitude: float = Query(..., ge=-180, le=180),
+                       count: int = Query(10, ge=1, le=1000)):
+    """ Получение ближайших мест, отсортированных по расстоянию """
+    return models.Place.objects.nearest(latitude, longitude, count)
+
+
 @api.get('/places/{place_id}', response=schemas.DetailedPlaceSchema)
+@versions.conditional(versions.PLACES)
 def get_place(request, place_id: int):
     """ Получение места """
     try:
-        # TODO: Оптимизация запросов к БД
-        place = models.Place.objects.get(id=place_id)
+        place = models.Place.objects.for_detail().get(id=place_id)
     except models.Place.DoesNotExist as ex:
         raise errors.HttpError(404, 'Место не найдено') from ex
 
@@ -59,6 +85,8 @@ def get_place(request, place_id: int):
 
 
 @api.get('/criteria', response=List[schemas.CriterionSchema])
+@versions.conditional(versions.CRITERIA)
+@responses.cached(versions.CRITERIA)
 def get_criteria(request, request_filters: filters.CriterionFilterSchema = Query(...)):
     """ Получение перечня критериев """
     criteria = models.Criterion.objects.all()
@@ -67,18 +95,41 @@ def get_criteria(request, request_filters: filters.CriterionFilterSchema = Query
 
 
 @api.get('/routes', response=List[schemas.ListRouteSchema])
-@pagination.paginate()
+@versions.conditional(versions.ROUTES)
+@serializers.fast_list(schemas.ListRouteSchema)
+@pagination.paginate(paginators.CursorPagination, ordering=('updated_at', 'id', ))
 def get_routes(request, request_filters: filters.RouteFilterSchema = Query(...)):
     """ Получение перечня мест """
-    routes = models.Route.objects.filter(author=request.auth).add_is_draft_field().all()
+    routes = models.Route.objects.filter(author=request.auth).defer('details').add_is_draft_field().all()
     routes = request_filters.filter(routes)
     return routes
 
 
 @api.get('/routes/{route_uuid}', response=schemas.DetailedRouteSchema)
-def get_route(request, route_uuid: uuid.UUID):
-    """ Получение маршрута """
-    return _get_route(request, route_uuid, prefetch=('places', ))
+@versions.conditional(versions.ROUTES)
+def get_route(request, route_uuid: uuid.UUID, inline_details: bool = False):
+    """ Получение маршрута. С inline_details в детализацию подставляется содержимое артефактов из хранилища """
+    route = _get_route(request, route_uuid, for_detail=True)
+    setattr(route, 'inline_details', inline_details)
+
+    return route
+
+
+@api.get('/routes/{route_uuid}/details/{name}/', response={200: str})
+@versions.conditional(versions.ROUTES)
+def get_route_detail(request, route_uuid: uuid.UUID, name: str):
+    """ Получение артефакта построения маршрута, в том числе вынесенного в хранилище """
+    route = _get_route(request, route_uuid, add_draft_field=False)
+
+    try:
+        value = blobs.load_detail(route.details, name)
+    except (OSError, ValueError) as ex:
+        raise errors.HttpError(404, 'Артефакт недоступен') from ex
+
+    if not isinstance(value, str):
+        raise errors.HttpError(404, 'Артефакт не найден')
+
+    return value
 
 
 @api.post('/routes/', response={201: schemas.DetailedRouteSchema})
@@ -90,6 +141,17 @@ def create_route(request, payload: schemas.CreateRouteSchema):
         raise errors.HttpError(400, str(ex)) from ex
 
 
+@api.post('/routes/build/', auth=ASYNC_AUTH, response=List[schemas.RouteBuildStatusSchema])
+async def build_routes(request, payload: schemas.BuildRoutesSchema):
+    """ Пакетный запрос на строительство маршрутов. Ответы построителя не ожидаются """
+    try:
+        statuses = await gateways.build_routes(payload.routes, author=request.auth)
+    except gateways.BuildCapacityExceeded as ex:
+        raise errors.HttpError(429, str(ex)) from ex
+
+    return [{'uuid': route_uuid, 'status': status} for route_uuid, status in statuses.items()]
+
+
 @api.put('/routes/{route_uuid}/', response=schemas.DetailedRouteSchema)
 def update_route(request, route_uuid: uuid.UUID, payload: schemas.CreateRouteSchema):
     """ Обновление маршрута """
@@ -136,27 +198,55 @@ async def build_route(request, route_uuid: uuid.UUID):
     except models.Route.DoesNotExist as ex:
         raise errors.HttpError(404, 'Маршрут не найден') from ex
 
-    request = {
-        'points_coordinates': await sync_to_async(models_utils.get_points_coordinates_from_route_places)(route),
-        **await sync_to_async(models_utils.get_criteria_from_route)(route)
-    }
+    build_request = (await sync_to_async(models_utils.get_build_requests)([route.id]))[route.id]
+
+    if await gateways.reuse_build_result(route.id, build_request,
+                                         route.build_fingerprint if route.details is not None else None):
+        return None
+
+    try:
+        await gateways.build_route(route_uuid, build_request, author=request.auth)
+    except gateways.BuildCapacityExceeded as ex:
+        raise errors.HttpError(429, str(ex)) from ex
+    except asyncio.TimeoutError as ex:
+        raise errors.HttpError(504, 'Построитель маршрутов не ответил') from ex
+
+
+@api.get('/routes/{route_uuid}/build/', auth=ASYNC_AUTH, response=schemas.RouteBuildJobSchema)
+async def get_route_build(request, route_uuid: uuid.UUID):
+    """ Статус последнего построения маршрута """
+    if not await models.Route.objects.filter(author=request.auth, uuid=route_uuid).aexists():
+        raise errors.HttpError(404, 'Маршрут не найден')
+
+    jobs = models.RouteBuildJob.objects.filter(route__uuid=route_uuid)
+    await sync_to_async(jobs.expire_stale)()
+
+    if (job := await jobs.order_by('-requested_at', '-id').afirst()) is None:
+        raise errors.HttpError(404, 'Построение маршрута не запрашивалось')
 
-    await gateways.build_route(route_uuid, request)
+    return job
 
 
 @api.get('/routes/{route_uuid}/guide/', response={200: str})
-def get_route_guide(request, route_uuid: uuid.UUID):
-    """ Запрос на получение гида """
-    route = _get_route(request, route_uuid, add_draft_field=False, prefetch=('places', ))
+def get_route_guide(request, route_uuid: uuid.UUID, response: HttpResponse):
+    """ Запрос на получение гида. Поддерживаются условные запросы по ETag и Last-Modified """
+    route = _get_route(request, route_uuid, add_draft_field=False, for_guide=True)
+    etag, last_modified = guides.get_guide_etag(route), guides.get_guide_last_modified(route)
+
+    if (not_modified := get_conditional_response(request, etag=etag, last_modified=last_modified)) is not None:
+        return not_modified
 
     if guide_description := route.guide_description:
+        versions.patch_conditional_headers(response, etag, last_modified)
         return guide_description
 
-    route_places = route.places.values('name', 'description')
-    return render(request, 'guide.html', context={
-        'route': route,
-        'route_places': list(route_places),
-    })
+    if guides.is_guide_streamed(route):
+        guide_response = StreamingHttpResponse(guides.stream_guide(route))
+    else:
+        guide_response = HttpResponse(guides.render_guide(route))
+
+    versions.patch_conditional_headers(guide_response, etag, last_modified)
+    return guide_response
 
 
 def _operate_route(request, route_data: dict, *args):
@@ -168,25 +258,32 @@ def _operate_route(request, route_data: dict, *args):
     :return: маршрут
     """
     route_data['author'] = request.auth
-    return models_utils.create_or_update_route(route_data, *args)
+    route = models_utils.create_or_update_route(route_data, *args)
+
+    prefetch_related_objects([route], *models.Route.objects.get_detail_prefetches())
+    return route
 
 
 def _get_route(request, route_uuid: uuid.UUID, add_draft_field: Optional[bool] = True,
-               prefetch: Optional[tuple] = None) -> models.Route:
+               for_detail: Optional[bool] = False, for_guide: Optional[bool] = False) -> models.Route:
     """
     Запрос на получение маршрута по uuid
     :param route_uuid: значение uuid маршрута
+    :param add_draft_field: добавить поле is_draft
+    :param for_detail: загрузить связи для детализации маршрута
+    :param for_guide: загрузить данные для гида маршрута
     :return: маршрут
     """
     base_query = models.Route.objects.filter(author=request.auth)
 
     if add_draft_field:
         base_query = base_query.add_is_draft_field()
-    if prefetch:
-        base_query = base_query.prefetch_related(*prefetch)
+    if for_detail:
+        base_query = base_query.for_detail()
+    if for_guide:
+        base_query = base_query.for_guide()
 
     try:
-        # TODO: оптимизация запросов к БД
         route = base_query.get(uuid=route_uuid)
     except models.Route.DoesNotExist as ex:
         raise errors.HttpError(404, 'Маршрут не найден') from ex
@@ -5,3 +5,6 @@ class RouteSettingsBuilderConfig(AppConfig):
     """ Управление тегами """
     name = 'route_settings_builder'
     verbose_name = 'RSB'
+
+    def ready(self):
+        from route_settings_builder import signals  # pylint: disable=import-outside-toplevel,unused-import
@@ -0,0 +1,178 @@
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+
+BLOB_MARKER = '$blob'
+STORAGE_ALIAS = 'route_blobs'
+URL_FIELD = 'url'
+
+logger = logging.getLogger(__name__)
+
+
+def save_blob(data: bytes) -> str:
+    """
+    Сохранение данных в хранилище по хешу содержимого. Одинаковые данные хранятся один раз.
+    Данные, сохранённые не полностью (размер не совпадает), перезаписываются
+    :param data: данные
+    :return: ключ (sha256 содержимого)
+    """
+    key = hashlib.sha256(data).hexdigest()
+    storage, name = storages[STORAGE_ALIAS], _get_blob_name(key)
+
+    if storage.exists(name) and storage.size(name) == len(data):
+        return key
+
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        # Удалённые хранилища записывают объект целиком
+        if (saved_name := storage.save(name, ContentFile(data))) != name:
+            storage.delete(saved_name)
+    else:
+        _write_atomic(path, data)
+        if (permissions_mode := getattr(storage, 'file_permissions_mode', None)) is not None:
+            os.chmod(path, permissions_mode)
+
+    return key
+
+
+def read_blob(key: str) -> bytes:
+    """
+    Чтение данных из хранилища. Содержимое сверяется с ключом
+    :param key: ключ
+    :return: данные
+    """
+    with storages[STORAGE_ALIAS].open(_get_blob_name(key), 'rb') as blob:
+        data = blob.read()
+
+    if hashlib.sha256(data).hexdigest() != key:
+        raise ValueError(f"Blob '{key}' is corrupted")
+
+    return data
+
+
+def externalize_details(details: Any) -> Any:
+    """
+    Перенос крупных артефактов построения (строк от ROUTE_BLOB_MIN_SIZE байт) из детализации маршрута
+    в хранилище. В детализации остаётся ссылка вида {"$blob": ключ}
+    :param details: детализация маршрута
+    :return: детализация со ссылками
+    """
+    if not isinstance(details, dict):
+        return details
+
+    externalized = {}
+    for name, value in details.items():
+        # Строка в UTF-8 занимает не больше 4 байт на символ: короткие строки не кодируются
+        if isinstance(value, str) and len(value) * 4 >= settings.ROUTE_BLOB_MIN_SIZE:
+            data = value.encode()
+            if len(data) >= settings.ROUTE_BLOB_MIN_SIZE:
+                value = {BLOB_MARKER: save_blob(data)}
+
+        externalized[name] = value
+
+    return externalized
+
+
+def load_detail(details: Any, name: str) -> Optional[Any]:
+    """
+    Получение артефакта из детализации маршрута. Артефакт по ссылке читается из хранилища
+    :param details: детализация маршрута
+    :param name: наименование артефакта
+    :return: значение или None
+    """
+    if not isinstance(details, dict):
+        return None
+
+    value = details.get(name)
+    if is_blob_reference(value):
+        return read_blob(value[BLOB_MARKER]).decode()
+
+    return value
+
+
+def present_details(details: Any, get_url: Callable[[str], str], inline: bool = False) -> Any:
+    """
+    Детализация маршрута для ответов API.
+    Артефакты из хранилища заменяются ссылкой вида {"url": адрес артефакта}, поэтому чтение и изменение маршрута
+    не обращаются к хранилищу. При inline подставляется содержимое артефактов, недоступный артефакт остаётся ссылкой
+    :param details: детализация маршрута
+    :param get_url: функция получения адреса артефакта по его наименованию
+    :param inline: подставить содержимое артефактов
+    :return: детализация
+    """
+    if not isinstance(details, dict):
+        return details
+
+    presented = {}
+    for name, value in details.items():
+        if is_blob_reference(value):
+            content = _read_blob_safe(value[BLOB_MARKER]) if inline else None
+            value = content if content is not None else {URL_FIELD: get_url(name)}
+
+        presented[name] = value
+
+    return presented
+
+
+def is_blob_reference(value: Any) -> bool:
+    """
+    Является ли значение ссылкой на артефакт в хранилище
+    :param value: значение
+    :return: bool
+    """
+    return isinstance(value, dict) and len(value) == 1 and isinstance(value.get(BLOB_MARKER), str)
+
+
+def _read_blob_safe(key: str) -> Optional[str]:
+    """
+    Чтение артефакта без ошибок: отсутствующий или повреждённый артефакт не прерывает ответ
+    :param key: ключ
+    :return: содержимое или None
+    """
+    try:
+        return read_blob(key).decode()
+    except (OSError, ValueError) as ex:
+        logger.warning('Blob %s is not readable: %r', key, ex)
+        return None
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """
+    Запись файла через временный файл в том же каталоге: одновременные записи не создают копий,
+    а прерванная запись не оставляет усечённого файла
+    :param path: путь к файлу
+    :param data: данные
+    :return: None
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    with tempfile.NamedTemporaryFile(dir=directory, prefix='.tmp-', delete=False) as temp_file:
+        try:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        except BaseException:
+            os.unlink(temp_file.name)
+            raise
+
+    os.replace(temp_file.name, path)
+
+
+def _get_blob_name(key: str) -> str:
+    """
+    Путь к данным в хранилище
+    :param key: ключ
+    :return: путь
+    """
+    if len(key) != 64 or not all(char in '0123456789abcdef' for char in key):
+        raise ValueError(f"Blob key '{key}' is invalid")
+
+    return f'{key[:2]}/{key[2:4]}/{key}'
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """ Ограниченный по размеру потокобезопасный кэш с временем жизни записей """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None) -> None:
+        """
+        :param maxsize: максимальное количество записей
+        :param ttl: время жизни записи в секундах (None – без ограничения)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Получение значения по ключу
+        :param key: ключ
+        :param default: значение по умолчанию
+        :return: значение
+        """
+        with self._lock:
+            try:
+                expires_at, value = self._data[key]
+            except KeyError:
+                return default
+
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Сохранение значения
+        :param key: ключ
+        :param value: значение
+        :return: None
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """
+        Удаление значения по ключу
+        :param key: ключ
+        :return: None
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop_matching(self, predicate: Callable[[Hashable, Any], bool]) -> None:
+        """
+        Удаление всех записей, удовлетворяющих условию
+        :param predicate: условие вида (ключ, значение) -> bool
+        :return: None
+        """
+        with self._lock:
+            for key in [key for key, (_, value) in self._data.items() if predicate(key, value)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        """
+        Очистка кэша
+        :return: None
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,224 @@
+import array
+import json
+import struct
+import sys
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import aio_pika
+from django.conf import settings
+
+CONTENT_TYPE_JSON = 'application/json'
+CONTENT_TYPE_PACKED = 'application/x-route-builder-packed'
+CONTENT_ENCODING_DEFLATE = 'deflate'
+
+ACCEPT_HEADER = 'x-accept'
+ACCEPT_ENCODING_HEADER = 'x-accept-encoding'
+
+MESSAGE_FORMAT_AUTO = 'auto'
+MESSAGE_FORMAT_JSON = 'json'
+MESSAGE_FORMAT_PACKED = 'packed'
+
+PACKED_MIN_POINTS = 8
+PACKED_MARKER = '$packed'
+
+_HEADER_LENGTH = struct.Struct('!I')
+
+
+class MessageCodec:
+    """
+    Кодек сообщений построителя маршрутов.
+    Компактный формат: JSON-заголовок, за которым следуют массивы координат в виде float64 (little-endian),
+    крупные сообщения сжимаются deflate. Форматы, которые процесс умеет декодировать, передаются в заголовках
+    запроса, форматы построителя берутся из заголовков его ответов. Без них используется JSON.
+    Форматы построителя запоминаются в памяти процесса, получившего ответ: при общей очереди ответов
+    RMQ_REPLY_QUEUE процессы-издатели ответов не получают, и режим auto остаётся на JSON –
+    компактный формат в этом случае включается явно через RMQ_MESSAGE_FORMAT=packed
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._peer_content_types: frozenset = frozenset()
+        self._peer_content_encodings: frozenset = frozenset()
+
+    def encode(self, message: dict) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Кодирование сообщения
+        :param message: сообщение
+        :return: (тело, свойства сообщения AMQP)
+        """
+        message_format = settings.RMQ_MESSAGE_FORMAT
+        is_packed = (message_format == MESSAGE_FORMAT_PACKED
+                     or (message_format == MESSAGE_FORMAT_AUTO and CONTENT_TYPE_PACKED in self._peer_content_types))
+
+        if is_packed:
+            body, content_type = pack(message), CONTENT_TYPE_PACKED
+        else:
+            body, content_type = json.dumps(message).encode(), CONTENT_TYPE_JSON
+
+        content_encoding = None
+        if ((is_packed or CONTENT_ENCODING_DEFLATE in self._peer_content_encodings)
+                and 0 < settings.RMQ_MESSAGE_COMPRESS_MIN_SIZE <= len(body)):
+            body, content_encoding = zlib.compress(body, 1), CONTENT_ENCODING_DEFLATE
+
+        return body, {
+            'content_type': content_type,
+            'content_encoding': content_encoding,
+            'headers': {ACCEPT_HEADER: f'{CONTENT_TYPE_PACKED}, {CONTENT_TYPE_JSON}',
+                        ACCEPT_ENCODING_HEADER: CONTENT_ENCODING_DEFLATE},
+        }
+
+    @staticmethod
+    def decode(message: aio_pika.abc.AbstractIncomingMessage) -> Any:
+        """
+        Декодирование сообщения по content_type и content_encoding.
+        Сообщения без content_type декодируются как JSON
+        :param message: сообщение
+        :return: тело сообщения
+        """
+        body = message.body
+
+        try:
+            if message.content_encoding == CONTENT_ENCODING_DEFLATE:
+                body = zlib.decompress(body)
+            elif message.content_encoding:
+                raise ValueError(f"Unsupported content encoding '{message.content_encoding}'")
+
+            if message.content_type == CONTENT_TYPE_PACKED:
+                return unpack(body)
+
+            return json.loads(body)
+        except (zlib.error, struct.error, TypeError, RecursionError) as ex:
+            # Любое некорректное тело – ValueError: consumer отклоняет такое сообщение, а не завершается
+            raise ValueError(f'Message is malformed: {ex}') from ex
+
+    def negotiate(self, headers: Optional[dict]) -> None:
+        """
+        Запоминание форматов, которые принимает построитель
+        :param headers: заголовки ответа построителя
+        :return: None
+        """
+        if not headers or ACCEPT_HEADER not in headers:
+            return
+
+        with self._lock:
+            self._peer_content_types = _parse_header_list(headers.get(ACCEPT_HEADER))
+            self._peer_content_encodings = _parse_header_list(headers.get(ACCEPT_ENCODING_HEADER))
+
+
+def pack(message: dict) -> bytes:
+    """
+    Кодирование сообщения в компактный формат.
+    Списки из PACKED_MIN_POINTS и более пар вещественных чисел передаются массивом float64
+    :param message: сообщение
+    :return: тело сообщения
+    """
+    values = array.array('d')
+    header = json.dumps(_pack_value(message, values)).encode()
+
+    if sys.byteorder != 'little':
+        values.byteswap()
+
+    return _HEADER_LENGTH.pack(len(header)) + header + values.tobytes()
+
+
+def unpack(body: bytes) -> Any:
+    """
+    Декодирование сообщения в компактном формате
+    :param body: тело сообщения
+    :return: сообщение
+    """
+    (header_length,) = _HEADER_LENGTH.unpack_from(body)
+    header_end = _HEADER_LENGTH.size + header_length
+    if header_end > len(body):
+        raise ValueError('Packed header is out of range')
+
+    values = array.array('d')
+    try:
+        values.frombytes(memoryview(body)[header_end:])
+    except ValueError as ex:
+        raise ValueError(f'Packed arrays are malformed: {ex}') from ex
+
+    if sys.byteorder != 'little':
+        values.byteswap()
+
+    return _unpack_value(json.loads(body[_HEADER_LENGTH.size:header_end]), values.tolist())
+
+
+def _pack_value(value: Any, values: array.array) -> Any:
+    """
+    Замена списков координат ссылками на массив values
+    :param value: значение
+    :param values: массив, в который добавляются координаты
+    :return: значение для JSON-заголовка
+    """
+    if isinstance(value, dict):
+        return {key: _pack_value(item, values) for key, item in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        if _is_points(value):
+            offset = len(values)
+            for point in value:
+                values.extend(point)
+            return {PACKED_MARKER: [offset, len(value)]}
+
+        return [_pack_value(item, values) for item in value]
+
+    return value
+
+
+def _unpack_value(value: Any, values: List[float]) -> Any:
+    """
+    Восстановление списков координат по ссылкам на массив values
+    :param value: значение из JSON-заголовка
+    :param values: массив координат
+    :return: значение
+    """
+    if isinstance(value, dict):
+        if (reference := value.get(PACKED_MARKER)) is not None and len(value) == 1:
+            if not (isinstance(reference, list) and len(reference) == 2
+                    and all(type(item) is int and item >= 0 for item in reference)):  # pylint: disable=unidiomatic-typecheck
+                raise ValueError('Packed array reference is malformed')
+
+            offset, count = reference
+            if offset + count * 2 > len(values):
+                raise ValueError('Packed array reference is out of range')
+
+            coordinates = iter(values[offset:offset + count * 2])
+            return [[latitude, longitude] for latitude, longitude in zip(coordinates, coordinates)]
+
+        return {key: _unpack_value(item, values) for key, item in value.items()}
+
+    if isinstance(value, list):
+        return [_unpack_value(item, values) for item in value]
+
+    return value
+
+
+def _is_points(value: list) -> bool:
+    """
+    Является ли значение списком пар вещественных чисел
+    :param value: значение
+    :return: bool
+    """
+    return len(value) >= PACKED_MIN_POINTS and all(
+        isinstance(point, (list, tuple)) and len(point) == 2
+        and type(point[0]) is float and type(point[1]) is float  # pylint: disable=unidiomatic-typecheck
+        for point in value
+    )
+
+
+def _parse_header_list(value: Any) -> frozenset:
+    """
+    Разбор значения заголовка вида "a, b"
+    :param value: значение заголовка
+    :return: множество значений
+    """
+    if isinstance(value, bytes):
+        value = value.decode()
+
+    return frozenset(item.strip() for item in value.split(',')) if isinstance(value, str) else frozenset()
+
+
+codec = MessageCodec()
@@ -1,9 +1,19 @@
 # pylint: disable=abstract-method,missing-class-docstring,too-few-public-methods
-from typing import Optional, List
+import math
+import re
+from typing import Optional, List, Tuple
 from uuid import UUID
 
-from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.db.models import Exists, OuterRef, Q
 from ninja import FilterSchema, Field
+from pydantic import field_validator
+
+from route_settings_builder import models, registry, geo, validators
+
+
+CRITERION_PATTERN = re.compile(r'^(?P<name>[^:<>=]+)(?P<operator>:|>=|<=|>|<)(?P<value>.*)$')
+CRITERION_LOOKUPS = {':': '', '>=': '__gte', '<=': '__lte', '>': '__gt', '<': '__lt'}
 
 
 class PlaceFilterSchema(FilterSchema):
@@ -15,15 +25,52 @@ class PlaceFilterSchema(FilterSchema):
     latitude__lte: Optional[float] = None
     criteria: Optional[List[str]] = None
     id__in: Optional[List[int]] = None
+    near: Optional[str] = Field(None, description='Окружность вида "широта,долгота,радиус в метрах"')
+
+    @field_validator('criteria')
+    @classmethod
+    def validate_criteria(cls, value: Optional[List[str]]) -> Optional[List[str]]:
+        """
+        Проверка формата критериев
+        :param value: список критериев
+        :return: значение
+        """
+        for criterion in value or []:
+            _parse_criterion(criterion)
+        return value
+
+    @field_validator('near')
+    @classmethod
+    def validate_near(cls, value: Optional[str]) -> Optional[str]:
+        """
+        Проверка формата окружности
+        :param value: окружность вида 'lat,lon,radius_m'
+        :return: значение
+        """
+        if value is not None:
+            _parse_near(value)
+        return value
 
     @staticmethod
     def filter_criteria(value: Optional[List[str]]) -> Q:
         """
         Фильтр по критериям
-        :param value: список критериев вида ['internal_name:value', ...]
+        :param value: список критериев вида ['internal_name:value', 'internal_name>=value', ...]
         :return: query
         """
-        return _filter_by_criteria('placecriterion__value', value)
+        return _filter_by_criteria(models.PlaceCriterion, 'place', value)
+
+    @staticmethod
+    def filter_near(value: Optional[str]) -> Q:
+        """
+        Фильтр по расстоянию до точки
+        :param value: окружность вида 'lat,lon,radius_m'
+        :return: query
+        """
+        if not value:
+            return Q()
+
+        return geo.get_radius_query(*_parse_near(value))
 
     class Meta:
         expression_connector = 'AND'
@@ -47,23 +94,39 @@ class RouteFilterSchema(FilterSchema):
     criteria: Optional[List[str]] = None
     id__in: Optional[List[int]] = None
 
+    @field_validator('criteria')
+    @classmethod
+    def validate_criteria(cls, value: Optional[List[str]]) -> Optional[List[str]]:
+        """
+        Проверка формата критериев
+        :param value: список критериев
+        :return: значение
+        """
+        for criterion in value or []:
+            _parse_criterion(criterion)
+        return value
+
     @staticmethod
     def filter_criteria(value: Optional[List[str]]) -> Q:
         """
         Фильтр по критериям
-        :param value: список критериев вида ['internal_name:value', ...]
+        :param value: список критериев вида ['internal_name:value', 'internal_name>=value', ...]
         :return: query
         """
-        return _filter_by_criteria('routecriterion__value', value)
+        return _filter_by_criteria(models.RouteCriterion, 'route', value)
 
     class Meta:
         expression_connector = 'AND'
 
 
-def _filter_by_criteria(through_field_name: str, filter_criteria: Optional[List[str]]) -> Q:
+def _filter_by_criteria(through_model, owner_field_name: str, filter_criteria: Optional[List[str]]) -> Q:
     """
-    Фильтрация по критериям
-    :param through_field_name: наименование поля, содержащего значение критерия
+    Фильтрация по критериям: на каждый критерий – отдельный подзапрос EXISTS
+    по индексу (criterion_id, значение, id владельца), поэтому объект должен удовлетворять всем критериям сразу.
+    Числовые и логические критерии сравниваются по типизированным колонкам.
+    Критерии определяются по реестру, без соединения с таблицей критериев
+    :param through_model: промежуточная модель связи с критериями
+    :param owner_field_name: наименование поля промежуточной модели, ссылающегося на фильтруемую модель
     :param filter_criteria: перечень критериев
     :return: query
     """
@@ -71,7 +134,73 @@ def _filter_by_criteria(through_field_name: str, filter_criteria: Optional[List[
 
     if filter_criteria:
         for criterion in filter_criteria:
-            criterion_internal_name, criterion_value = criterion.split(':')
-            query &= Q(**{'criteria__internal_name': criterion_internal_name, through_field_name: criterion_value})
+            criterion_internal_name, operator, criterion_value = _parse_criterion(criterion)
+
+            if (criterion_entry := registry.criteria.get_by_internal_name(criterion_internal_name)) is None:
+                return Q(pk__in=[])
+
+            try:
+                value_query = _get_criterion_value_query(criterion_entry.value_type, operator, criterion_value)
+            except ValidationError:
+                return Q(pk__in=[])
+
+            query &= Q(Exists(through_model.objects.filter(value_query, **{owner_field_name: OuterRef('pk')},
+                                                           criterion_id=criterion_entry.id)))
 
     return query
+
+
+def _get_criterion_value_query(value_type: str, operator: str, value: str) -> Q:
+    """
+    Условие на значение критерия
+    :param value_type: тип значения критерия
+    :param operator: оператор сравнения
+    :param value: значение
+    :return: query
+    """
+    if value_type == 'numeric':
+        typed_value = models.cast_value(value_type, models.validate_value(value_type, value))
+        return Q(**{f'numeric_value{CRITERION_LOOKUPS[operator]}': typed_value})
+
+    if operator != ':':
+        raise ValidationError('Сравнение доступно только для числовых критериев', code='invalid')
+
+    if value_type == 'boolean':
+        return Q(bool_value=models.cast_value(value_type, models.validate_value(value_type, value)))
+
+    return Q(value=value)
+
+
+def _parse_criterion(criterion: str) -> Tuple[str, str, str]:
+    """
+    Разбор критерия фильтра
+    :param criterion: критерий вида 'internal_name:value', 'internal_name>=value' и т.п.
+    :return: (внутреннее наименование, оператор, значение)
+    """
+    if not (match := CRITERION_PATTERN.match(criterion)):
+        raise ValueError('Ожидается критерий вида "internal_name:value" или "internal_name>=value"')
+
+    return match.group('name'), match.group('operator'), match.group('value')
+
+
+def _parse_near(value: str) -> Tuple[float, float, float]:
+    """
+    Разбор окружности
+    :param value: окружность вида 'lat,lon,radius_m'
+    :return: (широта, долгота, радиус в метрах)
+    """
+    try:
+        latitude, longitude, radius_m = (float(part) for part in value.split(','))
+        # float() принимает nan и inf, которые проходят сравнения в проверках координат
+        if not all(math.isfinite(part) for part in (latitude, longitude, radius_m)):
+            raise ValueError('Значения должны быть конечными числами')
+        validators.validate_latitude(latitude)
+        validators.validate_longitude(longitude)
+    except (ValueError, ValidationError) as ex:
+        raise ValueError('Ожидается значение вида "широта,долгота,радиус в метрах"') from ex
+
+    # Те же ограничения, что у параметров /places/nearby
+    if radius_m <= 0:
+        raise ValueError('Радиус должен быть положительным')
+
+    return latitude, longitude, radius_m
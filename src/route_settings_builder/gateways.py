@@ -1,25 +1,201 @@
+import asyncio
+import contextlib
+import logging
+import threading
 import uuid
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Iterable, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
 
 from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.utils import timezone
 import aio_pika
 
-from mq_misc.amqp import ReplyToConsumer, create_weak_publisher
+from mq_misc.amqp import AdapterError, BaseConsumer, Publisher, ReplyToConsumer
+
+from route_settings_builder import blobs, caches, encoding, models, models_utils, versions
+
+logger = logging.getLogger(__name__)
+
+BUILD_STATUS_QUEUED = 'queued'
+BUILD_STATUS_IN_PROGRESS = 'in_progress'
+BUILD_STATUS_UNCHANGED = 'unchanged'
+BUILD_STATUS_CACHED = 'cached'
+BUILD_STATUS_NOT_FOUND = 'not_found'
+BUILD_STATUS_FAILED = 'failed'
+BUILD_STATUS_THROTTLED = 'throttled'
+
+build_results = caches.TTLCache(maxsize=settings.BUILD_RESULT_CACHE_MAXSIZE, ttl=settings.BUILD_RESULT_CACHE_TTL)
+
 
-from route_settings_builder import models
+class BuildCapacityExceeded(Exception):
+    """ Превышено ограничение на количество выполняемых построений """
 
 
 class ReplyToRouteBuilderConsumer(ReplyToConsumer):
-    """ Consumer, создающийся для обработки запроса """
-    route_uuid: uuid.UUID
+    """
+    Общий consumer ответов построителя маршрутов.
+    Ответы сопоставляются с заданиями на построение по correlation id.
+    Если задана общая очередь ответов RMQ_REPLY_QUEUE, ответы обрабатывает команда consume_build_replies
+    """
+
+    @property
+    def timeout(self) -> Optional[float]:
+        return settings.RMQ_REPLY_TIMEOUT
 
-    def __init__(self, route_uuid: uuid.UUID, *args, **kwargs) -> None:
+    async def publish(  # pylint: disable=too-many-arguments
+            self, message: dict, publisher: 'PublisherPool', correlation_id: str = None,
+            on_published: Optional[Callable[[], Awaitable]] = None, wait_reply: bool = True) -> Any:
         """
-        :param route_uuid: UUID маршрута
-        :param args:
-        :param kwargs:
+        Публикация запроса и ожидание ответа
+        :param message: сообщение
+        :param publisher: пул издателей
+        :param correlation_id: correlation id задания на построение
+        :param on_published: функция, вызываемая после подтверждения публикации брокером
+        :param wait_reply: ожидать ли ответ в этом процессе
+        :return: результат обработки ответа
+        """
+        correlation_id = correlation_id or str(uuid.uuid4())
+        if wait_reply:
+            future = self.loop.create_future()
+            self.futures[correlation_id] = future, message
+
+        try:
+            async with publisher.acquire() as channel_publisher:
+                await self._publish(message, correlation_id, channel_publisher)
+
+            if on_published is not None:
+                await on_published()
+
+            return await asyncio.wait_for(future, timeout=self.timeout) if wait_reply else None
+        finally:
+            self.futures.pop(correlation_id, None)
+
+    async def publish_many(self, messages: Dict[str, dict], publisher: 'PublisherPool') -> Dict[str, bool]:
+        """
+        Конвейерная публикация запросов без ожидания ответов.
+        Запросы публикуются в одном канале, подтверждения брокера ожидаются одновременно
+        :param messages: словарь вида {correlation id: сообщение}
+        :param publisher: пул издателей
+        :return: словарь вида {correlation id: подтверждена ли публикация}
+        """
+        async with publisher.acquire() as channel_publisher:
+            results = await asyncio.gather(*(self._publish(message, correlation_id, channel_publisher)
+                                             for correlation_id, message in messages.items()),
+                                           return_exceptions=True)
+
+        published = {}
+        for correlation_id, result in zip(messages, results):
+            if isinstance(result, Exception):
+                logger.error('Build request %s is not published: %r', correlation_id, result)
+
+            published[correlation_id] = not isinstance(result, Exception)
+
+        return published
+
+    async def process_message(self, body: dict, raw_message: aio_pika.IncomingMessage) -> None:
+        """
+        Обработка сообщения
+        :param body: тело response
+        :param raw_message: "сырое" сообщение
+        :return: None
+        """
+        await apply_build_replies({raw_message.correlation_id: body})
+
+    async def _publish(self, message: dict, correlation_id: str, publisher: Publisher) -> None:
+        """
+        Публикация запроса с указанием очереди для ответа
+        :param message: сообщение
+        :param correlation_id: correlation id
+        :param publisher: издатель
+        :return: None
+        """
+        await publisher.publish(message, correlation_id=correlation_id,
+                                reply_to=settings.RMQ_REPLY_QUEUE or self.queue.name)
+
+    async def _handle_delivery(self, message: aio_pika.IncomingMessage) -> None:
+        """
+        Обработка полученного сообщения. Тело декодируется кодеком encoding.codec, ответы без ожидающего запроса
+        применяются к заданиям на построение, ответы на устаревшие задания отбрасываются
+        :param message: сообщение
+        :return: None
+        """
+        async with message.process():
+            try:
+                encoding.codec.negotiate(message.headers)
+                await self.process_message(encoding.codec.decode(message), message)
+            except Exception as ex:  # pylint: disable=broad-except
+                await self._on_handle_delivery_error(ex, message)
+
+        future, _ = self.futures.pop(message.correlation_id, (None, None))
+        if future is not None and not future.done():
+            future.set_result(True)
+
+
+class RouteBuildRepliesConsumer(BaseConsumer):
+    """
+    Consumer общей очереди ответов построителя RMQ_REPLY_QUEUE.
+    Ответы накапливаются в пакеты до batch_size сообщений или flush_interval секунд,
+    записываются одним запросом и подтверждаются после фиксации транзакции
+    """
+
+    def __init__(self, *args, batch_size: int, flush_interval: float, **kwargs) -> None:
+        """
+        :param batch_size: максимальный размер пакета
+        :param flush_interval: максимальное время накопления пакета в секундах
         """
         super().__init__(*args, **kwargs)
-        self.route_uuid = route_uuid
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._messages: Optional[asyncio.Queue] = None
+
+    async def run(self) -> None:
+        """
+        Обработка ответов до остановки процесса
+        :return: None
+        """
+        self._messages = asyncio.Queue()
+        await self.create_consume_connection(prefetch_count=self.batch_size, durable=True)
+
+        try:
+            while True:
+                messages = await self._get_batch()
+                try:
+                    await self.process_batch(messages)
+                except Exception as ex:  # pylint: disable=broad-except
+                    logger.error('Replies batch is not processed: %r', ex, exc_info=True)
+                    await self._nack_unprocessed(messages)
+        finally:
+            await self.close()
+
+    async def process_batch(self, messages: List[aio_pika.IncomingMessage]) -> None:
+        """
+        Запись пакета ответов. При ошибке записи сообщения возвращаются в очередь
+        :param messages: сообщения
+        :return: None
+        """
+        replies, decoded_messages = {}, []
+
+        for message in messages:
+            try:
+                replies[message.correlation_id] = encoding.codec.decode(message)
+                decoded_messages.append(message)
+            except ValueError as ex:
+                logger.error('Reply %s is not decoded: %r', message.correlation_id, ex)
+                await message.reject()
+
+        try:
+            await apply_build_replies(replies)
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.error('Replies batch is not applied: %r', ex, exc_info=True)
+            for message in decoded_messages:
+                await message.nack(requeue=True)
+            return
+
+        for message in decoded_messages:
+            await message.ack()
 
     async def process_message(self, body: dict, raw_message: aio_pika.IncomingMessage) -> None:
         """
@@ -28,19 +204,438 @@ class ReplyToRouteBuilderConsumer(ReplyToConsumer):
         :param raw_message: "сырое" сообщение
         :return: None
         """
-        await models.Route.objects.filter(uuid=self.route_uuid).aupdate(details=body)
+        await apply_build_replies({raw_message.correlation_id: body})
+
+    @staticmethod
+    async def _nack_unprocessed(messages: List[aio_pika.IncomingMessage]) -> None:
+        """
+        Возврат в очередь сообщений пакета, обработка которого прервана ошибкой.
+        Повторно доставленное сообщение не возвращается, чтобы оно не останавливало обработку очереди
+        :param messages: сообщения
+        :return: None
+        """
+        for message in messages:
+            if not message.processed:
+                await message.nack(requeue=not message.redelivered)
+
+    async def _get_batch(self) -> List[aio_pika.IncomingMessage]:
+        """
+        Накопление пакета сообщений
+        :return: сообщения
+        """
+        batch = [await self._messages.get()]
+        deadline = self.loop.time() + self.flush_interval
+
+        while len(batch) < self.batch_size and (timeout := deadline - self.loop.time()) > 0:
+            try:
+                batch.append(await asyncio.wait_for(self._messages.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _handle_delivery(self, message: aio_pika.IncomingMessage) -> None:
+        self._messages.put_nowait(message)
+
+
+class RouteBuilderPublisher(Publisher):
+    """ Издатель запросов построителю. Формат сообщения выбирается кодеком encoding.codec """
+
+    async def publish(self, message: dict, **kwargs) -> None:
+        """
+        Публикация сообщения
+        :param message: сообщение
+        :param kwargs: свойства сообщения AMQP
+        :return: None
+        """
+        if self.channel is None or self.exchange is None:
+            raise AdapterError('Connection is not established')
+
+        body, properties = encoding.codec.encode(message)
+        routing_key = kwargs.pop('routing_key', self.queue_name)
+
+        await self.exchange.publish(aio_pika.Message(body, **properties, **kwargs), routing_key=routing_key)
+
+
+class PublisherPool:
+    """ Пул издателей: каждый издатель использует собственный канал общего подключения """
+
+    def __init__(self, connection: aio_pika.abc.AbstractConnection, size: int) -> None:
+        """
+        :param connection: подключение
+        :param size: количество каналов
+        """
+        self.connection = connection
+        self.size = size
+        self._publishers: List[RouteBuilderPublisher] = []
+        self._available: Optional[asyncio.Queue] = None
+
+    async def open(self) -> None:
+        """
+        Открытие каналов
+        :return: None
+        """
+        self._available = asyncio.Queue()
+
+        for _ in range(self.size):
+            publisher = RouteBuilderPublisher(settings.RMQ_URL, settings.RMQ_QUEUE)
+            publisher.connection = self.connection
+            await publisher.create_connection()
+
+            self._publishers.append(publisher)
+            self._available.put_nowait(publisher)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        """
+        Получение свободного издателя
+        :return: издатель
+        """
+        publisher = await self._available.get()
+        try:
+            yield publisher
+        finally:
+            self._available.put_nowait(publisher)
+
+    async def close(self) -> None:
+        """
+        Закрытие каналов
+        :return: None
+        """
+        for publisher in self._publishers:
+            await publisher.close_channel()
+        self._publishers.clear()
+
+
+class RouteBuilderGateway:
+    """
+    Шлюз построителя маршрутов.
+    Одно подключение на процесс, пул каналов для публикации и один reply-to consumer.
+    Работает в собственном event loop в фоновом потоке, поэтому доступен из event loop любого запроса
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._started: Optional[asyncio.Future] = None
+        self.connection = None
+        self.publishers: Optional[PublisherPool] = None
+        self.consumer: Optional[ReplyToRouteBuilderConsumer] = None
+        self._builds: Dict[Tuple[uuid.UUID, str], asyncio.Future] = {}
+
+    async def build_route(self, route_uuid: uuid.UUID, request: dict, author=None) -> Any:
+        """
+        Построение маршрута
+        :param route_uuid: UUID маршрута
+        :param request: запрос
+        :param author: автор маршрута (None – без ограничения по автору)
+        :return: результат обработки ответа
+        """
+        return await self.run(self._build_route(route_uuid, request, author))
+
+    async def publish_routes(self, requests: Dict[uuid.UUID, dict], author=None) -> Dict[uuid.UUID, str]:
+        """
+        Публикация запросов на построение набора маршрутов без ожидания ответов
+        :param requests: словарь вида {UUID маршрута: запрос}
+        :param author: автор маршрутов (None – без ограничения по автору)
+        :return: словарь вида {UUID маршрута: статус}
+        """
+        return await self.run(self._publish_routes(requests, author))
+
+    async def run(self, coroutine: Coroutine) -> Any:
+        """
+        Выполнение корутины в event loop шлюза
+        :param coroutine: корутина
+        :return: результат корутины
+        """
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self._get_loop()))
+
+    def close(self) -> None:
+        """
+        Закрытие подключения и остановка event loop шлюза
+        :return: None
+        """
+        with self._lock:
+            loop, self._loop = self._loop, None
+
+        if loop is None:
+            return
+
+        asyncio.run_coroutine_threadsafe(self._close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    async def _build_route(self, route_uuid: uuid.UUID, request: dict, author=None) -> Any:
+        """
+        Построение маршрута с объединением одновременных запросов.
+        Запросы с теми же данными для того же маршрута ожидают уже выполняемое построение
+        :param route_uuid: UUID маршрута
+        :param request: запрос
+        :param author: автор маршрута
+        :return: результат обработки ответа
+        """
+        key = route_uuid, models_utils.get_build_fingerprint(request)
+
+        if (build := self._builds.get(key)) is None:
+            build = self._builds[key] = asyncio.ensure_future(self._claim_and_build(route_uuid, request, key[1],
+                                                                                    author))
+            build.add_done_callback(lambda _: self._builds.pop(key, None))
+
+        return await asyncio.shield(build)
+
+    async def _claim_and_build(self, route_uuid: uuid.UUID, request: dict, fingerprint: str, author) -> Any:
+        """
+        Захват построения маршрута и публикация запроса.
+        Если построение с теми же данными выполняется другим процессом, ожидается его завершение
+        :param route_uuid: UUID маршрута
+        :param request: запрос
+        :param fingerprint: отпечаток данных построения
+        :param author: автор маршрута
+        :return: результат обработки ответа
+        """
+        claimed = await sync_to_async(models_utils.claim_builds)({route_uuid: fingerprint}, author=author,
+                                                                 limit_capacity=True)
+        if route_uuid not in claimed:
+            return await wait_builds([route_uuid])
+        if claimed[route_uuid] is None:
+            raise BuildCapacityExceeded('Превышено ограничение на количество выполняемых построений')
+
+        try:
+            await self._ensure_started()
+            result = await self.consumer.publish(
+                request, self.publishers, claimed[route_uuid],
+                on_published=lambda: sync_to_async(models_utils.mark_builds_published)([route_uuid]),
+                wait_reply=not settings.RMQ_REPLY_QUEUE,
+            )
+
+            # Ответ из общей очереди записывает команда consume_build_replies
+            if settings.RMQ_REPLY_QUEUE and await wait_builds([route_uuid], timeout=settings.RMQ_REPLY_TIMEOUT):
+                raise asyncio.TimeoutError
+        except asyncio.TimeoutError:
+            await sync_to_async(models_utils.release_build_claims)({route_uuid: fingerprint},
+                                                                   models.RouteBuildJob.STATUS_EXPIRED)
+            raise
+        except Exception:
+            await sync_to_async(models_utils.release_build_claims)({route_uuid: fingerprint})
+            raise
+
+        return result
+
+    async def _publish_routes(self, requests: Dict[uuid.UUID, dict], author=None) -> Dict[uuid.UUID, str]:
+        """
+        Захват построения маршрутов и конвейерная публикация запросов.
+        Маршруты сверх ограничения на количество выполняемых построений не публикуются
+        :param requests: словарь вида {UUID маршрута: запрос}
+        :param author: автор маршрутов
+        :return: словарь вида {UUID маршрута: статус}
+        """
+        fingerprints = {route_uuid: models_utils.get_build_fingerprint(request)
+                        for route_uuid, request in requests.items()}
+        claimed = await sync_to_async(models_utils.claim_builds)(fingerprints, author=author, limit_capacity=True)
+
+        throttled = [route_uuid for route_uuid, correlation_id in claimed.items() if correlation_id is None]
+        claimed = {route_uuid: correlation_id for route_uuid, correlation_id in claimed.items() if correlation_id}
+
+        if throttled and not claimed:
+            raise BuildCapacityExceeded('Превышено ограничение на количество выполняемых построений')
+
+        statuses = {route_uuid: BUILD_STATUS_THROTTLED if route_uuid in throttled else BUILD_STATUS_IN_PROGRESS
+                    for route_uuid in requests}
+        if not claimed:
+            return statuses
+
+        published = dict.fromkeys(claimed, False)
+
+        try:
+            await self._ensure_started()
+            published_requests = await self.consumer.publish_many({
+                correlation_id: requests[route_uuid] for route_uuid, correlation_id in claimed.items()
+            }, self.publishers)
+            published.update({route_uuid: published_requests[correlation_id]
+                              for route_uuid, correlation_id in claimed.items()})
+        finally:
+            await sync_to_async(models_utils.mark_builds_published)(
+                [route_uuid for route_uuid in claimed if published[route_uuid]])
+            await sync_to_async(models_utils.release_build_claims)({
+                route_uuid: fingerprints[route_uuid] for route_uuid in claimed if not published[route_uuid]
+            })
+
+        statuses.update({route_uuid: BUILD_STATUS_QUEUED if is_published else BUILD_STATUS_FAILED
+                         for route_uuid, is_published in published.items()})
+        return statuses
+
+    async def _ensure_started(self) -> None:
+        """
+        Ленивое подключение к брокеру при первом запросе
+        :return: None
+        """
+        if self._started is None:
+            self._started = asyncio.ensure_future(self._start())
 
+        try:
+            await asyncio.shield(self._started)
+        except Exception:
+            # Неудачное подключение повторяется при следующем запросе
+            self._started = None
+            raise
 
-async def build_route(route_uuid: uuid.UUID, request: dict) -> None:
+    async def _start(self) -> None:
+        self.connection = await aio_pika.connect_robust(settings.RMQ_URL)
+
+        self.publishers = PublisherPool(self.connection, settings.RMQ_CHANNEL_POOL_SIZE)
+        await self.publishers.open()
+
+        self.consumer = ReplyToRouteBuilderConsumer(settings.RMQ_URL, loop=self._loop)
+        self.consumer.connection = self.connection
+        await self.consumer.create_consume_connection(prefetch_count=settings.RMQ_PREFETCH_COUNT)
+
+    async def _close(self) -> None:
+        if self.publishers is not None:
+            await self.publishers.close()
+        if self.consumer is not None:
+            await self.consumer.close_channel()
+        if self.connection is not None:
+            await self.connection.close()
+
+        self._started = self.connection = self.publishers = self.consumer = None
+        self._builds.clear()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Получение event loop шлюза. Фоновый поток запускается при первом обращении
+        :return: event loop
+        """
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='route-builder-gateway', daemon=True).start()
+
+            return self._loop
+
+
+gateway = RouteBuilderGateway()
+
+
+async def build_route(route_uuid: uuid.UUID, request: dict, author=None) -> None:
     """
     Построение маршрута
     :param route_uuid: UUID маршрута
     :param request: запрос
+    :param author: автор маршрута (None – без ограничения по автору)
+    :return: None
+    """
+    await gateway.build_route(route_uuid, request, author)
+
+
+async def wait_builds(routes_uuids: List[uuid.UUID], timeout: Optional[float] = None) -> int:
+    """
+    Ожидание завершения выполняемых построений маршрутов
+    :param routes_uuids: перечень UUID маршрутов
+    :param timeout: таймаут ожидания в секундах (None – до истечения захвата построения)
+    :return: количество построений, не завершённых за время ожидания
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout is not None else None
+    routes = models.Route.objects.filter_build_claimed().filter(uuid__in=routes_uuids)
+
+    while (in_progress_count := await routes.acount()) and (deadline is None or loop.time() < deadline):
+        await asyncio.sleep(settings.ROUTE_BUILD_CLAIM_POLL_INTERVAL)
+
+    return in_progress_count
+
+
+async def build_routes(routes_uuids: Iterable[uuid.UUID], author=None) -> Dict[uuid.UUID, str]:
+    """
+    Пакетное построение маршрутов без ожидания ответов построителя.
+    Координаты и критерии всех маршрутов собираются двумя запросами, запросы публикуются конвейерно.
+    Маршруты с известным результатом построения в построитель не отправляются,
+    маршруты сверх ограничения на количество выполняемых построений не отправляются
+    :param routes_uuids: перечень UUID маршрутов
+    :param author: автор маршрутов (None – без ограничения по автору)
+    :return: словарь вида {UUID маршрута: статус}
+    """
+    routes_uuids = list(dict.fromkeys(routes_uuids))
+
+    routes = models.Route.objects.filter(uuid__in=routes_uuids)
+    if author is not None:
+        routes = routes.filter(author=author)
+
+    routes = {route_id: (route_uuid, build_fingerprint if is_built else None)
+              async for route_id, route_uuid, build_fingerprint, is_built in routes.annotate(
+                  is_built=ExpressionWrapper(Q(details__isnull=False), output_field=BooleanField()),
+              ).values_list('id', 'uuid', 'build_fingerprint', 'is_built')}
+
+    statuses, requests = {}, {}
+    for route_id, request in (await sync_to_async(models_utils.get_build_requests)(routes)).items():
+        route_uuid, built_fingerprint = routes[route_id]
+
+        if status := await reuse_build_result(route_id, request, built_fingerprint):
+            statuses[route_uuid] = status
+        else:
+            requests[route_uuid] = request
+
+    if requests:
+        statuses.update(await gateway.publish_routes(requests, author))
+
+    return {route_uuid: statuses.get(route_uuid, BUILD_STATUS_NOT_FOUND) for route_uuid in routes_uuids}
+
+
+async def apply_build_replies(replies: Dict[str, Any]) -> None:
+    """
+    Запись ответов построителя и сохранение результатов построения в кэше процесса
+    :param replies: словарь вида {correlation id: ответ построителя}
     :return: None
     """
-    params = {'url': settings.RMQ_URL, 'queue_name': 'route-settings-builder'}
+    applied, replies = await sync_to_async(_apply_build_replies)(replies)
+
+    for correlation_id, fingerprint in applied.items():
+        build_results.set(fingerprint, replies[correlation_id])
+
+    if outdated_count := len(replies) - len(applied):
+        logger.info('%s outdated replies are dropped', outdated_count)
+
+
+def _apply_build_replies(replies: Dict[str, Any]) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """
+    Запись ответов построителя в отдельном потоке. Крупные артефакты переносятся в хранилище до записи в БД.
+    Устаревшие подключения к БД закрываются: consumer работает дольше, чем CONN_MAX_AGE
+    :param replies: словарь вида {correlation id: ответ построителя}
+    :return: (словарь вида {correlation id применённого ответа: отпечаток данных построения},
+              ответы со ссылками на артефакты)
+    """
+    close_old_connections()
+    replies = {correlation_id: blobs.externalize_details(reply) for correlation_id, reply in replies.items()}
+    return models_utils.apply_build_replies(replies), replies
+
+
+async def reuse_build_result(route_id: int, request: dict, built_fingerprint: Optional[str]) -> Optional[str]:
+    """
+    Применение известного результата построения без обращения к построителю.
+    Результат берётся из детализации маршрута, если данные построения не изменились,
+    либо из результата построения другого маршрута с теми же данными
+    :param route_id: id маршрута
+    :param request: запрос на построение
+    :param built_fingerprint: отпечаток данных текущей детализации маршрута (None – маршрут не построен)
+    :return: статус или None, если результат построения неизвестен
+    """
+    fingerprint = models_utils.get_build_fingerprint(request)
+
+    if fingerprint == built_fingerprint:
+        return BUILD_STATUS_UNCHANGED
+
+    if (details := build_results.get(fingerprint)) is None:
+        details = await (models.Route.objects.filter(build_fingerprint=fingerprint, details__isnull=False)
+                         .values_list('details', flat=True).afirst())
+        if details is None:
+            return None
+
+        build_results.set(fingerprint, details)
 
-    async with create_weak_publisher(settings.RMQ_URL, settings.RMQ_QUEUE) as publisher:
-        request_consumer = ReplyToRouteBuilderConsumer(route_uuid, **params)
-        await request_consumer.create_consume_connection()
-        await request_consumer.publish(request, publisher)
+    # Выполняемое построение с прежними данными заменяется известным результатом
+    await models.Route.objects.filter(pk=route_id).aupdate(details=details, build_fingerprint=fingerprint,
+                                                           build_claim_fingerprint='', build_claimed_at=None)
+    await sync_to_async(versions.touch)(versions.ROUTES)
+    await sync_to_async(models.RouteBuildJob.objects.filter(route_id=route_id).finish)(
+        models.RouteBuildJob.STATUS_SUPERSEDED)
+    await models.RouteBuildJob.objects.acreate(route_id=route_id, fingerprint=fingerprint,
+                                               status=models.RouteBuildJob.STATUS_DONE, finished_at=timezone.now())
+    return BUILD_STATUS_CACHED
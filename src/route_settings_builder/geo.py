@@ -0,0 +1,177 @@
+import math
+from typing import List, Tuple
+
+from django.db.models import F, Q, FloatField, Value
+from django.db.models.functions import ASin, Cast, Cos, Least, Power, Radians, Sin, Sqrt
+from django.db.models.lookups import LessThanOrEqual
+
+EARTH_RADIUS_M = 6_371_008.8
+
+BoundingBox = Tuple[float, float, List[Tuple[float, float]]]
+
+
+def get_bounding_box(latitude: float, longitude: float, radius_m: float) -> BoundingBox:
+    """
+    Получение ограничивающего прямоугольника для окружности на сфере
+    :param latitude: широта центра
+    :param longitude: долгота центра
+    :param radius_m: радиус в метрах
+    :return: (минимальная широта, максимальная широта, диапазоны долготы)
+    """
+    angular_radius = math.degrees(radius_m / EARTH_RADIUS_M)
+    min_latitude, max_latitude = latitude - angular_radius, latitude + angular_radius
+
+    # Окружность содержит полюс: подходит любая долгота
+    if min_latitude <= -90 or max_latitude >= 90:
+        return max(min_latitude, -90), min(max_latitude, 90), [(-180, 180)]
+
+    longitude_delta = math.degrees(math.asin(min(math.sin(math.radians(angular_radius))
+                                                 / math.cos(math.radians(latitude)), 1)))
+    min_longitude, max_longitude = longitude - longitude_delta, longitude + longitude_delta
+
+    # Переход через 180-й меридиан разбивает диапазон долготы на два
+    if min_longitude < -180:
+        return min_latitude, max_latitude, [(min_longitude + 360, 180), (-180, max_longitude)]
+    if max_longitude > 180:
+        return min_latitude, max_latitude, [(min_longitude, 180), (-180, max_longitude - 360)]
+
+    return min_latitude, max_latitude, [(min_longitude, max_longitude)]
+
+
+def get_bounding_box_query(latitude: float, longitude: float, radius_m: float) -> Q:
+    """
+    Условие попадания в ограничивающий прямоугольник окружности.
+    Использует индекс по (latitude, longitude)
+    :param latitude: широта центра
+    :param longitude: долгота центра
+    :param radius_m: радиус в метрах
+    :return: query
+    """
+    min_latitude, max_latitude, longitude_ranges = get_bounding_box(latitude, longitude, radius_m)
+
+    longitude_query = Q()
+    for min_longitude, max_longitude in longitude_ranges:
+        longitude_query |= Q(longitude__gte=min_longitude, longitude__lte=max_longitude)
+
+    return Q(latitude__gte=min_latitude, latitude__lte=max_latitude) & longitude_query
+
+
+def get_distance_expression(latitude: float, longitude: float):
+    """
+    Выражение БД для расстояния до точки в метрах (формула гаверсинусов)
+    :param latitude: широта точки
+    :param longitude: долгота точки
+    :return: выражение
+    """
+    place_latitude = Radians(Cast(F('latitude'), FloatField()))
+    place_longitude = Radians(Cast(F('longitude'), FloatField()))
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+
+    haversine = (Power(Sin((place_latitude - Value(latitude)) / 2), 2)
+                 + Cos(place_latitude) * Value(math.cos(latitude))
+                 * Power(Sin((place_longitude - Value(longitude)) / 2), 2))
+
+    # Погрешность вычислений не должна выводить аргумент arcsin за пределы области определения
+    return 2 * EARTH_RADIUS_M * ASin(Least(Sqrt(haversine), Value(1.0)), output_field=FloatField())
+
+
+def get_radius_query(latitude: float, longitude: float, radius_m: float) -> Q:
+    """
+    Условие попадания в окружность: отбор по индексу через ограничивающий прямоугольник,
+    затем точная проверка расстояния для оставшихся мест
+    :param latitude: широта центра
+    :param longitude: долгота центра
+    :param radius_m: радиус в метрах
+    :return: query
+    """
+    return (get_bounding_box_query(latitude, longitude, radius_m)
+            & Q(LessThanOrEqual(get_distance_expression(latitude, longitude), radius_m)))
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+
+
+def encode_geohash(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """
+    Кодирование координат в geohash
+    :param latitude: широта
+    :param longitude: долгота
+    :param precision: количество символов
+    :return: geohash
+    """
+    latitude_range, longitude_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bits_count, is_longitude = [], 0, 0, True
+
+    while len(geohash) < precision:
+        value, value_range = (longitude, longitude_range) if is_longitude else (latitude, latitude_range)
+        middle = (value_range[0] + value_range[1]) / 2
+
+        if value >= middle:
+            bits = bits * 2 + 1
+            value_range[0] = middle
+        else:
+            bits *= 2
+            value_range[1] = middle
+
+        is_longitude = not is_longitude
+        bits_count += 1
+
+        if bits_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits, bits_count = 0, 0
+
+    return ''.join(geohash)
+
+
+def get_geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """
+    Размер ячейки geohash в градусах
+    :param precision: количество символов
+    :return: (высота по широте, ширина по долготе)
+    """
+    bits = precision * 5
+    return 180 / 2 ** (bits // 2), 360 / 2 ** (bits - bits // 2)
+
+
+def get_geohash_cells(latitude: float, longitude: float, precision: int) -> List[str]:
+    """
+    Получение ячейки точки и соседних с ней ячеек
+    :param latitude: широта
+    :param longitude: долгота
+    :param precision: количество символов
+    :return: перечень ячеек
+    """
+    latitude_size, longitude_size = get_geohash_cell_size(precision)
+    cells = set()
+
+    for latitude_offset in (-1, 0, 1):
+        cell_latitude = latitude + latitude_offset * latitude_size
+        if not -90 <= cell_latitude <= 90:
+            continue
+
+        for longitude_offset in (-1, 0, 1):
+            cell_longitude = (longitude + longitude_offset * longitude_size + 180) % 360 - 180
+            cells.add(encode_geohash(cell_latitude, cell_longitude, precision))
+
+    return sorted(cells)
+
+
+def get_covering_geohash_precision(latitude: float, radius_m: float) -> int:
+    """
+    Получение наибольшей точности geohash, при которой ячейка точки и соседние ячейки покрывают окружность
+    :param latitude: широта центра
+    :param radius_m: радиус в метрах
+    :return: количество символов или 0, если окружность не покрывается
+    """
+    # Ширина ячейки по долготе берётся на краю окружности, ближайшем к полюсу
+    edge_latitude = min(abs(latitude) + math.degrees(radius_m / EARTH_RADIUS_M), 90)
+    metres_per_degree = math.pi * EARTH_RADIUS_M / 180
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        latitude_size, longitude_size = get_geohash_cell_size(precision)
+        if (latitude_size * metres_per_degree >= radius_m
+                and longitude_size * metres_per_degree * math.cos(math.radians(edge_latitude)) >= radius_m):
+            return precision
+
+    return 0
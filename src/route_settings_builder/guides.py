@@ -0,0 +1,99 @@
+import hashlib
+import json
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import get_template, render_to_string
+from django.utils.http import quote_etag
+
+from route_settings_builder import blobs
+
+CACHE_ALIAS = 'guides'
+TEMPLATE_NAME = 'guide.html'
+HEADER_TEMPLATE_NAME = 'guide_header.html'
+PLACE_TEMPLATE_NAME = 'guide_place.html'
+FOOTER_TEMPLATE_NAME = 'guide_footer.html'
+# Меняется вместе с шаблоном гида: отрисованные ранее гиды перестают использоваться
+TEMPLATE_VERSION = 2
+
+
+def get_guide_version(route) -> str:
+    """
+    Получение версии гида маршрута. Версия меняется при изменении маршрута, его мест и детализации.
+    Маршрут загружается через RouteQuerySet.for_guide
+    :param route: маршрут
+    :return: версия
+    """
+    state = [TEMPLATE_VERSION, str(route.uuid), route.updated_at, route.details,
+             route.places_updated_at, route.places_count, route.last_route_place_id]
+    return hashlib.sha256(json.dumps(state, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_guide_etag(route) -> str:
+    """
+    Получение ETag гида маршрута
+    :param route: маршрут
+    :return: ETag
+    """
+    return quote_etag(get_guide_version(route))
+
+
+def get_guide_last_modified(route) -> Optional[int]:
+    """
+    Получение времени последнего изменения гида маршрута
+    :param route: маршрут
+    :return: timestamp или None
+    """
+    changed_at = [value for value in (route.updated_at, route.places_updated_at, route.built_at) if value]
+    return int(max(changed_at).timestamp()) if changed_at else None
+
+
+def render_guide(route) -> str:
+    """
+    Отрисовка гида маршрута. Результат хранится в кэше GUIDE_CACHE_BACKEND по UUID и версии маршрута,
+    поэтому изменение маршрута не требует явного сброса кэша
+    :param route: маршрут
+    :return: HTML гида
+    """
+    cache = caches[CACHE_ALIAS]
+    cache_key = f'route_settings_builder:guide:{route.uuid}:{get_guide_version(route)}'
+
+    if (guide := cache.get(cache_key)) is not None:
+        return guide
+
+    guide = render_to_string(TEMPLATE_NAME, context={
+        'route': route,
+        'route_map': blobs.load_detail(route.details, 'map'),
+        'route_places': list(route.places.values('name', 'description')),
+    })
+    cache.set(cache_key, guide)
+
+    return guide
+
+
+def is_guide_streamed(route) -> bool:
+    """
+    Отдаётся ли гид потоком: гиды маршрутов от GUIDE_STREAMING_MIN_PLACES мест не собираются в памяти
+    и не кэшируются
+    :param route: маршрут
+    :return: bool
+    """
+    return 0 < settings.GUIDE_STREAMING_MIN_PLACES <= route.places_count
+
+
+def stream_guide(route) -> Iterator[str]:
+    """
+    Потоковая отрисовка гида маршрута: заголовок, разделы мест и карта отдаются по мере готовности,
+    места читаются из БД частями по GUIDE_STREAMING_CHUNK_SIZE
+    :param route: маршрут
+    :return: части HTML гида
+    """
+    yield render_to_string(HEADER_TEMPLATE_NAME, context={'route': route})
+
+    place_template = get_template(PLACE_TEMPLATE_NAME)
+    for route_place in (route.places.values('name', 'description')
+                        .iterator(chunk_size=settings.GUIDE_STREAMING_CHUNK_SIZE)):
+        yield place_template.render({'route_place': route_place})
+
+    yield render_to_string(FOOTER_TEMPLATE_NAME, context={'route_map': blobs.load_detail(route.details, 'map')})
@@ -0,0 +1,72 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from route_settings_builder import models, filters
+
+
+class Command(BaseCommand):
+    """ Замер времени фильтрации мест по координатам в зависимости от размера каталога """
+    help = 'Замер времени фильтрации мест по координатам. Данные создаются во временной транзакции и откатываются'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1_000, 10_000, 100_000],
+                            help='Размеры каталога мест')
+        parser.add_argument('--repeat', type=int, default=50, help='Количество запросов для каждого замера')
+        parser.add_argument('--radius', type=float, default=5_000, help='Радиус поиска в метрах')
+
+    def handle(self, *args, **options):
+        random.seed(0)
+
+        with transaction.atomic():
+            created_count = 0
+
+            for size in sorted(options['sizes']):
+                models.Place.objects.bulk_create(
+                    [models.Place(name=f'benchmark {i}', latitude=round(random.uniform(-60, 60), 6),
+                                  longitude=round(random.uniform(-180, 180), 6))
+                     for i in range(created_count, size)],
+                    batch_size=5_000,
+                )
+                created_count = size
+
+                bbox_duration = self._measure(options['repeat'], self._get_bbox_filters)
+                near_duration = self._measure(options['repeat'], self._get_near_filters(options['radius']))
+                self.stdout.write(f'{size} мест: bbox {bbox_duration:.2f} мс, near {near_duration:.2f} мс')
+
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _get_bbox_filters() -> filters.PlaceFilterSchema:
+        """ Фильтры по случайному прямоугольнику 1°×1° """
+        latitude, longitude = random.uniform(-60, 60), random.uniform(-180, 179)
+        return filters.PlaceFilterSchema(latitude__gte=latitude, latitude__lte=latitude + 1,
+                                         longitude__gte=longitude, longitude__lte=longitude + 1)
+
+    @staticmethod
+    def _get_near_filters(radius: float):
+        """ Функция получения фильтров по окружности со случайным центром """
+        def get_filters() -> filters.PlaceFilterSchema:
+            return filters.PlaceFilterSchema(near=f'{random.uniform(-60, 60)},{random.uniform(-180, 180)},{radius}')
+        return get_filters
+
+    @staticmethod
+    def _measure(repeat: int, get_filters) -> float:
+        """
+        Медианное время запроса в миллисекундах
+        :param repeat: количество запросов
+        :param get_filters: функция получения фильтров
+        :return: время в миллисекундах
+        """
+        durations = []
+
+        for _ in range(repeat):
+            request_filters = get_filters()
+            started_at = time.perf_counter()
+            list(request_filters.filter(models.Place.objects.values_list('id', flat=True)))
+            durations.append((time.perf_counter() - started_at) * 1000)
+
+        return statistics.median(durations)
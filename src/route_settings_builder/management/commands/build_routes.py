@@ -0,0 +1,69 @@
+import asyncio
+import collections
+import uuid
+from typing import List
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from route_settings_builder import models, gateways
+
+
+class Command(BaseCommand):
+    """ Пакетное построение маршрутов """
+    help = 'Публикация запросов на построение маршрутов пакетами и ожидание ответов построителя'
+
+    def add_arguments(self, parser):
+        parser.add_argument('routes', nargs='*', type=uuid.UUID, help='UUID маршрутов')
+        parser.add_argument('--all', action='store_true', help='Построение всех маршрутов')
+        parser.add_argument('--batch-size', type=int, default=settings.RMQ_BUILD_BATCH_SIZE,
+                            help='Количество маршрутов в пакете')
+        parser.add_argument('--wait-timeout', type=float, default=settings.RMQ_REPLY_TIMEOUT,
+                            help='Время ожидания ответов построителя в секундах')
+
+    def handle(self, *args, **options):
+        if options['all'] == bool(options['routes']):
+            raise CommandError('Укажите UUID маршрутов или --all')
+
+        routes_uuids = (list(models.Route.objects.order_by('id').values_list('uuid', flat=True))
+                        if options['all'] else options['routes'])
+
+        try:
+            asyncio.run(self._build(routes_uuids, options['batch_size'], options['wait_timeout']))
+        finally:
+            gateways.gateway.close()
+
+    async def _build(self, routes_uuids: List[uuid.UUID], batch_size: int, wait_timeout: float) -> None:
+        """
+        Построение маршрутов пакетами
+        :param routes_uuids: перечень UUID маршрутов
+        :param batch_size: количество маршрутов в пакете
+        :param wait_timeout: время ожидания ответов построителя в секундах
+        :return: None
+        """
+        statuses_count = collections.Counter()
+        not_replied_count = 0
+
+        for start in range(0, len(routes_uuids), batch_size):
+            batch = routes_uuids[start:start + batch_size]
+
+            try:
+                statuses = await gateways.build_routes(batch)
+            except gateways.BuildCapacityExceeded:
+                statuses = dict.fromkeys(batch, gateways.BUILD_STATUS_THROTTLED)
+
+            for route_uuid, status in statuses.items():
+                statuses_count[status] += 1
+                if status not in (gateways.BUILD_STATUS_QUEUED, gateways.BUILD_STATUS_UNCHANGED,
+                                  gateways.BUILD_STATUS_CACHED):
+                    self.stderr.write(f'{route_uuid}: {status}')
+
+            self.stdout.write(f'Опубликовано запросов: {statuses_count[gateways.BUILD_STATUS_QUEUED]}')
+
+            # Без общей очереди ответов ответы принимаются очередью этого процесса, поэтому она закрывается
+            # только после их получения. Следующий пакет публикуется после ответов на текущий,
+            # чтобы не превышать ограничение на построения
+            not_replied_count += await gateways.wait_builds(batch, timeout=wait_timeout)
+
+        self.stdout.write(', '.join(f'{status}: {count}' for status, count in sorted(statuses_count.items())))
+        self.stdout.write(f'Без ответа построителя: {not_replied_count}')
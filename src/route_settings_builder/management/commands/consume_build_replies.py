@@ -0,0 +1,37 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from route_settings_builder import gateways
+
+
+class Command(BaseCommand):
+    """ Обработка ответов построителя маршрутов из общей очереди """
+    help = ('Запись ответов построителя маршрутов из очереди RMQ_REPLY_QUEUE пакетами. '
+            'Допускается запуск нескольких процессов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.RMQ_PREFETCH_COUNT,
+                            help='Максимальный размер пакета, он же prefetch count канала')
+        parser.add_argument('--flush-interval', type=float, default=settings.RMQ_REPLY_FLUSH_INTERVAL,
+                            help='Максимальное время накопления пакета в секундах')
+
+    def handle(self, *args, **options):
+        if not settings.RMQ_REPLY_QUEUE:
+            raise CommandError('Не задана общая очередь ответов RMQ_REPLY_QUEUE')
+
+        asyncio.run(self._consume(options['batch_size'], options['flush_interval']))
+
+    @staticmethod
+    async def _consume(batch_size: int, flush_interval: float) -> None:
+        """
+        Обработка ответов до остановки процесса
+        :param batch_size: максимальный размер пакета
+        :param flush_interval: максимальное время накопления пакета в секундах
+        :return: None
+        """
+        consumer = gateways.RouteBuildRepliesConsumer(settings.RMQ_URL, settings.RMQ_REPLY_QUEUE,
+                                                      batch_size=batch_size, flush_interval=flush_interval,
+                                                      loop=asyncio.get_running_loop())
+        await consumer.run()
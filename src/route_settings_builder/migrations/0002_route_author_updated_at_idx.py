@@ -0,0 +1,17 @@
+# Generated by Django 4.2.8 on 2026-10-18 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_settings_builder', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['author', 'updated_at', 'id'], name='route_author_updated_at_idx'),
+        ),
+    ]
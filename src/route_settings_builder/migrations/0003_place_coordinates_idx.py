@@ -0,0 +1,17 @@
+# Generated by Django 4.2.8 on 2026-10-18 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_settings_builder', '0002_route_author_updated_at_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='place',
+            index=models.Index(fields=['latitude', 'longitude'], name='place_coordinates_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.8 on 2026-10-18 14:27
+
+from django.db import migrations, models
+
+from route_settings_builder import geo
+
+
+def fill_places_geohash(apps, schema_editor):
+    """ Заполнение geohash для существующих мест """
+    place_model = apps.get_model('route_settings_builder', 'Place')
+    places = []
+
+    for place in place_model.objects.only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        place.geohash = geo.encode_geohash(float(place.latitude), float(place.longitude))
+        places.append(place)
+
+        if len(places) == 2000:
+            place_model.objects.bulk_update(places, ['geohash'])
+            places = []
+
+    place_model.objects.bulk_update(places, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_settings_builder', '0003_place_coordinates_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12, verbose_name='Geohash'),
+        ),
+        migrations.RunPython(fill_places_geohash, migrations.RunPython.noop),
+    ]
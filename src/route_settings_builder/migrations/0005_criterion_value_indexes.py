@@ -0,0 +1,21 @@
+# Generated by Django 4.2.8 on 2026-10-18 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_settings_builder', '0004_place_geohash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='placecriterion',
+            index=models.Index(fields=['criterion', 'value', 'place'], name='place_criterion_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routecriterion',
+            index=models.Index(fields=['criterion', 'value', 'route'], name='route_criterion_value_idx'),
+        ),
+    ]
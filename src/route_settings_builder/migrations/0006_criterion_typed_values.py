@@ -0,0 +1,83 @@
+# Generated by Django 4.2.8 on 2026-10-18 14:29
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def _get_typed_values(value_type, value):
+    """ Типизированные значения (numeric_value, bool_value) для значения критерия """
+    if value_type == 'numeric':
+        try:
+            return float(value), None
+        except ValueError:
+            return None, None
+    if value_type == 'boolean' and value in ('0', '1', 'true', 'false'):
+        return None, value in ('1', 'true')
+
+    return None, None
+
+
+def fill_typed_values(apps, schema_editor):
+    """ Заполнение типизированных значений для существующих связей с критериями """
+    for model_name in ('PlaceCriterion', 'RouteCriterion'):
+        model = apps.get_model('route_settings_builder', model_name)
+        objs = []
+
+        for obj in (model.objects.filter(criterion__value_type__in=('numeric', 'boolean'))
+                    .select_related('criterion').iterator(chunk_size=BATCH_SIZE)):
+            obj.numeric_value, obj.bool_value = _get_typed_values(obj.criterion.value_type, obj.value)
+            objs.append(obj)
+
+            if len(objs) == BATCH_SIZE:
+                model.objects.bulk_update(objs, ['numeric_value', 'bool_value'])
+                objs = []
+
+        model.objects.bulk_update(objs, ['numeric_value', 'bool_value'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_settings_builder', '0005_criterion_value_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='placecriterion',
+            name='bool_value',
+            field=models.BooleanField(blank=True, editable=False, null=True, verbose_name='Логическое значение'),
+        ),
+        migrations.AddField(
+            model_name='placecriterion',
+            name='numeric_value',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Числовое значение'),
+        ),
+        migrations.AddField(
+            model_name='routecriterion',
+            name='bool_value',
+            field=models.BooleanField(blank=True, editable=False, null=True, verbose_name='Логическое значение'),
+        ),
+        migrations.AddField(
+            model_name='routecriterion',
+            name='numeric_value',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Числовое значение'),
+        ),
+        migrations.AddIndex(
+            model_name='placecriterion',
+            index=models.Index(fields=['criterion', 'numeric_value', 'place'], name='place_criterion_numeric_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='placecriterion',
+            index=models.Index(fields=['criterion', 'bool_value', 'place'], name='place_criterion_bool_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routecriterion',
+            index=models.Index(fields=['criterion', 'numeric_value', 'route'], name='route_criterion_numeric_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routecriterion',
+            index=models.Index(fields=['criterion', 'bool_value', 'route'], name='route_criterion_bool_idx'),
+        ),
+        migrations.RunPython(fill_typed_values, migrations.RunPython.noop),
+    ]
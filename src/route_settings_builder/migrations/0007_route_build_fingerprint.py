@@ -0,0 +1,18 @@
+# Generated by Django 4.2.8 on 2026-10-18 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_settings_builder', '0006_criterion_typed_values'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='build_fingerprint',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=64, verbose_name='Отпечаток данных построения'),
+        ),
+    ]
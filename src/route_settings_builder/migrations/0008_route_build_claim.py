@@ -0,0 +1,23 @@
+# Generated by Django 4.2.8 on 2026-10-18 14:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_settings_builder', '0007_route_build_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='build_claim_fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Отпечаток данных выполняемого построения'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='build_claimed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Время запроса выполняемого построения'),
+        ),
+    ]
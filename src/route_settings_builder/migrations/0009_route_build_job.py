@@ -0,0 +1,34 @@
+# Generated by Django 4.2.8 on 2026-10-18 14:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('route_settings_builder', '0008_route_build_claim'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteBuildJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64, verbose_name='Отпечаток данных построения')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('published', 'Опубликовано'), ('done', 'Построено'), ('superseded', 'Заменено более новым'), ('failed', 'Ошибка'), ('expired', 'Истекло')], default='queued', max_length=15, verbose_name='Статус')),
+                ('requested_at', models.DateTimeField(auto_now_add=True, verbose_name='Время запроса')),
+                ('published_at', models.DateTimeField(blank=True, null=True, verbose_name='Время публикации')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Время завершения')),
+                ('author', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='route_build_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='build_jobs', to='route_settings_builder.route', verbose_name='Маршрут')),
+            ],
+            options={
+                'verbose_name': 'Задание на построение маршрута',
+                'verbose_name_plural': 'задания на построение маршрутов',
+                'indexes': [models.Index(fields=['status', 'requested_at'], name='route_build_job_status_idx'), models.Index(fields=['author', 'status', 'requested_at'], name='route_build_job_author_idx'), models.Index(fields=['route', 'requested_at'], name='route_build_job_route_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.8 on 2026-10-18 15:02
+
+import uuid
+
+from django.db import migrations, models
+
+
+def fill_correlation_ids(apps, schema_editor):
+    """ Заполнение идентификаторов запросов для существующих заданий """
+    route_build_job_model = apps.get_model('route_settings_builder', 'RouteBuildJob')
+    jobs = []
+
+    for job in route_build_job_model.objects.only('id').iterator(chunk_size=2000):
+        job.correlation_id = uuid.uuid4()
+        jobs.append(job)
+
+        if len(jobs) == 2000:
+            route_build_job_model.objects.bulk_update(jobs, ['correlation_id'])
+            jobs = []
+
+    route_build_job_model.objects.bulk_update(jobs, ['correlation_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_settings_builder', '0009_route_build_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routebuildjob',
+            name='correlation_id',
+            field=models.UUIDField(editable=False, null=True, verbose_name='Идентификатор запроса'),
+        ),
+        migrations.RunPython(fill_correlation_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='routebuildjob',
+            name='correlation_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name='Идентификатор запроса'),
+        ),
+    ]
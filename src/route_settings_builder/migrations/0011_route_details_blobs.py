@@ -0,0 +1,106 @@
+import hashlib
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import migrations
+
+CHUNK_SIZE = 500
+BLOB_MARKER = '$blob'
+STORAGE_ALIAS = 'route_blobs'
+
+
+def _update_details(apps, transform) -> None:
+    """
+    Пакетное преобразование детализации маршрутов
+    :param apps: реестр моделей миграции
+    :param transform: функция преобразования детализации
+    :return: None
+    """
+    route_model = apps.get_model('route_settings_builder', 'Route')
+    routes = []
+
+    routes_with_details = route_model.objects.filter(details__isnull=False).only('id', 'details')
+
+    for route in routes_with_details.iterator(chunk_size=CHUNK_SIZE):
+        if (details := transform(route.details)) != route.details:
+            route.details = details
+            routes.append(route)
+
+        if len(routes) == CHUNK_SIZE:
+            route_model.objects.bulk_update(routes, ['details'])
+            routes = []
+
+    route_model.objects.bulk_update(routes, ['details'])
+
+
+def _get_blob_name(key: str) -> str:
+    """
+    Путь к данным в хранилище (копия blobs._get_blob_name на момент миграции)
+    :param key: ключ
+    :return: путь
+    """
+    return f'{key[:2]}/{key[2:4]}/{key}'
+
+
+def _externalize(details):
+    """
+    Перенос крупных строк детализации в хранилище (копия blobs.externalize_details на момент миграции)
+    :param details: детализация маршрута
+    :return: детализация со ссылками
+    """
+    if not isinstance(details, dict):
+        return details
+
+    storage, externalized = storages[STORAGE_ALIAS], {}
+    for name, value in details.items():
+        if isinstance(value, str) and len(data := value.encode()) >= settings.ROUTE_BLOB_MIN_SIZE:
+            key = hashlib.sha256(data).hexdigest()
+            if not storage.exists(_get_blob_name(key)):
+                storage.save(_get_blob_name(key), ContentFile(data))
+            value = {BLOB_MARKER: key}
+
+        externalized[name] = value
+
+    return externalized
+
+
+def _inline(details):
+    """
+    Замена ссылок в детализации содержимым артефактов
+    :param details: детализация маршрута
+    :return: детализация
+    """
+    if not isinstance(details, dict):
+        return details
+
+    inlined = {}
+    for name, value in details.items():
+        if isinstance(value, dict) and len(value) == 1 and isinstance(value.get(BLOB_MARKER), str):
+            with storages[STORAGE_ALIAS].open(_get_blob_name(value[BLOB_MARKER]), 'rb') as blob:
+                value = blob.read().decode()
+
+        inlined[name] = value
+
+    return inlined
+
+
+def externalize_details(apps, schema_editor):
+    """ Перенос крупных артефактов построения в хранилище """
+    _update_details(apps, _externalize)
+
+
+def inline_details(apps, schema_editor):
+    """ Возврат артефактов построения из хранилища в детализацию маршрутов """
+    _update_details(apps, _inline)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_settings_builder', '0010_route_build_job_correlation_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(externalize_details, inline_details),
+    ]
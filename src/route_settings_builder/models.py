@@ -1,12 +1,13 @@
 import uuid
+from typing import Iterable, Tuple
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.exceptions import ValidationError
 
 from ckeditor import fields
 
-from route_settings_builder import validators, querysets
+from route_settings_builder import validators, querysets, registry, geo, versions
 
 
 def validate_value(value_type: str, value: str) -> str:
@@ -27,6 +28,38 @@ def validate_value(value_type: str, value: str) -> str:
     return value
 
 
+def cast_value(value_type: str, value: str):
+    """
+    Приведение значения критерия к его типу
+    :param value_type: тип значения
+    :param value: значение
+    :return: значение указанного типа
+    """
+    if value_type == 'numeric':
+        return float(value)
+    if value_type == 'boolean':
+        return value in ('1', 'true')
+
+    return value
+
+
+def validate_values(criteria_values: Iterable[Tuple[int, str]]) -> None:
+    """
+    Пакетная валидация значений критериев.
+    Типы значений критериев берутся из реестра критериев
+    :param criteria_values: значения вида [(id критерия, значение), ...]
+    :return: None
+    """
+    criteria_values = list(criteria_values)
+    value_types = registry.criteria.get_value_types(criterion_id for criterion_id, _ in criteria_values)
+
+    for criterion_id, value in criteria_values:
+        if criterion_id not in value_types:
+            raise ValidationError('Критерий не найден', code='invalid', params={'value': criterion_id})
+
+        validate_value(value_types[criterion_id], value)
+
+
 class UpdateDescriptionMixin(models.Model):
     """ Информация о времени редактировании и создании модели """
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
@@ -36,7 +69,28 @@ class UpdateDescriptionMixin(models.Model):
         abstract = True
 
 
-class Criterion(UpdateDescriptionMixin, models.Model):
+class VersionedResourceMixin(models.Model):
+    """ Смена версий ресурсов API при удалении объекта, от которого они зависят """
+
+    class Meta:
+        abstract = True
+
+    def delete(self, using=None, keep_parents=False):
+        """
+        Удаление объекта со сменой версий ресурсов в той же транзакции.
+        Связанные объекты, удаляемые каскадно, относятся к тем же ресурсам
+        :param using: алиас БД
+        :param keep_parents: сохранять родительские модели
+        :return: (количество удалённых объектов, количество по моделям)
+        """
+        with transaction.atomic(using=using, savepoint=False):
+            result = super().delete(using=using, keep_parents=keep_parents)
+            versions.touch_model(type(self))
+
+        return result
+
+
+class Criterion(VersionedResourceMixin, UpdateDescriptionMixin, models.Model):
     """ Критерий """
     name = models.CharField(max_length=255,
                             null=False,
@@ -62,6 +116,8 @@ class Criterion(UpdateDescriptionMixin, models.Model):
                                   ],
                                   verbose_name='Тип значения')
 
+    objects = querysets.VersionedQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Критерий'
         verbose_name_plural = 'критерии'
@@ -70,7 +126,91 @@ class Criterion(UpdateDescriptionMixin, models.Model):
         return f'{self.name}'
 
 
-class Place(UpdateDescriptionMixin, models.Model):
+class CriterionValueMixin(VersionedResourceMixin, models.Model):
+    """ Валидация и типизированное хранение значения критерия для связей с критериями """
+    numeric_value = models.FloatField(null=True,
+                                      blank=True,
+                                      editable=False,
+                                      verbose_name='Числовое значение')
+
+    bool_value = models.BooleanField(null=True,
+                                     blank=True,
+                                     editable=False,
+                                     verbose_name='Логическое значение')
+
+    typed_value_fields = ('numeric_value', 'bool_value',)
+
+    objects = querysets.CriterionValueQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def validate_objects(cls, objs: Iterable['CriterionValueMixin']) -> None:
+        """
+        Пакетная валидация значений критериев
+        :param objs: связи с критериями
+        :return: None
+        """
+        validate_values((obj.criterion_id, obj.value) for obj in objs)
+
+    @classmethod
+    def fill_typed_values(cls, objs: Iterable['CriterionValueMixin']) -> None:
+        """
+        Заполнение типизированных значений по типам критериев из реестра
+        :param objs: связи с критериями
+        :return: None
+        """
+        objs = list(objs)
+        value_types = registry.criteria.get_value_types(obj.criterion_id for obj in objs)
+
+        for obj in objs:
+            obj.set_typed_value(value_types.get(obj.criterion_id))
+
+    def set_typed_value(self, value_type: str) -> None:
+        """
+        Заполнение типизированного значения. Некорректное для типа значение не заполняется
+        :param value_type: тип значения критерия
+        :return: None
+        """
+        self.numeric_value = self.bool_value = None
+
+        try:
+            if value_type == 'numeric':
+                self.numeric_value = cast_value(value_type, validate_value(value_type, self.value))
+            elif value_type == 'boolean':
+                self.bool_value = cast_value(value_type, validate_value(value_type, self.value))
+        except ValidationError:
+            pass
+
+    def clean(self):
+        super().clean()
+        self.validate_objects([self])
+
+    def save(self, *args, **kwargs):
+        self.clean()
+        self.fill_typed_values([self])
+
+        if (update_fields := kwargs.get('update_fields')) is not None:
+            kwargs['update_fields'] = {*update_fields, *self.typed_value_fields}
+
+        super().save(*args, **kwargs)
+
+    def get_typed_value(self, value_type: str):
+        """
+        Получение значения критерия в его типе
+        :param value_type: тип значения критерия
+        :return: значение
+        """
+        if value_type == 'numeric':
+            return self.numeric_value
+        if value_type == 'boolean':
+            return self.bool_value
+
+        return self.value
+
+
+class Place(VersionedResourceMixin, UpdateDescriptionMixin, models.Model):
     """ Место """
     name = models.CharField(max_length=255,
                             null=False,
@@ -96,20 +236,47 @@ class Place(UpdateDescriptionMixin, models.Model):
                                     validators=[validators.validate_longitude],
                                     verbose_name='Долгота')
 
+    geohash = models.CharField(max_length=12,
+                               blank=True,
+                               default='',
+                               editable=False,
+                               db_index=True,
+                               verbose_name='Geohash')
+
     criteria = models.ManyToManyField(Criterion,
                                       through='PlaceCriterion',
                                       related_name='places',
                                       verbose_name='Критерии')
 
+    objects = querysets.PlaceQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Место'
         verbose_name_plural = 'места'
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='place_coordinates_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.name}'
 
+    def save(self, *args, **kwargs):
+        self.set_geohash()
+
+        if (update_fields := kwargs.get('update_fields')) is not None and 'geohash' not in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+
+        super().save(*args, **kwargs)
+
+    def set_geohash(self) -> None:
+        """
+        Вычисление geohash по координатам места
+        :return: None
+        """
+        self.geohash = geo.encode_geohash(float(self.latitude), float(self.longitude))
 
-class PlaceCriterion(models.Model):
+
+class PlaceCriterion(CriterionValueMixin, models.Model):
     """ Критерий для места """
     place = models.ForeignKey(Place,
                               on_delete=models.CASCADE,
@@ -124,16 +291,13 @@ class PlaceCriterion(models.Model):
                              blank=True,
                              verbose_name='Значение')
 
-    def clean(self):
-        super().clean()
-        validate_value(self.criterion.value_type, self.value)
-
-    def save(self, *args, **kwargs):
-        self.clean()
-        super().save(*args, **kwargs)
-
     class Meta:
         unique_together = ['place', 'criterion']
+        indexes = [
+            models.Index(fields=['criterion', 'value', 'place'], name='place_criterion_value_idx'),
+            models.Index(fields=['criterion', 'numeric_value', 'place'], name='place_criterion_numeric_idx'),
+            models.Index(fields=['criterion', 'bool_value', 'place'], name='place_criterion_bool_idx'),
+        ]
         verbose_name = 'Критерий для места'
         verbose_name_plural = 'критерии для места'
 
@@ -141,7 +305,7 @@ class PlaceCriterion(models.Model):
         return f'{self.criterion.internal_name}'
 
 
-class Route(UpdateDescriptionMixin, models.Model):
+class Route(VersionedResourceMixin, UpdateDescriptionMixin, models.Model):
     """ Маршрут """
     uuid = models.UUIDField(default=uuid.uuid4,
                             unique=True,
@@ -159,6 +323,24 @@ class Route(UpdateDescriptionMixin, models.Model):
                                blank=True,
                                verbose_name='Детализация маршрута')
 
+    build_fingerprint = models.CharField(max_length=64,
+                                         blank=True,
+                                         default='',
+                                         editable=False,
+                                         db_index=True,
+                                         verbose_name='Отпечаток данных построения')
+
+    build_claim_fingerprint = models.CharField(max_length=64,
+                                               blank=True,
+                                               default='',
+                                               editable=False,
+                                               verbose_name='Отпечаток данных выполняемого построения')
+
+    build_claimed_at = models.DateTimeField(null=True,
+                                            blank=True,
+                                            editable=False,
+                                            verbose_name='Время запроса выполняемого построения')
+
     places = models.ManyToManyField(Place,
                                     through='RoutePlace',
                                     related_name='routes',
@@ -189,12 +371,15 @@ class Route(UpdateDescriptionMixin, models.Model):
     class Meta:
         verbose_name = 'Маршрут'
         verbose_name_plural = 'маршруты'
+        indexes = [
+            models.Index(fields=['author', 'updated_at', 'id'], name='route_author_updated_at_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
 
-class RouteCriterion(models.Model):
+class RouteCriterion(CriterionValueMixin, models.Model):
     """ Критерий для маршрута """
     route = models.ForeignKey(Route,
                               on_delete=models.CASCADE,
@@ -209,16 +394,13 @@ class RouteCriterion(models.Model):
                              blank=True,
                              verbose_name='Значение')
 
-    def clean(self):
-        super().clean()
-        validate_value(self.criterion.value_type, self.value)
-
-    def save(self, *args, **kwargs):
-        self.clean()
-        super().save(*args, **kwargs)
-
     class Meta:
         unique_together = ['route', 'criterion']
+        indexes = [
+            models.Index(fields=['criterion', 'value', 'route'], name='route_criterion_value_idx'),
+            models.Index(fields=['criterion', 'numeric_value', 'route'], name='route_criterion_numeric_idx'),
+            models.Index(fields=['criterion', 'bool_value', 'route'], name='route_criterion_bool_idx'),
+        ]
         verbose_name = 'Критерий для маршрута'
         verbose_name_plural = 'критерии для маршрута'
 
@@ -226,7 +408,7 @@ class RouteCriterion(models.Model):
         return self.criterion.internal_name
 
 
-class RoutePlace(models.Model):
+class RoutePlace(VersionedResourceMixin, models.Model):
     """ Место маршрута """
     route = models.ForeignKey(Route,
                               on_delete=models.CASCADE,
@@ -236,7 +418,89 @@ class RoutePlace(models.Model):
                               on_delete=models.PROTECT,
                               verbose_name='Место')
 
+    objects = querysets.VersionedQuerySet.as_manager()
+
     class Meta:
         unique_together = ['route', 'place']
         verbose_name = 'Место маршрута'
         verbose_name_plural = 'места маршрута'
+
+
+class RouteBuildJob(models.Model):
+    """ Задание на построение маршрута """
+    STATUS_QUEUED = 'queued'
+    STATUS_PUBLISHED = 'published'
+    STATUS_DONE = 'done'
+    STATUS_SUPERSEDED = 'superseded'
+    STATUS_FAILED = 'failed'
+    STATUS_EXPIRED = 'expired'
+
+    IN_FLIGHT_STATUSES = (STATUS_QUEUED, STATUS_PUBLISHED)
+
+    route = models.ForeignKey(Route,
+                              on_delete=models.CASCADE,
+                              related_name='build_jobs',
+                              verbose_name='Маршрут')
+
+    author = models.ForeignKey(settings.AUTH_USER_MODEL,
+                               null=True,
+                               on_delete=models.SET_NULL,
+                               related_name='route_build_jobs',
+                               verbose_name='Автор')
+
+    fingerprint = models.CharField(max_length=64,
+                                   verbose_name='Отпечаток данных построения')
+
+    correlation_id = models.UUIDField(default=uuid.uuid4,
+                                      unique=True,
+                                      editable=False,
+                                      verbose_name='Идентификатор запроса')
+
+    status = models.CharField(max_length=15,
+                              choices=[
+                                  (STATUS_QUEUED, 'В очереди'),
+                                  (STATUS_PUBLISHED, 'Опубликовано'),
+                                  (STATUS_DONE, 'Построено'),
+                                  (STATUS_SUPERSEDED, 'Заменено более новым'),
+                                  (STATUS_FAILED, 'Ошибка'),
+                                  (STATUS_EXPIRED, 'Истекло'),
+                              ],
+                              default=STATUS_QUEUED,
+                              verbose_name='Статус')
+
+    requested_at = models.DateTimeField(auto_now_add=True, verbose_name='Время запроса')
+    published_at = models.DateTimeField(null=True, blank=True, verbose_name='Время публикации')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Время завершения')
+
+    objects = querysets.RouteBuildJobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Задание на построение маршрута'
+        verbose_name_plural = 'задания на построение маршрутов'
+        indexes = [
+            models.Index(fields=['status', 'requested_at'], name='route_build_job_status_idx'),
+            models.Index(fields=['author', 'status', 'requested_at'], name='route_build_job_author_idx'),
+            models.Index(fields=['route', 'requested_at'], name='route_build_job_route_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.route_id}: {self.status}'
+
+
+class ResourceVersion(models.Model):
+    """
+    Версия ресурса API. Меняется в транзакции изменения данных ресурса,
+    по ней все процессы вычисляют ETag, Last-Modified и ключи кэша ответов
+    """
+    resource = models.CharField(max_length=32,
+                                primary_key=True,
+                                verbose_name='Ресурс')
+
+    version = models.BigIntegerField(default=0, verbose_name='Версия')
+
+    class Meta:
+        verbose_name = 'Версия ресурса'
+        verbose_name_plural = 'версии ресурсов'
+
+    def __str__(self) -> str:
+        return f'{self.resource}: {self.version}'
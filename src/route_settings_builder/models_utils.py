@@ -1,56 +1,63 @@
-# TODO: оптимизация запросов
 import decimal
+import hashlib
+import json
 import uuid
-from typing import Tuple, List, Optional
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Set, Tuple, List, Optional
 
-from django.db import transaction
-from django.db.models import F, Case, When, ExpressionWrapper, FloatField, BooleanField
-from django.db.models.functions import Cast
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Case, ExpressionWrapper, FloatField, Value, When
+from django.utils import timezone
 
-from route_settings_builder import models
+from route_settings_builder import models, registry, versions
+
+# Ключ advisory-блокировки подсчёта выполняемых построений
+BUILD_CAPACITY_LOCK_ID = 7_304_915
 
 
 @transaction.atomic
 def create_or_update_route(route_data: dict, route_uuid: Optional[uuid.UUID] = None):
-    """ Создание или обновление маршрута """
+    """
+    Создание или обновление маршрута.
+    Количество запросов к БД не зависит от количества критериев и мест
+    :param route_data: данные маршрута
+    :param route_uuid: UUID маршрута (для обновления)
+    :return: маршрут
+    """
     route_data = dict(route_data)
 
+    author = route_data.pop('author')
     criteria_data = route_data.pop('criteria', None)
     places_ids = route_data.pop('places', None)
 
-    is_create_operation = False
-    existed_criteria_ids = set()
-    existed_places_ids = set()
-
     if not route_uuid:
-        is_create_operation = True
-        route = models.Route.objects.create(author=route_data.pop('author'), **route_data)
+        route = models.Route.objects.create(author=author, **route_data)
     else:
-        models.Route.objects.filter(author=route_data.pop('author'), uuid=route_uuid).update(**route_data)
-        route = models.Route.objects.select_for_update().get(uuid=route_uuid)
-        existed_criteria_ids = set(route.criteria.values_list('id', flat=True) if not is_create_operation else [])
-        existed_places_ids = set(route.places.values_list('id', flat=True) if not is_create_operation else [])
+        route = models.Route.objects.select_for_update().get(author=author, uuid=route_uuid)
+        for field_name, value in route_data.items():
+            setattr(route, field_name, value)
+        route.save(update_fields=[*route_data, 'updated_at'])
 
-    added_criteria_ids = []
     if criteria_data is not None:
-        for criterion_data in criteria_data:
-            models.RouteCriterion.objects.create(**criterion_data, route=route)
-            added_criteria_ids.append(criterion_data['criterion_id'])
+        # Значения критериев проверяются пакетно внутри bulk_create
+        models.RouteCriterion.objects.bulk_create(
+            [models.RouteCriterion(route=route, **criterion_data) for criterion_data in criteria_data],
+            update_conflicts=True, unique_fields=['route', 'criterion'], update_fields=['value'],
+        )
+
+        if route_uuid:
+            models.RouteCriterion.objects.filter(route=route).exclude(
+                criterion_id__in=[criterion_data['criterion_id'] for criterion_data in criteria_data]).delete()
 
     if places_ids is not None:
         models.RoutePlace.objects.bulk_create([models.RoutePlace(place_id=place_id, route=route)
-                                               for place_id in places_ids])
+                                               for place_id in places_ids],
+                                              ignore_conflicts=True)
 
-    if not is_create_operation:
-        if criteria_data is not None:
-            if remove_criteria_ids := existed_criteria_ids - set(added_criteria_ids):
-                models.RouteCriterion.objects.filter(criterion__id__in=remove_criteria_ids).delete()
+        if route_uuid:
+            models.RoutePlace.objects.filter(route=route).exclude(place_id__in=places_ids).delete()
 
-        if places_ids is not None:
-            if remove_places_ids := existed_places_ids - set(places_ids):
-                models.RoutePlace.objects.filter(place__id__in=remove_places_ids).delete()
-
-    route.refresh_from_db()
     setattr(route, 'is_draft', not bool(route.details))
 
     return route
@@ -68,16 +75,258 @@ def get_points_coordinates_from_route_places(route: models.Route) -> List[Tuple[
 
 def get_criteria_from_route(route: models.Route) -> dict:
     """
-    Получение перечня критериев значений
+    Получение перечня критериев значений.
+    Значения читаются из типизированных колонок, наименования и типы критериев берутся из реестра критериев
     :param route: маршрут
     :return: словарь вида {критерий: значение}
     """
-    return {line[0]: line[1 if line[1] is not None else 2 if line[2] is not None else 3]
-            for line in route.criteria
-            .annotate(numeric_value=Case(When(value_type='numeric',
-                                              then=Cast('routecriterion__value', FloatField())),
-                                         defalt=None),
-                      boolean_value=Case(When(value_type='boolean',
-                                              then=Cast('routecriterion__value', BooleanField())),
-                                         default=None))
-            .values_list('internal_name', 'numeric_value', 'boolean_value', 'routecriterion__value')}
+    criteria_values = {}
+
+    for criterion_id, *values in (models.RouteCriterion.objects.filter(route=route)
+                                  .values_list('criterion_id', 'value', 'numeric_value', 'bool_value')):
+        internal_name, value = _get_criterion_request_value(criterion_id, *values)
+        criteria_values[internal_name] = value
+
+    return criteria_values
+
+
+def get_build_requests(routes_ids: Iterable[int]) -> Dict[int, dict]:
+    """
+    Получение запросов на построение для набора маршрутов.
+    Координаты мест и значения критериев всех маршрутов читаются двумя запросами
+    :param routes_ids: перечень id маршрутов
+    :return: словарь вида {id маршрута: запрос}
+    """
+    routes_ids = list(routes_ids)
+    points_coordinates, criteria_values = defaultdict(list), defaultdict(dict)
+
+    for route_id, *coordinates in (models.RoutePlace.objects.filter(route_id__in=routes_ids).order_by('route_id', 'id')
+                                   .values_list('route_id',
+                                                ExpressionWrapper(F('place__latitude'), output_field=FloatField()),
+                                                ExpressionWrapper(F('place__longitude'), output_field=FloatField()))):
+        points_coordinates[route_id].append(tuple(coordinates))
+
+    for route_id, criterion_id, *values in (models.RouteCriterion.objects.filter(route_id__in=routes_ids)
+                                            .values_list('route_id', 'criterion_id', 'value',
+                                                         'numeric_value', 'bool_value')):
+        internal_name, value = _get_criterion_request_value(criterion_id, *values)
+        criteria_values[route_id][internal_name] = value
+
+    return {route_id: {'points_coordinates': points_coordinates[route_id], **criteria_values[route_id]}
+            for route_id in routes_ids}
+
+
+def get_build_fingerprint(build_request: dict) -> str:
+    """
+    Получение отпечатка запроса на построение.
+    Порядок координат сохраняется, порядок критериев не влияет на отпечаток
+    :param build_request: запрос на построение
+    :return: SHA-256 запроса
+    """
+    payload = json.dumps(build_request, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@transaction.atomic
+def claim_builds(fingerprints: Dict[uuid.UUID, str], author=None,
+                 limit_capacity: bool = False) -> Dict[uuid.UUID, Optional[str]]:
+    """
+    Захват построения маршрутов и создание заданий на построение.
+    Маршрут не захватывается, если построение с теми же данными уже выполняется.
+    Строки маршрутов блокируются, поэтому одновременные захваты из разных процессов не пересекаются.
+    Ограничения на количество выполняемых построений проверяются в той же транзакции и только для маршрутов,
+    для которых создаётся новое задание
+    :param fingerprints: словарь вида {UUID маршрута: отпечаток данных построения}
+    :param author: автор маршрутов для ограничения ROUTE_BUILD_MAX_IN_FLIGHT_PER_USER
+    :param limit_capacity: соблюдать ли ограничения на количество выполняемых построений
+    :return: словарь вида {UUID захваченного маршрута: correlation id запроса на построение},
+             маршрутам сверх ограничения соответствует None
+    """
+    routes = models.Route.objects.select_for_update().filter(uuid__in=fingerprints)
+    locked_routes = {route_uuid: (route_id, author_id)
+                     for route_uuid, route_id, author_id in routes.values_list('uuid', 'id', 'author_id')}
+    in_progress = set(routes.filter_build_claimed().values_list('uuid', 'build_claim_fingerprint'))
+
+    claimed = {route_uuid: fingerprint for route_uuid, fingerprint in fingerprints.items()
+               if route_uuid in locked_routes and (route_uuid, fingerprint) not in in_progress}
+
+    throttled = {}
+    if claimed and limit_capacity:
+        _lock_build_capacity()
+        capacity = get_build_capacity(author)
+        throttled = dict.fromkeys(list(claimed)[capacity:])
+        claimed = {route_uuid: fingerprint for route_uuid, fingerprint in claimed.items()
+                   if route_uuid not in throttled}
+
+    if claimed:
+        models.Route.objects.filter(uuid__in=claimed).update(
+            build_claim_fingerprint=Case(*[When(uuid=route_uuid, then=Value(fingerprint))
+                                           for route_uuid, fingerprint in claimed.items()]),
+            build_claimed_at=timezone.now(),
+        )
+
+        # Ответы на прежние запросы не будут применены
+        models.RouteBuildJob.objects.filter(
+            route_id__in=[locked_routes[route_uuid][0] for route_uuid in claimed],
+        ).finish(models.RouteBuildJob.STATUS_SUPERSEDED)
+
+        jobs = models.RouteBuildJob.objects.bulk_create([
+            models.RouteBuildJob(route_id=locked_routes[route_uuid][0], author_id=locked_routes[route_uuid][1],
+                                 fingerprint=fingerprint)
+            for route_uuid, fingerprint in claimed.items()
+        ])
+
+        return {**{route_uuid: str(job.correlation_id) for route_uuid, job in zip(claimed, jobs)}, **throttled}
+
+    return throttled
+
+
+def release_build_claims(fingerprints: Dict[uuid.UUID, str],
+                         status: str = models.RouteBuildJob.STATUS_FAILED) -> None:
+    """
+    Снятие захвата построения маршрутов, если захват не перехвачен более новым построением
+    :param fingerprints: словарь вида {UUID маршрута: отпечаток данных построения}
+    :param status: итоговый статус заданий на построение
+    :return: None
+    """
+    for route_uuid, fingerprint in fingerprints.items():
+        models.Route.objects.filter(uuid=route_uuid, build_claim_fingerprint=fingerprint).update(
+            build_claim_fingerprint='', build_claimed_at=None)
+        models.RouteBuildJob.objects.filter(route__uuid=route_uuid, fingerprint=fingerprint).finish(status)
+
+
+def mark_builds_published(routes_uuids: Iterable[uuid.UUID]) -> None:
+    """
+    Отметка о публикации запросов на построение маршрутов
+    :param routes_uuids: перечень UUID маршрутов
+    :return: None
+    """
+    models.RouteBuildJob.objects.filter(route__uuid__in=list(routes_uuids),
+                                        status=models.RouteBuildJob.STATUS_QUEUED).update(
+        status=models.RouteBuildJob.STATUS_PUBLISHED, published_at=timezone.now())
+
+
+@transaction.atomic
+def apply_build_replies(replies: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Пакетная запись ответов построителя в маршруты одним запросом.
+    Ответ применяется, только если задание не заменено более новым построением маршрута
+    :param replies: словарь вида {correlation id: ответ построителя}
+    :return: словарь вида {correlation id применённого ответа: отпечаток данных построения}
+    """
+    jobs = list(models.RouteBuildJob.objects.filter(correlation_id__in=_get_valid_uuids(replies),
+                                                    status__in=models.RouteBuildJob.IN_FLIGHT_STATUSES)
+                .values_list('id', 'route_id', 'fingerprint', 'correlation_id'))
+    if not jobs:
+        return {}
+
+    routes_replies = {route_id: (fingerprint, replies[str(correlation_id)])
+                      for _, route_id, fingerprint, correlation_id in jobs}
+
+    if connection.vendor == 'postgresql':
+        applied_routes_ids = _update_routes_details_from_values(routes_replies)
+    else:
+        claimed_routes = dict(models.Route.objects.select_for_update().filter(pk__in=routes_replies)
+                              .values_list('id', 'build_claim_fingerprint'))
+        applied_routes_ids = {route_id for route_id, (fingerprint, _) in routes_replies.items()
+                              if claimed_routes.get(route_id) == fingerprint}
+        models.Route.objects.bulk_update(
+            [models.Route(pk=route_id, details=routes_replies[route_id][1],
+                          build_fingerprint=routes_replies[route_id][0], build_claim_fingerprint='')
+             for route_id in applied_routes_ids],
+            ['details', 'build_fingerprint', 'build_claim_fingerprint', 'build_claimed_at'],
+        )
+
+    applied_jobs = [(job_id, fingerprint, str(correlation_id))
+                    for job_id, route_id, fingerprint, correlation_id in jobs if route_id in applied_routes_ids]
+    models.RouteBuildJob.objects.filter(pk__in=[job_id for job_id, _, _ in applied_jobs]).update(
+        status=models.RouteBuildJob.STATUS_DONE, finished_at=timezone.now())
+
+    if applied_jobs:
+        versions.touch(versions.ROUTES)
+
+    return {correlation_id: fingerprint for _, fingerprint, correlation_id in applied_jobs}
+
+
+def get_build_capacity(author=None) -> int:
+    """
+    Получение количества построений, которые можно запросить без превышения ограничений
+    ROUTE_BUILD_MAX_IN_FLIGHT и ROUTE_BUILD_MAX_IN_FLIGHT_PER_USER
+    :param author: автор маршрутов (None – только общее ограничение)
+    :return: количество построений
+    """
+    models.RouteBuildJob.objects.expire_stale()
+    jobs = models.RouteBuildJob.objects.in_flight()
+
+    capacity = settings.ROUTE_BUILD_MAX_IN_FLIGHT - jobs.count()
+    if author is not None:
+        capacity = min(capacity, settings.ROUTE_BUILD_MAX_IN_FLIGHT_PER_USER - jobs.filter(author=author).count())
+
+    return max(capacity, 0)
+
+
+def _lock_build_capacity() -> None:
+    """
+    Блокировка подсчёта выполняемых построений до конца транзакции (PostgreSQL):
+    одновременные захваты из разных процессов не превышают ограничений
+    :return: None
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [BUILD_CAPACITY_LOCK_ID])
+
+
+def _update_routes_details_from_values(routes_replies: Dict[int, Tuple[str, Any]]) -> Set[int]:
+    """
+    Запись ответов построителя через UPDATE ... FROM (VALUES ...) (PostgreSQL).
+    Условие на отпечаток захвата построения проверяется в том же запросе
+    :param routes_replies: словарь вида {id маршрута: (отпечаток данных построения, ответ построителя)}
+    :return: множество id обновлённых маршрутов
+    """
+    table_name = connection.ops.quote_name(models.Route._meta.db_table)  # pylint: disable=protected-access
+    values = ', '.join(['(%s, %s, %s::jsonb)'] * len(routes_replies))
+    params = [param for route_id, (fingerprint, details) in routes_replies.items()
+              for param in (route_id, fingerprint, json.dumps(details))]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table_name} AS route '
+            'SET details = reply.details, build_fingerprint = reply.fingerprint, '
+            "build_claim_fingerprint = '', build_claimed_at = NULL "
+            f'FROM (VALUES {values}) AS reply (id, fingerprint, details) '
+            'WHERE route.id = reply.id AND route.build_claim_fingerprint = reply.fingerprint '
+            'RETURNING route.id',
+            params,
+        )
+        return {route_id for route_id, in cursor.fetchall()}
+
+
+def _get_valid_uuids(values: Iterable[str]) -> List[uuid.UUID]:
+    """
+    Отбор корректных UUID. Некорректные correlation id от брокера пропускаются
+    :param values: строки
+    :return: перечень UUID
+    """
+    valid_uuids = []
+
+    for value in values:
+        try:
+            valid_uuids.append(uuid.UUID(value))
+        except (TypeError, ValueError):
+            continue
+
+    return valid_uuids
+
+
+def _get_criterion_request_value(criterion_id: int, value: str, numeric_value: Optional[float],
+                                 bool_value: Optional[bool]) -> Tuple[str, Any]:
+    """
+    Получение значения критерия для запроса на построение из типизированных колонок
+    :param criterion_id: id критерия
+    :param value: строковое значение
+    :param numeric_value: числовое значение
+    :param bool_value: логическое значение
+    :return: (внутреннее наименование критерия, значение)
+    """
+    criterion = registry.criteria.get(criterion_id)
+    return criterion.internal_name, {'numeric': numeric_value, 'boolean': bool_value}.get(criterion.value_type, value)
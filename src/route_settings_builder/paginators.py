@@ -0,0 +1,125 @@
+import base64
+import binascii
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+
+from ninja import Field, Schema, errors
+from ninja.conf import settings
+from ninja.pagination import PaginationBase
+
+from route_settings_builder import serializers
+
+
+class CursorPagination(PaginationBase):  # pylint: disable=too-few-public-methods
+    """
+    Keyset-пагинация по набору полей сортировки.
+    Следующая страница выбирается условием на значения полей последнего элемента вместо OFFSET,
+    поэтому стоимость запроса не зависит от номера страницы
+    """
+
+    class Input(Schema):
+        """ Параметры запроса страницы """
+        limit: int = Field(settings.PAGINATION_PER_PAGE, ge=1)
+        cursor: Optional[str] = None
+        with_count: bool = True
+
+    class Output(Schema):
+        """ Страница перечня """
+        items: List[Any]
+        count: Optional[int] = None
+        next_cursor: Optional[str] = None
+
+    def __init__(self, ordering: Tuple[str, ...] = ('id',), **kwargs: Any) -> None:
+        """
+        :param ordering: поля сортировки, последнее поле должно быть уникальным
+        :param kwargs:
+        """
+        self.ordering = ordering
+        super().__init__(**kwargs)
+
+    def paginate_queryset(self, queryset: QuerySet, pagination: Input, **params: Any) -> Any:
+        """
+        Получение страницы
+        :param queryset: QuerySet
+        :param pagination: параметры пагинации
+        :param params:
+        :return: страница
+        """
+        limit = min(pagination.limit, settings.PAGINATION_MAX_LIMIT)
+        page_queryset = queryset.order_by(*self.ordering)
+
+        if pagination.cursor:
+            page_queryset = page_queryset.filter(self._get_keyset_query(queryset.model, pagination.cursor))
+
+        if (serializer := serializers.get_fast_serializer(params.get('request'))) is not None:
+            # Значения полей сортировки читаются вместе со строкой и следуют за полями схемы
+            field_names = [field_name for field_name, _ in self._get_field_names()]
+            rows = serializer.get_rows(page_queryset[:limit + 1], *field_names)
+            next_cursor = (self._encode_cursor_values(rows[limit - 1][-len(field_names):])
+                           if len(rows) > limit else None)
+            items = serializer.to_items(rows[:limit])
+        else:
+            items = list(page_queryset[:limit + 1])
+            next_cursor = self._encode_cursor(items[limit - 1]) if len(items) > limit else None
+            items = items[:limit]
+
+        return {
+            'items': items,
+            'count': self._items_count(queryset) if pagination.with_count else None,
+            'next_cursor': next_cursor,
+        }
+
+    def _get_field_names(self) -> List[Tuple[str, bool]]:
+        """
+        Получение полей сортировки
+        :return: список вида [(наименование поля, по убыванию), ...]
+        """
+        return [(field_name.lstrip('-'), field_name.startswith('-')) for field_name in self.ordering]
+
+    def _encode_cursor(self, item) -> str:
+        """
+        Кодирование курсора по значениям полей сортировки элемента
+        :param item: последний элемент страницы
+        :return: непрозрачный курсор
+        """
+        return self._encode_cursor_values([getattr(item, field_name) for field_name, _ in self._get_field_names()])
+
+    @staticmethod
+    def _encode_cursor_values(values: Sequence[Any]) -> str:
+        """
+        Кодирование курсора по значениям полей сортировки
+        :param values: значения полей сортировки
+        :return: непрозрачный курсор
+        """
+        # str сохраняет микросекунды даты, в отличие от DjangoJSONEncoder
+        return base64.urlsafe_b64encode(json.dumps(list(values), default=str).encode()).decode()
+
+    def _get_keyset_query(self, model, cursor: str) -> Q:
+        """
+        Условие выборки элементов, следующих за курсором:
+        (a > x) OR (a = x AND b > y) OR ...
+        :param model: модель
+        :param cursor: курсор
+        :return: query
+        """
+        field_names = self._get_field_names()
+
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            values = [model._meta.get_field(field_name).to_python(value)
+                      for (field_name, _), value in zip(field_names, values, strict=True)]
+        except (binascii.Error, ValueError, TypeError, ValidationError) as ex:
+            raise errors.HttpError(400, 'Некорректный курсор') from ex
+
+        query = Q()
+        equal_query = Q()
+
+        for (field_name, descending), value in zip(field_names, values):
+            lookup = 'lt' if descending else 'gt'
+            query |= equal_query & Q(**{f'{field_name}__{lookup}': value})
+            equal_query &= Q(**{field_name: value})
+
+        return query
@@ -1,8 +1,170 @@
-from django.db import models
+import datetime
+from typing import List, Tuple
 
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
 
-class RouteQuerySet(models.QuerySet):
+from route_settings_builder import geo, versions
+
+CRITERION_FIELDS = ('criterion__id', 'criterion__internal_name', 'criterion__name', 'criterion__value_type',)
+
+
+class VersionedQuerySet(models.QuerySet):
+    """ QuerySet к моделям, от которых зависят версии ресурсов API """
+    def delete(self):
+        """
+        Удаление объектов со сменой версий ресурсов один раз на операцию.
+        Сигналы post_delete для этих моделей не регистрируются, чтобы не отключать быстрое удаление
+        :return: (количество удалённых объектов, количество по моделям)
+        """
+        with transaction.atomic(using=self.db, savepoint=False):
+            deleted_count, deleted_counts = super().delete()
+            if deleted_count:
+                versions.touch_model(self.model)
+
+        return deleted_count, deleted_counts
+
+
+class PlaceQuerySet(VersionedQuerySet):
+    """ QuerySet к модели Place """
+    list_fields = ('id', 'name', 'longitude', 'latitude',)
+    detail_fields = (*list_fields, 'description',)
+
+    def for_detail(self):
+        """
+        План запроса для детализации места: критерии загружаются одним запросом вместе со связями
+        :return: QuerySet
+        """
+        return self.only(*self.detail_fields).prefetch_related(
+            _get_criteria_prefetch(self.model, 'placecriterion_set', 'place_id'))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Массовое создание мест с вычислением geohash
+        :param objs: места
+        :return: созданные объекты
+        """
+        objs = list(objs)
+        for obj in objs:
+            obj.set_geohash()
+
+        versions.touch_model(self.model)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def nearby(self, latitude: float, longitude: float, radius_m: float, limit: int) -> List:
+        """
+        Места в пределах радиуса, отсортированные по расстоянию.
+        Кандидаты отбираются по ячейкам geohash, покрывающим окружность, расстояние и сортировка вычисляются в БД
+        :param latitude: широта центра
+        :param longitude: долгота центра
+        :param radius_m: радиус в метрах
+        :param limit: максимальное количество мест
+        :return: места с расстоянием distance_m
+        """
+        if precision := geo.get_covering_geohash_precision(latitude, radius_m):
+            cells_query = self._get_cells_query(latitude, longitude, precision)
+        else:
+            cells_query = geo.get_bounding_box_query(latitude, longitude, radius_m)
+
+        return list(self._rank_by_distance(self.filter(cells_query), latitude, longitude)
+                    .filter(distance_m__lte=radius_m)[:limit])
+
+    def nearest(self, latitude: float, longitude: float, count: int) -> List:
+        """
+        Ближайшие места, отсортированные по расстоянию.
+        Ячейки geohash укрупняются, пока в них не окажется достаточно кандидатов (в БД запрашивается только
+        расстояние до count-го из них), затем выполняется точный поиск в радиусе до этого кандидата
+        :param latitude: широта центра
+        :param longitude: долгота центра
+        :param count: количество мест
+        :return: места с расстоянием distance_m
+        """
+        for precision in range(geo.GEOHASH_PRECISION, 0, -1):
+            candidates = self._rank_by_distance(self.filter(self._get_cells_query(latitude, longitude, precision)),
+                                                latitude, longitude)
+
+            if farthest_distance := list(candidates.values_list('distance_m', flat=True)[count - 1:count]):
+                # Кандидаты из соседних ячеек не гарантируют ближайших: проверяем весь круг
+                return self.nearby(latitude, longitude, farthest_distance[0], count)
+
+        return list(self._rank_by_distance(self.all(), latitude, longitude)[:count])
+
+    @staticmethod
+    def _get_cells_query(latitude: float, longitude: float, precision: int) -> models.Q:
+        """
+        Условие попадания в ячейку geohash точки или в соседние с ней ячейки
+        :param latitude: широта точки
+        :param longitude: долгота точки
+        :param precision: количество символов
+        :return: query
+        """
+        cells_query = models.Q()
+        for cell in geo.get_geohash_cells(latitude, longitude, precision):
+            cells_query |= models.Q(geohash__startswith=cell)
+
+        return cells_query
+
+    @staticmethod
+    def _rank_by_distance(queryset, latitude: float, longitude: float):
+        """
+        Сортировка мест по расстоянию до точки в БД
+        :param queryset: QuerySet
+        :param latitude: широта точки
+        :param longitude: долгота точки
+        :return: QuerySet мест с расстоянием distance_m
+        """
+        return (queryset.only(*PlaceQuerySet.list_fields)
+                .annotate(distance_m=geo.get_distance_expression(latitude, longitude))
+                .order_by('distance_m', 'id'))
+
+
+class RouteQuerySet(VersionedQuerySet):
     """ QuerySet к модели Route """
+    def for_detail(self):
+        """
+        План запроса для детализации маршрута (DetailedRouteSchema)
+        :return: QuerySet
+        """
+        return self.select_related('author').prefetch_related(*self.get_detail_prefetches())
+
+    def get_detail_prefetches(self) -> Tuple[models.Prefetch, ...]:
+        """
+        Предзагрузка связей для детализации маршрута.
+        Используется также для уже загруженных маршрутов через prefetch_related_objects
+        :return: перечень предзагрузок
+        """
+        place_model = self.model.places.field.related_model
+
+        return (
+            models.Prefetch('places', queryset=place_model.objects.only(*PlaceQuerySet.list_fields)),
+            _get_criteria_prefetch(self.model, 'routecriterion_set', 'route_id'),
+        )
+
+    def for_guide(self):
+        """
+        План запроса для гида маршрута: поля для отрисовки и данные для версии гида
+        (время изменения мест, состав мест, время последнего построения)
+        :return: QuerySet
+        """
+        build_job_model = self.model.build_jobs.field.model
+
+        return self.only('id', 'uuid', 'name', 'guide_description', 'details', 'updated_at').annotate(
+            places_updated_at=models.Max('routeplace__place__updated_at'),
+            places_count=models.Count('routeplace'),
+            last_route_place_id=models.Max('routeplace__id'),
+            built_at=models.Subquery(build_job_model.objects.filter(route_id=models.OuterRef('pk'))
+                                     .exclude(finished_at__isnull=True)
+                                     .order_by('-finished_at').values('finished_at')[:1]),
+        )
+
+    def filter_build_claimed(self):
+        """
+        Маршруты с действующим захватом построения: запрос опубликован, ответ ещё не получен
+        :return: QuerySet
+        """
+        return self.exclude(build_claim_fingerprint='').filter(build_claimed_at__gt=_get_build_expires_after())
+
     def add_is_draft_field(self):
         """
         Добавление поля is_draft в запрос
@@ -10,3 +172,68 @@ class RouteQuerySet(models.QuerySet):
         """
         return self.annotate(is_draft=models.Case(models.When(details__isnull=True, then=True),
                                                   default=False))
+
+
+class CriterionValueQuerySet(VersionedQuerySet):
+    """ QuerySet к связям с критериями """
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Массовое создание связей с предварительной пакетной валидацией и заполнением типизированных значений
+        :param objs: связи с критериями
+        :return: созданные объекты
+        """
+        objs = list(objs)
+        self.model.validate_objects(objs)
+        self.model.fill_typed_values(objs)
+
+        if update_fields := kwargs.get('update_fields'):
+            kwargs['update_fields'] = [*update_fields, *self.model.typed_value_fields]
+
+        versions.touch_model(self.model)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class RouteBuildJobQuerySet(models.QuerySet):
+    """ QuerySet к модели RouteBuildJob """
+    def in_flight(self):
+        """
+        Выполняемые задания: запрос на построение опубликован или публикуется, ответ ещё не получен
+        :return: QuerySet
+        """
+        return self.filter(status__in=self.model.IN_FLIGHT_STATUSES, requested_at__gt=_get_build_expires_after())
+
+    def expire_stale(self) -> int:
+        """
+        Завершение заданий, ответ на которые не получен за ROUTE_BUILD_CLAIM_TTL секунд
+        :return: количество завершённых заданий
+        """
+        return (self.filter(status__in=self.model.IN_FLIGHT_STATUSES, requested_at__lte=_get_build_expires_after())
+                .update(status=self.model.STATUS_EXPIRED, finished_at=timezone.now()))
+
+    def finish(self, status: str) -> int:
+        """
+        Завершение выполняемых заданий
+        :param status: итоговый статус
+        :return: количество завершённых заданий
+        """
+        return self.filter(status__in=self.model.IN_FLIGHT_STATUSES).update(status=status, finished_at=timezone.now())
+
+
+def _get_build_expires_after() -> datetime.datetime:
+    """
+    Время, раньше которого запросы на построение считаются истёкшими
+    :return: время
+    """
+    return timezone.now() - datetime.timedelta(seconds=settings.ROUTE_BUILD_CLAIM_TTL)
+
+
+def _get_criteria_prefetch(model, lookup: str, owner_field_name: str) -> models.Prefetch:
+    """
+    Предзагрузка связей с критериями вместе с самими критериями
+    :param model: модель, связанная с критериями
+    :param lookup: наименование обратной связи с промежуточной моделью
+    :param owner_field_name: наименование поля промежуточной модели, ссылающегося на модель
+    :return: предзагрузка
+    """
+    return models.Prefetch(lookup, queryset=model.criteria.through.objects.select_related('criterion')
+                           .only(owner_field_name, 'value', *CRITERION_FIELDS))
@@ -0,0 +1,151 @@
+import threading
+import time
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Count, Max
+
+from route_settings_builder import caches
+
+# Поля критерия, по которым построены индексы реестра
+INDEX_FIELDS = ('id', 'internal_name')
+
+
+class RegistryState(NamedTuple):
+    """ Состояние реестра критериев """
+    indexes: tuple
+    version: tuple
+
+
+class CriteriaRegistry:
+    """
+    Реестр критериев в памяти процесса.
+    Загружается при первом обращении и сбрасывается при изменении критериев.
+    Версия реестра – количество критериев и время последнего изменения в БД, по ней каждый процесс
+    обнаруживает изменения, сделанные другими процессами
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._state: Optional[RegistryState] = None
+        self._checked_at = 0.0
+        # Отсутствующие в БД ключи: повторный поиск не выполняет запросов до смены версии
+        self._missing = caches.TTLCache(maxsize=settings.CRITERIA_REGISTRY_MISSING_MAXSIZE)
+
+    def get(self, criterion_id: int):
+        """
+        Получение критерия по id
+        :param criterion_id: id критерия
+        :return: критерий или None
+        """
+        return self._find(0, criterion_id)
+
+    def get_by_internal_name(self, internal_name: str):
+        """
+        Получение критерия по внутреннему наименованию
+        :param internal_name: внутреннее наименование критерия
+        :return: критерий или None
+        """
+        return self._find(1, internal_name)
+
+    def get_value_types(self, criteria_ids: Iterable[int]) -> Dict[int, str]:
+        """
+        Получение типов значений критериев
+        :param criteria_ids: перечень id критериев
+        :return: словарь вида {id критерия: тип значения}
+        """
+        criteria_ids = set(criteria_ids)
+        by_id, _ = self._get_state().indexes
+
+        if unknown_ids := {criterion_id for criterion_id in criteria_ids - by_id.keys()
+                           if self._missing.get((0, criterion_id)) is None}:
+            if self._get_criterion_model().objects.filter(id__in=unknown_ids).exists():
+                by_id, _ = self._load().indexes
+            for criterion_id in unknown_ids - by_id.keys():
+                self._missing.set((0, criterion_id), True)
+
+        return {criterion_id: by_id[criterion_id].value_type for criterion_id in criteria_ids if criterion_id in by_id}
+
+    @property
+    def version(self) -> tuple:
+        """ Версия загруженного реестра """
+        return self._get_state().version
+
+    def clear(self) -> None:
+        """
+        Сброс реестра в текущем процессе
+        :return: None
+        """
+        with self._lock:
+            self._state = None
+            self._missing.clear()
+
+    def _find(self, index: int, key):
+        """
+        Поиск критерия в индексе.
+        При промахе наличие критерия проверяется запросом одной строки: реестр перезагружается, только если критерий
+        появился в БД, иначе ключ запоминается как отсутствующий
+        :param index: номер индекса в состоянии реестра
+        :param key: ключ
+        :return: критерий или None
+        """
+        if (criterion := self._get_state().indexes[index].get(key)) is not None:
+            return criterion
+
+        if self._missing.get((index, key)) is not None:
+            return None
+
+        if self._get_criterion_model().objects.filter(**{INDEX_FIELDS[index]: key}).exists():
+            return self._load().indexes[index].get(key)
+
+        self._missing.set((index, key), True)
+        return None
+
+    def _get_state(self) -> RegistryState:
+        """
+        Получение актуального состояния реестра.
+        Версия сверяется с БД не чаще CRITERIA_REGISTRY_CHECK_INTERVAL секунд
+        :return: состояние реестра
+        """
+        if (state := self._state) is None:
+            return self._load()
+
+        now = time.monotonic()
+        if now - self._checked_at >= settings.CRITERIA_REGISTRY_CHECK_INTERVAL:
+            self._checked_at = now
+            stats = self._get_criterion_model().objects.aggregate(count=Count('id'), updated_at=Max('updated_at'))
+            if (stats['count'], stats['updated_at']) != state.version:
+                return self._load()
+
+        return state
+
+    def _load(self) -> RegistryState:
+        """
+        Загрузка реестра из БД. Версия вычисляется по загруженным критериям
+        :return: состояние реестра
+        """
+        loaded_criteria = list(self._get_criterion_model().objects.all())
+        state = RegistryState(
+            indexes=({criterion.id: criterion for criterion in loaded_criteria},
+                     {criterion.internal_name: criterion for criterion in loaded_criteria}),
+            version=(len(loaded_criteria), max((criterion.updated_at for criterion in loaded_criteria), default=None)),
+        )
+
+        with self._lock:
+            self._state = state
+            self._checked_at = time.monotonic()
+            self._missing.clear()
+
+        return state
+
+    @staticmethod
+    def _get_criterion_model():
+        """
+        Получение модели критерия. Реестр используется моделями, поэтому модель не импортируется
+        :return: модель
+        """
+        return apps.get_model('route_settings_builder', 'Criterion')
+
+
+criteria = CriteriaRegistry()
@@ -0,0 +1,77 @@
+import functools
+import hashlib
+import inspect
+import json
+from typing import Any, Callable
+
+from django.core.cache import caches
+from django.http import HttpRequest, HttpResponse
+from ninja.renderers import JSONRenderer
+
+from route_settings_builder import versions
+
+CACHE_ALIAS = 'responses'
+CACHE_KEY_ATTR = 'response_cache_key'
+
+
+class CachingJSONRenderer(JSONRenderer):  # pylint: disable=too-few-public-methods
+    """ JSON renderer, сохраняющий закодированные ответы операций с responses.cached в кэше ответов """
+
+    def render(self, request: HttpRequest, data: Any, *, response_status: int) -> Any:
+        content = super().render(request, data, response_status=response_status)
+
+        if response_status == 200 and (cache_key := getattr(request, CACHE_KEY_ATTR, None)):
+            caches[CACHE_ALIAS].set(cache_key, content.encode(self.charset))
+
+        return content
+
+
+def cached(*resources: str) -> Callable:
+    """
+    Декоратор операции API для общего кэша ответов.
+    Ответ не зависит от пользователя, ключ – путь, нормализованные параметры запроса и версии ресурсов из БД,
+    поэтому изменение ресурса в любом процессе делает прежние ответы недоступными во всех процессах
+    без явного сброса кэша.
+    При попадании в кэш запрос к БД и сериализация не выполняются
+    :param resources: ресурсы, от которых зависит ответ
+    :return: декоратор
+    """
+    def decorator(view_func: Callable) -> Callable:
+        has_response_param = 'response' in inspect.signature(view_func).parameters
+
+        @functools.wraps(view_func)
+        def wrapper(request: HttpRequest, *args, response: HttpResponse, **kwargs):
+            cache_key = get_cache_key(request, versions.get_request_versions(request, *resources))
+
+            if (content := caches[CACHE_ALIAS].get(cache_key)) is not None:
+                response.content = content
+                return response
+
+            setattr(request, CACHE_KEY_ATTR, cache_key)
+
+            if has_response_param:
+                kwargs['response'] = response
+            result = view_func(request, *args, **kwargs)
+
+            # Ответ, закодированный операцией без ninja (serializers.fast_list), сохраняется здесь
+            if isinstance(result, HttpResponse) and result.status_code == 200:
+                caches[CACHE_ALIAS].set(cache_key, result.content)
+
+            return result
+
+        return versions.add_response_param(wrapper, view_func)
+
+    return decorator
+
+
+def get_cache_key(request: HttpRequest, resources_versions: dict) -> str:
+    """
+    Получение ключа кэша ответа. Порядок параметров запроса и их значений не учитывается
+    :param request: запрос
+    :param resources_versions: версии ресурсов
+    :return: ключ
+    """
+    params = sorted((name, sorted(values)) for name, values in request.GET.lists())
+    state = [request.path, params, sorted(resources_versions.items())]
+
+    return f'route_settings_builder:response:{hashlib.sha256(json.dumps(state).encode()).hexdigest()}'
@@ -1,9 +1,13 @@
 # pylint: disable=too-few-public-methods,missing-class-docstring
+import uuid
 from typing import List, Optional
 
+from django.conf import settings
+from django.urls import reverse
+
 from ninja import Schema, ModelSchema, Field
 
-from route_settings_builder import models
+from route_settings_builder import blobs, models
 
 
 class LoginSchema(Schema):
@@ -28,6 +32,11 @@ class PlaceSchema(ModelSchema):
         model_fields = ('id', 'name', 'longitude', 'latitude',)
 
 
+class NearbyPlaceSchema(PlaceSchema):
+    """ Схема места с расстоянием до точки поиска """
+    distance_m: float
+
+
 class CriterionSchema(ModelSchema):
     """ Схема к сущности критерия """
 
@@ -71,6 +80,20 @@ class DetailedRouteSchema(ListRouteSchema):
         model = models.Route
         model_fields = ('uuid', 'updated_at', 'name', 'details', 'places', 'guide_description',)
 
+    @staticmethod
+    def resolve_details(obj) -> Optional[dict]:
+        """
+        Детализация, в которой артефакты из хранилища заменены ссылками на операцию их получения.
+        Содержимое подставляется, только если маршрут запрошен с inline_details
+        :param obj: маршрут
+        :return: детализация
+        """
+        return blobs.present_details(
+            obj.details,
+            lambda name: reverse('api:get_route_detail', kwargs={'route_uuid': obj.uuid, 'name': name}),
+            inline=getattr(obj, 'inline_details', False),
+        )
+
 
 class NestedSaveRouteCriterionSchema(Schema):
     """ Схема для создания связи критерий – маршрут """
@@ -95,3 +118,22 @@ class CreateRouteSchema(UpdateRouteSchema):
     """ Схема создания маршрута """
     name: str
     places: Optional[List[int]] = []
+
+
+class BuildRoutesSchema(Schema):
+    """ Схема пакетного запроса на строительство маршрутов """
+    routes: List[uuid.UUID] = Field(..., min_length=1, max_length=settings.RMQ_BUILD_BATCH_SIZE)
+
+
+class RouteBuildStatusSchema(Schema):
+    """ Схема статуса запроса на строительство маршрута """
+    uuid: uuid.UUID
+    status: str
+
+
+class RouteBuildJobSchema(ModelSchema):
+    """ Схема статуса построения маршрута """
+
+    class Config:
+        model = models.RouteBuildJob
+        model_fields = ('status', 'requested_at', 'published_at', 'finished_at',)
@@ -1,12 +1,26 @@
-from typing import Optional, Any
+import asyncio
+import functools
+import hashlib
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Any, Tuple
 
-from asgiref import sync
+from asgiref.sync import sync_to_async
 
+from django.conf import settings
 from django.http import HttpRequest
 from django.contrib import auth
+from django.contrib.auth import hashers
+from django.contrib.auth.backends import ModelBackend
 
 from ninja.security import HttpBasicAuth
 
+from route_settings_builder import caches
+
+MODEL_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+
+verified_credentials = caches.TTLCache(maxsize=settings.BASIC_AUTH_CACHE_MAXSIZE, ttl=settings.BASIC_AUTH_CACHE_TTL)
+
 
 class HttpBasicDjangoAuth(HttpBasicAuth):
     """ Basic Auth w/ username and password """
@@ -14,19 +28,156 @@ class HttpBasicDjangoAuth(HttpBasicAuth):
     def authenticate(
         self, request: HttpRequest, username: str, password: str
     ) -> Optional[Any]:
+        credentials_key = _get_credentials_key(username, password)
+
+        if user := _get_user_by_verified_credentials(credentials_key):
+            return user
+
         user = auth.authenticate(request, username=username, password=password)
 
         if user and user.is_active:
+            verified_credentials.set(credentials_key, (user.pk, user.password))
             return user
 
         return None
 
 
 class AsyncHttpBasicDjangoAuth(HttpBasicDjangoAuth):
-    """ Basic Auth w/ username and password (для асинхронных запросов) """
+    """
+    Basic Auth w/ username and password (для асинхронных запросов).
+    При стандартном ModelBackend запросы к БД выполняются асинхронно, а в отдельный пул потоков выносится
+    только хеширование пароля. Остальные AUTHENTICATION_BACKENDS вызываются через auth.authenticate в sync_to_async
+    """
 
-    @sync.sync_to_async
-    def authenticate(
+    async def authenticate(  # pylint: disable=invalid-overridden-method
         self, request: HttpRequest, username: str, password: str
     ) -> Optional[Any]:
-        return super().authenticate(request, username, password)
+        credentials_key = _get_credentials_key(username, password)
+
+        if user := await _aget_user_by_verified_credentials(credentials_key):
+            return user
+
+        if list(settings.AUTHENTICATION_BACKENDS) == [MODEL_BACKEND]:
+            user = await _aauthenticate_with_model_backend(username, password)
+        else:
+            user = await sync_to_async(auth.authenticate)(request, username=username, password=password)
+
+        if user and user.is_active:
+            verified_credentials.set(credentials_key, (user.pk, user.password))
+            return user
+
+        return None
+
+
+def forget_user_credentials(user_id: int) -> None:
+    """
+    Удаление проверенных учётных данных пользователя из кэша
+    :param user_id: id пользователя
+    :return: None
+    """
+    verified_credentials.pop_matching(lambda _, value: value[0] == user_id)
+
+
+def _get_credentials_key(username: str, password: str) -> Tuple[str, str]:
+    """
+    Получение ключа кэша для учётных данных. Пароль в открытом виде в кэше не хранится
+    :param username: имя пользователя
+    :param password: пароль
+    :return: (имя пользователя, HMAC пароля)
+    """
+    digest = hmac.new(settings.SECRET_KEY.encode(), password.encode(), hashlib.sha256).hexdigest()
+    return username, digest
+
+
+def _get_user_by_verified_credentials(credentials_key: Tuple[str, str]) -> Optional[Any]:
+    """
+    Получение пользователя по ранее проверенным учётным данным без повторного хеширования пароля
+    :param credentials_key: ключ кэша учётных данных
+    :return: пользователь или None
+    """
+    if (cached := verified_credentials.get(credentials_key)) is None:
+        return None
+
+    username, _ = credentials_key
+    user_id, password_hash = cached
+    user = auth.get_user_model().objects.filter(pk=user_id, is_active=True).first()
+
+    # Смена пароля или имени пользователя делает запись недействительной
+    if user is None or user.password != password_hash or user.get_username() != username:
+        verified_credentials.pop(credentials_key)
+        return None
+
+    return user
+
+
+async def _aget_user_by_verified_credentials(credentials_key: Tuple[str, str]) -> Optional[Any]:
+    """
+    Асинхронное получение пользователя по ранее проверенным учётным данным
+    :param credentials_key: ключ кэша учётных данных
+    :return: пользователь или None
+    """
+    if (cached := verified_credentials.get(credentials_key)) is None:
+        return None
+
+    username, _ = credentials_key
+    user_id, password_hash = cached
+    user = await auth.get_user_model().objects.filter(pk=user_id, is_active=True).afirst()
+
+    if user is None or user.password != password_hash or user.get_username() != username:
+        verified_credentials.pop(credentials_key)
+        return None
+
+    return user
+
+
+async def _aauthenticate_with_model_backend(username: str, password: str) -> Optional[Any]:
+    """
+    Асинхронная проверка учётных данных так же, как в ModelBackend.authenticate:
+    с проверкой user_can_authenticate и обновлением хеша пароля при смене алгоритма или числа итераций
+    :param username: имя пользователя
+    :param password: пароль
+    :return: пользователь или None
+    """
+    user_model = auth.get_user_model()
+    user = await user_model._default_manager.filter(  # pylint: disable=protected-access
+        **{user_model.USERNAME_FIELD: username}
+    ).afirst()
+
+    if user is None:
+        # Хеширование для выравнивания времени ответа, как в ModelBackend
+        await _run_hasher(hashers.make_password, password)
+        return None
+
+    must_update = []
+    if not await _run_hasher(hashers.check_password, password, user.password, must_update.append):
+        return None
+
+    if must_update:
+        # То же, что setter в AbstractBaseUser.check_password, без блокирующего сохранения
+        user.password = await _run_hasher(hashers.make_password, password)
+        await user.asave(update_fields=['password'])
+
+    if not ModelBackend().user_can_authenticate(user):
+        return None
+
+    user.backend = MODEL_BACKEND
+    return user
+
+
+@functools.lru_cache(maxsize=None)
+def _get_hasher_executor() -> ThreadPoolExecutor:
+    """
+    Получение пула потоков для проверки паролей. Создаётся при первом обращении
+    :return: пул потоков
+    """
+    return ThreadPoolExecutor(max_workers=settings.BASIC_AUTH_HASHER_WORKERS, thread_name_prefix='basic-auth-hasher')
+
+
+async def _run_hasher(func, *args) -> Any:
+    """
+    Выполнение функции хеширования в пуле потоков без блокировки event loop
+    :param func: функция хеширования
+    :param args: аргументы функции
+    :return: результат функции
+    """
+    return await asyncio.get_running_loop().run_in_executor(_get_hasher_executor(), func, *args)
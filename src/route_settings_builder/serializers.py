@@ -0,0 +1,132 @@
+import functools
+import json
+import typing
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+from django.db.models import QuerySet
+from django.http import HttpRequest, HttpResponse
+from ninja import Schema
+from ninja.responses import NinjaJSONEncoder
+
+from route_settings_builder import versions
+
+FAST_SERIALIZER_ATTR = 'fast_serializer'
+
+# Значения этих типов кодируются json без преобразования
+JSON_TYPES = (str, int)
+
+
+class FastListSerializer:
+    """
+    Быстрая сериализация перечней по схеме без создания моделей и валидации каждого объекта.
+    Значения полей схемы читаются через values_list и приводятся к типам схемы так же, как pydantic,
+    поэтому результат совпадает с ответом, сериализованным схемой
+    """
+
+    def __init__(self, schema: Type[Schema]) -> None:
+        """
+        :param schema: схема элемента перечня (поля без alias и вложенных схем)
+        """
+        self.schema = schema
+        self.fields: List[Tuple[str, Optional[Callable]]] = []
+
+        for name, field in schema.model_fields.items():
+            if field.alias and field.alias != name:
+                raise ValueError(f"Field '{name}' with alias is not supported")
+
+            self.fields.append((name, _get_converter(field.annotation)))
+
+    @property
+    def field_names(self) -> List[str]:
+        """ Наименования полей схемы """
+        return [name for name, _ in self.fields]
+
+    def get_rows(self, queryset: QuerySet, *extra_fields: str) -> List[tuple]:
+        """
+        Получение строк перечня
+        :param queryset: QuerySet
+        :param extra_fields: дополнительные поля, значения которых следуют за полями схемы
+        :return: строки вида (значения полей схемы..., значения дополнительных полей...)
+        """
+        return list(queryset.values_list(*self.field_names, *extra_fields))
+
+    def to_items(self, rows: Iterable[tuple]) -> List[Dict[str, Any]]:
+        """
+        Приведение строк к элементам ответа
+        :param rows: строки
+        :return: элементы
+        """
+        names = self.field_names
+        converters = [(index, converter) for index, (_, converter) in enumerate(self.fields) if converter]
+
+        items = []
+        for row in rows:
+            values = list(row[:len(names)])
+            for index, converter in converters:
+                if values[index] is not None:
+                    values[index] = converter(values[index])
+            items.append(dict(zip(names, values)))
+
+        return items
+
+    def serialize(self, queryset: QuerySet) -> List[Dict[str, Any]]:
+        """
+        Сериализация перечня
+        :param queryset: QuerySet
+        :return: элементы
+        """
+        return self.to_items(self.get_rows(queryset))
+
+
+def fast_list(schema: Type[Schema]) -> Callable:
+    """
+    Декоратор операции API, возвращающей перечень (в том числе через paginate), для быстрой сериализации.
+    Ответ кодируется в JSON напрямую, схема ответа и OpenAPI не меняются
+    :param schema: схема элемента перечня
+    :return: декоратор
+    """
+    serializer = FastListSerializer(schema)
+
+    def decorator(view_func: Callable) -> Callable:
+        @functools.wraps(view_func)
+        def wrapper(request: HttpRequest, *args, response: HttpResponse, **kwargs):
+            # Пагинатор получает сериализатор из запроса и отдаёт уже приведённые элементы
+            setattr(request, FAST_SERIALIZER_ATTR, serializer)
+
+            result = view_func(request, *args, **kwargs)
+            if isinstance(result, QuerySet):
+                result = serializer.serialize(result)
+
+            response.content = json.dumps(result)
+            return response
+
+        return versions.add_response_param(wrapper, view_func)
+
+    return decorator
+
+
+def get_fast_serializer(request: Optional[HttpRequest]) -> Optional[FastListSerializer]:
+    """
+    Получение сериализатора операции с быстрой сериализацией
+    :param request: запрос
+    :return: сериализатор или None
+    """
+    return getattr(request, FAST_SERIALIZER_ATTR, None)
+
+
+def _get_converter(annotation: Any) -> Optional[Callable]:
+    """
+    Получение функции приведения значения из БД к значению JSON по типу поля схемы
+    :param annotation: тип поля
+    :return: функция или None, если значение не требует приведения
+    """
+    if typing.get_origin(annotation) is typing.Union:
+        annotation, *_ = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+
+    if annotation in (float, bool):
+        return annotation
+    if annotation in JSON_TYPES:
+        return None
+
+    # Даты, UUID и т. п. кодируются так же, как в ответах ninja
+    return NinjaJSONEncoder().default
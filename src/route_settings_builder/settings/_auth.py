@@ -0,0 +1,5 @@
+from envparse import env
+
+BASIC_AUTH_CACHE_MAXSIZE = env.int('BASIC_AUTH_CACHE_MAXSIZE', default=1024)
+BASIC_AUTH_CACHE_TTL = env.int('BASIC_AUTH_CACHE_TTL', default=300)
+BASIC_AUTH_HASHER_WORKERS = env.int('BASIC_AUTH_HASHER_WORKERS', default=4)
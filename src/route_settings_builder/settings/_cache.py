@@ -0,0 +1,37 @@
+from envparse import env
+
+CRITERIA_REGISTRY_CHECK_INTERVAL = env.float('CRITERIA_REGISTRY_CHECK_INTERVAL', default=5.0)
+CRITERIA_REGISTRY_MISSING_MAXSIZE = env.int('CRITERIA_REGISTRY_MISSING_MAXSIZE', default=1024)
+
+BUILD_RESULT_CACHE_MAXSIZE = env.int('BUILD_RESULT_CACHE_MAXSIZE', default=256)
+BUILD_RESULT_CACHE_TTL = env.float('BUILD_RESULT_CACHE_TTL', default=3600)
+
+GUIDE_CACHE_BACKEND = env.str('GUIDE_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+GUIDE_CACHE_LOCATION = env.str('GUIDE_CACHE_LOCATION', default='route-guides')
+GUIDE_CACHE_TIMEOUT = env.int('GUIDE_CACHE_TIMEOUT', default=86400)
+GUIDE_CACHE_MAX_ENTRIES = env.int('GUIDE_CACHE_MAX_ENTRIES', default=300)
+
+# Ключи кэша ответов одинаковы во всех процессах: общий бэкенд (например, Redis) позволяет процессам
+# использовать ответы друг друга, локальный бэкенд лишь снижает долю попаданий
+RESPONSE_CACHE_BACKEND = env.str('RESPONSE_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+RESPONSE_CACHE_LOCATION = env.str('RESPONSE_CACHE_LOCATION', default='route-responses')
+RESPONSE_CACHE_TIMEOUT = env.int('RESPONSE_CACHE_TIMEOUT', default=3600)
+RESPONSE_CACHE_MAX_ENTRIES = env.int('RESPONSE_CACHE_MAX_ENTRIES', default=1000)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'guides': {
+        'BACKEND': GUIDE_CACHE_BACKEND,
+        'LOCATION': GUIDE_CACHE_LOCATION,
+        'TIMEOUT': GUIDE_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': GUIDE_CACHE_MAX_ENTRIES},
+    },
+    'responses': {
+        'BACKEND': RESPONSE_CACHE_BACKEND,
+        'LOCATION': RESPONSE_CACHE_LOCATION,
+        'TIMEOUT': RESPONSE_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': RESPONSE_CACHE_MAX_ENTRIES},
+    },
+}
@@ -0,0 +1,4 @@
+from envparse import env
+
+GUIDE_STREAMING_MIN_PLACES = env.int('GUIDE_STREAMING_MIN_PLACES', default=100)
+GUIDE_STREAMING_CHUNK_SIZE = env.int('GUIDE_STREAMING_CHUNK_SIZE', default=50)
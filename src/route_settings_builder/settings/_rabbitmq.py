@@ -10,3 +10,19 @@ RMQ_QUEUE = env.str('RMQ_QUEUE')
 RMQ_URL_QUERY_PARAMS = env.str('RMQ_URL_QUERY_PARAMS', default='')
 
 RMQ_URL = f"amqp://{RMQ_USER}:{RMQ_PASSWORD}@{RMQ_HOST}:{RMQ_PORT}/?{RMQ_URL_QUERY_PARAMS}"
+
+RMQ_CHANNEL_POOL_SIZE = env.int('RMQ_CHANNEL_POOL_SIZE', default=4)
+RMQ_REPLY_TIMEOUT = env.float('RMQ_REPLY_TIMEOUT', default=None)
+RMQ_BUILD_BATCH_SIZE = env.int('RMQ_BUILD_BATCH_SIZE', default=500)
+
+ROUTE_BUILD_CLAIM_TTL = env.float('ROUTE_BUILD_CLAIM_TTL', default=300)
+ROUTE_BUILD_CLAIM_POLL_INTERVAL = env.float('ROUTE_BUILD_CLAIM_POLL_INTERVAL', default=1.0)
+ROUTE_BUILD_MAX_IN_FLIGHT = env.int('ROUTE_BUILD_MAX_IN_FLIGHT', default=1000)
+ROUTE_BUILD_MAX_IN_FLIGHT_PER_USER = env.int('ROUTE_BUILD_MAX_IN_FLIGHT_PER_USER', default=20)
+
+RMQ_REPLY_QUEUE = env.str('RMQ_REPLY_QUEUE', default='')
+RMQ_REPLY_FLUSH_INTERVAL = env.float('RMQ_REPLY_FLUSH_INTERVAL', default=0.05)
+
+# auto выбирает формат по ответам построителя и при общей очереди RMQ_REPLY_QUEUE остаётся на JSON
+RMQ_MESSAGE_FORMAT = env.str('RMQ_MESSAGE_FORMAT', default='auto')
+RMQ_MESSAGE_COMPRESS_MIN_SIZE = env.int('RMQ_MESSAGE_COMPRESS_MIN_SIZE', default=4096)
@@ -0,0 +1,17 @@
+from envparse import env
+
+ROUTE_BLOBS_ROOT = env.str('ROUTE_BLOBS_ROOT', default='blobs/')
+ROUTE_BLOB_MIN_SIZE = env.int('ROUTE_BLOB_MIN_SIZE', default=16384)
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'route_blobs': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': ROUTE_BLOBS_ROOT},
+    },
+}
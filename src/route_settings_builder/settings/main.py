@@ -10,6 +10,10 @@ include(
     '_database.py',
     '_rabbitmq.py',
     '_git.py',
+    '_auth.py',
+    '_cache.py',
+    '_storage.py',
+    '_guides.py',
 )
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
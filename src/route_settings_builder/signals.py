@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from route_settings_builder import models, registry, security, versions
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_user_credentials(instance, **kwargs):
+    """ Сброс кэша проверенных учётных данных при изменении пользователя """
+    security.forget_user_credentials(instance.pk)
+
+
+@receiver(post_save, sender=models.Criterion)
+@receiver(post_delete, sender=models.Criterion)
+def invalidate_criteria_registry(**kwargs):
+    """
+    Сброс реестра критериев текущего процесса при изменении критерия.
+    Остальные процессы обнаруживают изменение по версии реестра в БД
+    """
+    registry.criteria.clear()
+    # Повторный сброс после фиксации транзакции: реестр мог быть загружен до её завершения
+    transaction.on_commit(registry.criteria.clear)
+
+
+@receiver(pre_save, sender=models.Criterion)
+def remember_criterion_value_type(instance, **kwargs):
+    """ Запоминание прежнего типа значения критерия """
+    instance.previous_value_type = (models.Criterion.objects.filter(pk=instance.pk)
+                                    .values_list('value_type', flat=True).first() if instance.pk else None)
+
+
+@receiver(post_save, sender=models.Criterion)
+def refresh_criterion_typed_values(instance, created, **kwargs):
+    """ Пересчёт типизированных значений связей при смене типа значения критерия """
+    if created or instance.previous_value_type == instance.value_type:
+        return
+
+    for through_model in (models.PlaceCriterion, models.RouteCriterion):
+        objs = list(through_model.objects.filter(criterion=instance).only('id', 'value'))
+        for obj in objs:
+            obj.set_typed_value(instance.value_type)
+
+        through_model.objects.bulk_update(objs, through_model.typed_value_fields, batch_size=2000)
+
+
+def touch_resource_versions(sender, **kwargs):
+    """
+    Смена версий ресурсов API при сохранении моделей, от которых они зависят.
+    Удаление меняет версии один раз на операцию в querysets.VersionedQuerySet и models.VersionedResourceMixin
+    """
+    versions.touch_model(sender)
+
+
+for model_label in versions.RESOURCES_BY_MODEL:
+    post_save.connect(touch_resource_versions, sender=model_label)
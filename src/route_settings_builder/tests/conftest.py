@@ -2,6 +2,9 @@ import pytest
 
 from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
+
+from route_settings_builder import registry, responses
 
 
 def _get_credentials():
@@ -27,3 +30,29 @@ def auth_credentials():
 async def async_auth_credentials():
     """ Асинхронное создание пользователя для авторизации """
     yield await sync_to_async(_get_credentials)()
+
+
+@pytest.fixture(autouse=True)
+def clear_criteria_registry():
+    """ Сброс реестра критериев: откат транзакции теста не вызывает сигналов """
+    registry.criteria.clear()
+    yield
+    registry.criteria.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """ Сброс кэша ответов: откат транзакции теста возвращает прежние версии ресурсов """
+    caches[responses.CACHE_ALIAS].clear()
+    yield
+
+
+@pytest.fixture()
+def blob_storage(settings, tmp_path):
+    """ Хранилище артефактов построения во временном каталоге """
+    settings.STORAGES = {**settings.STORAGES, 'route_blobs': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': str(tmp_path)},
+    }}
+    settings.ROUTE_BLOB_MIN_SIZE = 64
+    yield tmp_path
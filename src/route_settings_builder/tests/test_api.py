@@ -1,3 +1,4 @@
+import re
 import uuid
 import json
 
@@ -7,9 +8,12 @@ from asgiref.sync import sync_to_async
 
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import F
 from django.test import Client, AsyncClient
+from django.test.utils import CaptureQueriesContext
 
-from route_settings_builder import models
+from route_settings_builder import blobs, models, models_utils, gateways, versions
 
 api_client = Client()
 async_api_client = AsyncClient()
@@ -55,6 +59,53 @@ def test_get_places(auth_credentials):
         }
 
 
+def test_get_places__cursor_pagination(auth_credentials):
+    """ GET /api/v1/places с постраничным переходом по курсору """
+    assert api_client.login(**auth_credentials)
+
+    models.Place.objects.all().delete()
+    places = models.Place.objects.bulk_create([models.Place(name=f'Место {i}', longitude=i, latitude=i)
+                                               for i in range(5)])
+
+    received_ids = []
+    params = {'limit': 2, 'with_count': False}
+    while True:
+        response = api_client.get(reverse('api:get_places'), params)
+        assert response.status_code == 200
+
+        response_data = response.json()
+        assert response_data['count'] is None
+        received_ids.extend(item['id'] for item in response_data['items'])
+
+        if not response_data['next_cursor']:
+            break
+        params['cursor'] = response_data['next_cursor']
+
+    assert received_ids == [place.id for place in places]
+
+    response = api_client.get(reverse('api:get_places'), {'cursor': 'broken'})
+    assert response.status_code == 400
+
+
+def test_get_nearby_and_nearest_places(auth_credentials):
+    """ GET /api/v1/places/nearby и /api/v1/places/nearest """
+    assert api_client.login(**auth_credentials)
+
+    models.Place.objects.all().delete()
+    places = models.Place.objects.bulk_create([models.Place(name=f'Место {i}', latitude=54.7 + i / 100,
+                                                            longitude=20.45) for i in range(3)])
+
+    response = api_client.get(reverse('api:get_nearby_places'), {'latitude': 54.7, 'longitude': 20.45,
+                                                                 'radius_m': 1500})
+    assert response.status_code == 200
+    assert [item['id'] for item in response.json()] == [place.id for place in places[:2]]
+    assert response.json()[0]['distance_m'] == 0
+
+    response = api_client.get(reverse('api:get_nearest_places'), {'latitude': 54.73, 'longitude': 20.45, 'count': 2})
+    assert response.status_code == 200
+    assert [item['id'] for item in response.json()] == [places[2].id, places[1].id]
+
+
 def test_get_place(auth_credentials):
     """ GET /api/v1/places/<:id> """
     assert api_client.login(**auth_credentials)
@@ -86,6 +137,28 @@ def test_get_place(auth_credentials):
     }
 
 
+def test_get_place__queries_count(auth_credentials):
+    """ GET /api/v1/places/<:id>: количество запросов не зависит от количества критериев места """
+    assert api_client.login(**auth_credentials)
+
+    queries_counts = []
+    for criteria_count in (1, 5):
+        place = models.Place.objects.create(name=f'Место {criteria_count}', longitude=30.5, latitude=20.4)
+        for i in range(criteria_count):
+            criterion = models.Criterion.objects.create(name=f'Критерий {i}',
+                                                        internal_name=f'place_queries_{criteria_count}_{i}')
+            models.PlaceCriterion.objects.create(place=place, criterion=criterion, value=str(i))
+
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get(reverse('api:get_place', kwargs={'place_id': place.id}))
+
+        assert response.status_code == 200
+        assert len(response.json()['criteria']) == criteria_count
+        queries_counts.append(len(context.captured_queries))
+
+    assert queries_counts[0] == queries_counts[1]
+
+
 def test_get_place__not_found(auth_credentials):
     """ GET /api/v1/places/<:id> 404 """
     assert api_client.login(**auth_credentials)
@@ -148,6 +221,26 @@ def test_get_routes(auth_credentials):
         }
 
 
+def test_get_routes__cursor_pagination(auth_credentials):
+    """ GET /api/v1/routes с постраничным переходом по курсору """
+    assert api_client.login(**auth_credentials)
+
+    models.Route.objects.all().delete()
+
+    author = get_user_model().objects.get(username=auth_credentials['username'])
+    routes = [models.Route.objects.create(name=f'Маршрут №{i}', author=author) for i in range(3)]
+
+    response = api_client.get(reverse('api:get_routes'), {'limit': 2})
+    response_data = response.json()
+    assert response_data['count'] == 3
+    assert [item['uuid'] for item in response_data['items']] == [str(route.uuid) for route in routes[:2]]
+
+    response = api_client.get(reverse('api:get_routes'), {'limit': 2, 'cursor': response_data['next_cursor']})
+    response_data = response.json()
+    assert [item['uuid'] for item in response_data['items']] == [str(routes[2].uuid)]
+    assert response_data['next_cursor'] is None
+
+
 def test_get_routes__created_by_other_user(auth_credentials):
     """ GET /api/v1/routes для получения данных других пользователей """
     assert api_client.login(**auth_credentials)
@@ -210,6 +303,53 @@ def test_get_route(auth_credentials):
     }
 
 
+@pytest.mark.parametrize('method, url_name', [
+    ('get', 'api:get_route'),
+    ('post', 'api:create_route'),
+    ('put', 'api:update_route'),
+    ('patch', 'api:partial_update_route'),
+])
+def test_detailed_route__queries_count(auth_credentials, method, url_name):
+    """ Количество запросов для ответа DetailedRouteSchema не зависит от количества мест и критериев """
+    assert api_client.login(**auth_credentials)
+
+    author = get_user_model().objects.get(username=auth_credentials['username'])
+
+    queries_counts = []
+    for relations_count in (1, 10):
+        places = models.Place.objects.bulk_create([models.Place(name=f'Место {i}', longitude=i, latitude=i)
+                                                   for i in range(relations_count)])
+        criteria = models.Criterion.objects.bulk_create([
+            models.Criterion(name=f'Критерий {i}', internal_name=f'{method}_queries_{relations_count}_{i}')
+            for i in range(relations_count)
+        ])
+
+        route = models.Route.objects.create(name='Маршрут', author=author)
+        models.RoutePlace.objects.bulk_create([models.RoutePlace(route=route, place=place) for place in places])
+        models.RouteCriterion.objects.bulk_create([models.RouteCriterion(route=route, criterion=criterion, value='v')
+                                                   for criterion in criteria])
+
+        url = reverse(url_name) if method == 'post' else reverse(url_name, kwargs={'route_uuid': str(route.uuid)})
+        request_data = {
+            'name': 'Маршрут',
+            'criteria': [{'criterion_id': criterion.id, 'value': 'new'} for criterion in criteria],
+            'places': [place.id for place in places],
+        }
+
+        with CaptureQueriesContext(connection) as context:
+            if method == 'get':
+                response = api_client.get(url)
+            else:
+                response = getattr(api_client, method)(url, json.dumps(request_data), content_type='application/json')
+
+        assert response.status_code in (200, 201)
+        assert len(response.json()['places']) == relations_count
+        assert len(response.json()['criteria']) == relations_count
+        queries_counts.append(len(context.captured_queries))
+
+    assert queries_counts[0] == queries_counts[1]
+
+
 def test_get_route__not_found(auth_credentials):
     """ GET /api/v1/routes/<:route_uuid> 404 """
     assert api_client.login(**auth_credentials)
@@ -392,3 +532,325 @@ async def test_remove_route(async_auth_credentials):
     assert response.status_code == 204
 
     assert (await sync_to_async(models.Route.objects.filter(uuid=route_uuid).first)()) is None
+
+
+async def test_build_routes(async_auth_credentials, monkeypatch):
+    """ POST /api/v1/routes/build/ """
+    assert await sync_to_async(async_api_client.login)(**async_auth_credentials)
+
+    user = await get_user_model().objects.aget(username=async_auth_credentials['username'])
+    own_route = await models.Route.objects.acreate(name='own', author=user)
+    failed_route = await models.Route.objects.acreate(name='failed', author=user)
+    other_user = await get_user_model().objects.acreate(username='other')
+    other_route = await models.Route.objects.acreate(name='other', author=other_user)
+
+    published_requests = {}
+
+    async def publish_routes(requests, author):
+        assert author == user
+        published_requests.update(requests)
+        return {route_uuid: gateways.BUILD_STATUS_QUEUED if route_uuid != failed_route.uuid
+                else gateways.BUILD_STATUS_FAILED for route_uuid in requests}
+
+    monkeypatch.setattr(gateways.gateway, 'publish_routes', publish_routes)
+
+    response = await async_api_client.post(
+        reverse('api:build_routes'),
+        data={'routes': [str(own_route.uuid), str(failed_route.uuid), str(other_route.uuid)]},
+        content_type='application/json',
+    )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {'uuid': str(own_route.uuid), 'status': gateways.BUILD_STATUS_QUEUED},
+        {'uuid': str(failed_route.uuid), 'status': gateways.BUILD_STATUS_FAILED},
+        {'uuid': str(other_route.uuid), 'status': gateways.BUILD_STATUS_NOT_FOUND},
+    ]
+    assert published_requests == {own_route.uuid: {'points_coordinates': []},
+                                  failed_route.uuid: {'points_coordinates': []}}
+
+
+async def test_build_route__unchanged(async_auth_credentials, monkeypatch):
+    """ POST /api/v1/routes/{route_id}/build/ для маршрута без изменений не обращается к построителю """
+    assert await sync_to_async(async_api_client.login)(**async_auth_credentials)
+
+    user = await get_user_model().objects.aget(username=async_auth_credentials['username'])
+    route = await models.Route.objects.acreate(name='built', author=user, details={'path': []},
+                                               build_fingerprint=models_utils.get_build_fingerprint(
+                                                   {'points_coordinates': []}))
+
+    async def build_route(*args):
+        raise AssertionError('Построитель не должен вызываться')
+
+    monkeypatch.setattr(gateways.gateway, 'build_route', build_route)
+
+    response = await async_api_client.post(reverse('api:build_route', kwargs={'route_uuid': route.uuid}))
+    assert response.status_code == 204
+
+
+async def test_build_route__capacity_exceeded(async_auth_credentials, settings):
+    """ POST /api/v1/routes/{route_id}/build/ сверх ограничения на выполняемые построения """
+    settings.ROUTE_BUILD_MAX_IN_FLIGHT_PER_USER = 0
+    assert await sync_to_async(async_api_client.login)(**async_auth_credentials)
+
+    user = await get_user_model().objects.aget(username=async_auth_credentials['username'])
+    route = await models.Route.objects.acreate(name='route', author=user)
+
+    # Уникальные данные построения: известный результат построения применяется без ограничений
+    place = await models.Place.objects.acreate(name='place', latitude=12.345678, longitude=-45.678901)
+    await models.RoutePlace.objects.acreate(route=route, place=place)
+
+    response = await async_api_client.post(reverse('api:build_route', kwargs={'route_uuid': route.uuid}))
+    assert response.status_code == 429
+
+    response = await async_api_client.post(reverse('api:build_routes'), data={'routes': [str(route.uuid)]},
+                                           content_type='application/json')
+    assert response.status_code == 429
+
+
+async def test_get_route_build(async_auth_credentials):
+    """ GET /api/v1/routes/{route_id}/build/ """
+    assert await sync_to_async(async_api_client.login)(**async_auth_credentials)
+
+    user = await get_user_model().objects.aget(username=async_auth_credentials['username'])
+    route = await models.Route.objects.acreate(name='route', author=user)
+    url = reverse('api:get_route_build', kwargs={'route_uuid': route.uuid})
+
+    response = await async_api_client.get(url)
+    assert response.status_code == 404
+
+    await sync_to_async(models_utils.claim_builds)({route.uuid: 'fingerprint'})
+    await sync_to_async(models_utils.mark_builds_published)([route.uuid])
+
+    response = await async_api_client.get(url)
+    assert response.status_code == 200
+
+    response_data = response.json()
+    assert response_data['status'] == models.RouteBuildJob.STATUS_PUBLISHED
+    assert response_data['published_at'] is not None and response_data['finished_at'] is None
+
+
+@pytest.mark.usefixtures('blob_storage')
+def test_get_route__blob_details(auth_credentials):
+    """ GET /api/v1/routes/{route_id}/ возвращает ссылки на артефакты, вынесенные в хранилище """
+    assert api_client.login(**auth_credentials)
+
+    user = get_user_model().objects.get(username=auth_credentials['username'])
+    route_map = '<div id="route-map">карта</div>' * 10
+    route = models.Route.objects.create(name='route', author=user,
+                                        details=blobs.externalize_details({'map': route_map, 'distance': 10}))
+    assert blobs.is_blob_reference(route.details['map'])
+    map_url = reverse('api:get_route_detail', kwargs={'route_uuid': route.uuid, 'name': 'map'})
+
+    response = api_client.get(reverse('api:get_route', kwargs={'route_uuid': route.uuid}))
+    assert response.status_code == 200
+    assert response.json()['details'] == {'map': {'url': map_url}, 'distance': 10}
+
+    response = api_client.get(reverse('api:get_route', kwargs={'route_uuid': route.uuid}), {'inline_details': True})
+    assert response.status_code == 200
+    assert response.json()['details'] == {'map': route_map, 'distance': 10}
+
+    response = api_client.get(map_url)
+    assert response.status_code == 200 and response.json() == route_map
+    assert api_client.get(reverse('api:get_route_detail', kwargs={'route_uuid': route.uuid,
+                                                                  'name': 'distance'})).status_code == 404
+
+
+def test_get_route__missing_blob(auth_credentials, blob_storage):
+    """ Чтение и изменение маршрута не зависят от доступности артефактов в хранилище """
+    assert api_client.login(**auth_credentials)
+
+    user = get_user_model().objects.get(username=auth_credentials['username'])
+    route = models.Route.objects.create(name='route', author=user,
+                                        details=blobs.externalize_details({'map': 'карта' * 20}))
+    for path in blob_storage.rglob('*'):
+        if path.is_file():
+            path.unlink()
+    map_url = reverse('api:get_route_detail', kwargs={'route_uuid': route.uuid, 'name': 'map'})
+    url = reverse('api:get_route', kwargs={'route_uuid': route.uuid})
+
+    for response in (api_client.get(url), api_client.get(url, {'inline_details': True}),
+                     api_client.patch(reverse('api:partial_update_route', kwargs={'route_uuid': route.uuid}),
+                                      json.dumps({'name': 'new'}), content_type='application/json')):
+        assert response.status_code == 200 and response.json()['details'] == {'map': {'url': map_url}}
+
+    assert api_client.get(map_url).status_code == 404
+
+
+@pytest.mark.usefixtures('blob_storage')
+def test_get_route_guide(auth_credentials):
+    """ GET /api/v1/routes/{route_id}/guide/ """
+    assert api_client.login(**auth_credentials)
+
+    user = get_user_model().objects.get(username=auth_credentials['username'])
+    route_map = '<div id="route-map">карта</div>' * 10
+    route = models.Route.objects.create(name='route', author=user,
+                                        details=blobs.externalize_details({'map': route_map}))
+
+    # Перечень маршрутов не загружает детализацию: она используется только в условии is_draft
+    with CaptureQueriesContext(connection) as queries:
+        assert api_client.get(reverse('api:get_routes')).status_code == 200
+    assert not any('"details"' in query['sql'].split(' FROM ')[0].replace('"details" IS NULL', '')
+                   for query in queries.captured_queries)
+
+    response = api_client.get(reverse('api:get_route_guide', kwargs={'route_uuid': route.uuid}))
+    assert response.status_code == 200
+    assert route_map in response.content.decode()
+
+
+def test_get_route_guide__conditional(auth_credentials):
+    """ GET /api/v1/routes/{route_id}/guide/ с If-None-Match и If-Modified-Since """
+    assert api_client.login(**auth_credentials)
+
+    user = get_user_model().objects.get(username=auth_credentials['username'])
+    place = models.Place.objects.create(name='Место гида', longitude=20.5, latitude=54.7)
+    route = models.Route.objects.create(name='route', author=user)
+    models.RoutePlace.objects.create(route=route, place=place)
+    url = reverse('api:get_route_guide', kwargs={'route_uuid': route.uuid})
+
+    response = api_client.get(url)
+    assert response.status_code == 200 and 'Место гида' in response.content.decode()
+    etag, last_modified = response['ETag'], response['Last-Modified']
+
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    assert api_client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code == 304
+
+    # Отрисованный гид берётся из кэша: места маршрута не запрашиваются
+    with CaptureQueriesContext(connection) as queries:
+        assert api_client.get(url).content == response.content
+    assert not any('route_settings_builder_place"."description' in query['sql'] for query in queries.captured_queries)
+
+    place.description = 'Новое описание'
+    place.save()
+
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200 and response['ETag'] != etag
+    assert 'Новое описание' in response.content.decode()
+
+
+def test_get_route_guide__streaming(auth_credentials, settings):
+    """ GET /api/v1/routes/{route_id}/guide/ для маршрута с большим количеством мест """
+    settings.GUIDE_STREAMING_MIN_PLACES = 3
+    settings.GUIDE_STREAMING_CHUNK_SIZE = 2
+    assert api_client.login(**auth_credentials)
+
+    user = get_user_model().objects.get(username=auth_credentials['username'])
+    route = models.Route.objects.create(name='route', author=user)
+    places = models.Place.objects.bulk_create([models.Place(name=f'Место {i}', description=f'<p>Описание {i}</p>',
+                                                            longitude=20 + i, latitude=54) for i in range(5)])
+    models.RoutePlace.objects.bulk_create([models.RoutePlace(route=route, place=place) for place in places])
+    url = reverse('api:get_route_guide', kwargs={'route_uuid': route.uuid})
+
+    response = api_client.get(url)
+    assert response.status_code == 200 and response.streaming and response['ETag']
+
+    content = b''.join(response.streaming_content).decode()
+    assert content.count('<h2>') == 5 and '<p>Описание 4</p>' in content and content.rstrip().endswith('</style>')
+
+    settings.GUIDE_STREAMING_MIN_PLACES = 0
+    response = api_client.get(url)
+    assert not response.streaming and response.content.decode().split() == content.split()
+
+
+def _get_resource_queries(queries):
+    """ Таблицы приложения, к которым выполнялись запросы """
+    return [re.search(r'"(route_settings_builder_\w+)"', query['sql']).group(1)
+            for query in queries.captured_queries if 'route_settings_builder_' in query['sql']]
+
+
+def test_conditional_get(auth_credentials):
+    """ Условные запросы к операциям чтения по ETag и Last-Modified """
+    assert api_client.login(**auth_credentials)
+
+    user = get_user_model().objects.get(username=auth_credentials['username'])
+    place = models.Place.objects.create(name='Место', longitude=20.5, latitude=54.7)
+    route = models.Route.objects.create(name='route', author=user)
+
+    urls = [reverse('api:get_places'), reverse('api:get_place', kwargs={'place_id': place.id}),
+            reverse('api:get_criteria'), reverse('api:get_routes'),
+            reverse('api:get_route', kwargs={'route_uuid': route.uuid})]
+    etags = {}
+
+    for url in urls:
+        response = api_client.get(url)
+        assert response.status_code == 200 and response['Last-Modified']
+        etags[url] = response['ETag']
+
+        # Ответ 304 формируется по версиям ресурсов без запросов к ресурсу и сериализации
+        with CaptureQueriesContext(connection) as queries:
+            assert api_client.get(url, HTTP_IF_NONE_MATCH=etags[url]).status_code == 304
+        assert _get_resource_queries(queries) == ['route_settings_builder_resourceversion']
+
+    assert len(set(etags.values())) == len(urls)
+
+    # Изменение места меняет версии мест и маршрутов, но не критериев
+    place.name = 'Новое место'
+    place.save()
+
+    for url in urls:
+        status_code = api_client.get(url, HTTP_IF_NONE_MATCH=etags[url]).status_code
+        assert status_code == (304 if url == reverse('api:get_criteria') else 200)
+
+    # Запись ответа построителя меняет версию маршрутов
+    route_etag = api_client.get(urls[-1])['ETag']
+    claimed = models_utils.claim_builds({route.uuid: 'fingerprint'})
+    models_utils.apply_build_replies({claimed[route.uuid]: {'path': []}})
+
+    response = api_client.get(urls[-1], HTTP_IF_NONE_MATCH=route_etag)
+    assert response.status_code == 200 and response.json()['details'] == {'path': []}
+
+
+def test_conditional_get__shared_versions(auth_credentials):
+    """ Версия ресурса, изменённая другим процессом, меняет ETag во всех процессах """
+    assert api_client.login(**auth_credentials)
+
+    url = reverse('api:get_criteria')
+    etag = api_client.get(url)['ETag']
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    # Другой процесс меняет версию только в БД
+    models.ResourceVersion.objects.filter(resource=versions.CRITERIA).update(version=F('version') + 1)
+
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200 and response['ETag'] != etag
+
+
+def test_get_places__cached(auth_credentials):
+    """ Повторный запрос перечня мест отдаётся из кэша ответов до изменения мест """
+    assert api_client.login(**auth_credentials)
+
+    place = models.Place.objects.create(name='Место каталога', longitude=20.5, latitude=54.7)
+    url = reverse('api:get_places')
+
+    response = api_client.get(url, {'name': 'Место каталога', 'limit': 10})
+    assert response.status_code == 200 and response.json()['count'] == 1
+
+    # Порядок параметров не влияет на ключ кэша
+    with CaptureQueriesContext(connection) as queries:
+        cached_response = api_client.get(f'{url}?limit=10&name=Место каталога')
+    assert cached_response.content == response.content and cached_response['ETag']
+    assert _get_resource_queries(queries) == ['route_settings_builder_resourceversion']
+
+    place.name = 'Другое место'
+    place.save()
+
+    response = api_client.get(url, {'name': 'Место каталога', 'limit': 10})
+    assert response.status_code == 200 and response.json()['count'] == 0
+
+
+def test_get_places__cached_shared_versions(auth_credentials):
+    """ Изменение мест другим процессом делает кэшированный ответ недоступным """
+    assert api_client.login(**auth_credentials)
+
+    place = models.Place.objects.create(name='Место другого процесса', longitude=20.5, latitude=54.7)
+    url = reverse('api:get_places')
+    params = {'name': 'Место другого процесса', 'limit': 10}
+    assert api_client.get(url, params).json()['count'] == 1
+
+    # Другой процесс меняет место и версию мест только в БД, без сигналов и кэша текущего процесса
+    models.Place.objects.filter(pk=place.pk).update(name='Другое место')
+    assert api_client.get(url, params).json()['count'] == 1
+    models.ResourceVersion.objects.filter(resource=versions.PLACES).update(version=F('version') + 1)
+
+    response = api_client.get(url, params)
+    assert response.status_code == 200 and response.json()['count'] == 0
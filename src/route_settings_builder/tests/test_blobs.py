@@ -0,0 +1,39 @@
+import pytest
+
+from route_settings_builder import blobs
+
+
+def test_externalize_details(blob_storage):
+    """ Крупные артефакты переносятся в хранилище один раз, в детализации остаётся ссылка """
+    route_map = '<div>карта</div>' * 100
+    details = blobs.externalize_details({'map': route_map, 'distance': 100, 'name': 'short'})
+
+    assert blobs.is_blob_reference(details['map'])
+    assert details['distance'] == 100 and details['name'] == 'short'
+    assert blobs.load_detail(details, 'map') == route_map
+    assert blobs.load_detail(details, 'name') == 'short'
+
+    assert blobs.externalize_details({'map': route_map}) == {'map': details['map']}
+    assert len([path for path in blob_storage.rglob('*') if path.is_file()]) == 1
+
+
+@pytest.mark.usefixtures('blob_storage')
+def test_read_blob__invalid_key():
+    """ Ключ, не являющийся sha256, не превращается в путь к файлу """
+    with pytest.raises(ValueError):
+        blobs.read_blob('../../etc/passwd')
+
+
+def test_save_blob__truncated(blob_storage):
+    """ Усечённые данные перезаписываются при сохранении и не принимаются при чтении """
+    data = b'<div>map</div>' * 100
+    key = blobs.save_blob(data)
+    [path] = [path for path in blob_storage.rglob('*') if path.is_file()]
+
+    path.write_bytes(data[:10])
+    with pytest.raises(ValueError):
+        blobs.read_blob(key)
+
+    assert blobs.save_blob(data) == key
+    assert blobs.read_blob(key) == data
+    assert [path.name for path in blob_storage.rglob('*') if path.is_file()] == [key]
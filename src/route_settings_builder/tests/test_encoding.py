@@ -0,0 +1,63 @@
+import json
+import zlib
+
+import pytest
+
+from route_settings_builder import encoding
+from route_settings_builder.tests.test_gateways import _Message
+
+MESSAGE = {
+    'points_coordinates': [(55.751244 + index / 1000, 37.618423 - index / 1000) for index in range(100)],
+    'rating': 4.5,
+    'tags': [[1.5, 2.5]],
+}
+
+
+def test_pack_roundtrip():
+    """ Компактный формат восстанавливает сообщение без потери точности и короче JSON """
+    body = encoding.pack(MESSAGE)
+
+    assert encoding.unpack(body) == json.loads(json.dumps(MESSAGE))
+    assert len(body) < len(json.dumps(MESSAGE))
+
+
+def test_codec_negotiation(settings):
+    """ Запросы кодируются в JSON, пока построитель не сообщит о поддержке компактного формата """
+    settings.RMQ_MESSAGE_FORMAT = encoding.MESSAGE_FORMAT_AUTO
+    settings.RMQ_MESSAGE_COMPRESS_MIN_SIZE = 64
+    codec = encoding.MessageCodec()
+
+    body, properties = codec.encode(MESSAGE)
+    assert properties['content_type'] == encoding.CONTENT_TYPE_JSON and properties['content_encoding'] is None
+    assert json.loads(body) == json.loads(json.dumps(MESSAGE))
+
+    codec.negotiate({encoding.ACCEPT_HEADER: encoding.CONTENT_TYPE_PACKED,
+                     encoding.ACCEPT_ENCODING_HEADER: encoding.CONTENT_ENCODING_DEFLATE})
+    body, properties = codec.encode(MESSAGE)
+    assert properties['content_type'] == encoding.CONTENT_TYPE_PACKED
+    assert properties['content_encoding'] == encoding.CONTENT_ENCODING_DEFLATE
+
+    message = _Message('id', body, **{key: properties[key] for key in ('content_type', 'content_encoding')})
+    assert codec.decode(message) == json.loads(json.dumps(MESSAGE))
+
+
+def test_codec_decode():
+    """ Ответы без content_type декодируются как JSON, повреждённые сообщения отклоняются """
+    assert encoding.codec.decode(_Message('id', {'map': '<html>'}, content_type=None)) == {'map': '<html>'}
+
+    compressed = _Message('id', zlib.compress(b'{"map": "<html>"}'),
+                          content_encoding=encoding.CONTENT_ENCODING_DEFLATE)
+    assert encoding.codec.decode(compressed) == {'map': '<html>'}
+
+    with pytest.raises(ValueError):
+        encoding.codec.decode(_Message('id', b'\x00\x00\x00\xff{}', content_type=encoding.CONTENT_TYPE_PACKED))
+
+
+@pytest.mark.parametrize('reference', [['a', 1], 5, [1], [0, -1], [True, 1], [0, 100]])
+def test_codec_decode__malformed_reference(reference):
+    """ Некорректная ссылка на массив координат приводит к ValueError """
+    header = json.dumps({'path': {encoding.PACKED_MARKER: reference}}).encode()
+    body = len(header).to_bytes(4, 'big') + header
+
+    with pytest.raises(ValueError):
+        encoding.codec.decode(_Message('id', body, content_type=encoding.CONTENT_TYPE_PACKED))
@@ -0,0 +1,171 @@
+import math
+import random
+
+import pytest
+
+from route_settings_builder import filters, geo, models
+
+pytestmark = pytest.mark.django_db
+
+
+def test_filter_places__near():
+    """ Фильтр мест по расстоянию до точки """
+    center = models.Place.objects.create(name='Центр', latitude=54.710426, longitude=20.452214)
+    nearby = models.Place.objects.create(name='Рядом', latitude=54.720426, longitude=20.452214)
+    models.Place.objects.create(name='Далеко', latitude=55.755826, longitude=37.617300)
+
+    request_filters = filters.PlaceFilterSchema(near='54.710426,20.452214,1500')
+    assert set(request_filters.filter(models.Place.objects.all())) == {center, nearby}
+
+    request_filters = filters.PlaceFilterSchema(near='54.710426,20.452214,500')
+    assert set(request_filters.filter(models.Place.objects.all())) == {center}
+
+
+def test_filter_places__near_antimeridian():
+    """ Фильтр мест по расстоянию до точки рядом со 180-м меридианом """
+    west = models.Place.objects.create(name='Запад', latitude=65, longitude=179.99)
+    east = models.Place.objects.create(name='Восток', latitude=65, longitude=-179.99)
+
+    request_filters = filters.PlaceFilterSchema(near='65,180,5000')
+    assert set(request_filters.filter(models.Place.objects.all())) == {west, east}
+
+
+@pytest.mark.parametrize('value', ['1,2', 'a,b,c', '91,0,10', '0,0,-1', '0,0,0',
+                                   'nan,0,10', '0,nan,10', '0,0,nan', '0,0,inf', '-inf,0,10'])
+def test_filter_places__near_invalid(value):
+    """ Некорректное значение окружности """
+    with pytest.raises(ValueError):
+        filters.PlaceFilterSchema(near=value)
+
+
+def test_get_bounding_box__pole():
+    """ Окружность, содержащая полюс, не ограничивает долготу """
+    _, max_latitude, longitude_ranges = geo.get_bounding_box(89.99, 10, 5000)
+    assert max_latitude == 90
+    assert longitude_ranges == [(-180, 180)]
+
+
+def test_encode_geohash():
+    """ Кодирование координат в geohash """
+    assert geo.encode_geohash(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+
+
+def test_place_geohash_maintained():
+    """ Geohash места вычисляется при сохранении и массовом создании """
+    place = models.Place.objects.create(name='Место', latitude=57.64911, longitude=10.40744)
+    assert place.geohash == geo.encode_geohash(57.64911, 10.40744)
+
+    place.latitude, place.longitude = 10, 10
+    place.save(update_fields=['latitude', 'longitude'])
+    place.refresh_from_db()
+    assert place.geohash == geo.encode_geohash(10, 10)
+
+    [place] = models.Place.objects.bulk_create([models.Place(name='Другое место', latitude=20, longitude=20)])
+    assert models.Place.objects.get(id=place.id).geohash == geo.encode_geohash(20, 20)
+
+
+@pytest.mark.parametrize('latitude, longitude', [(54.71, 20.45), (0.0001, -179.9999), (-33.86, 151.2)])
+def test_nearby_and_nearest_places(latitude, longitude):
+    """ Поиск мест в радиусе и ближайших мест совпадает с полным перебором """
+    random_generator = random.Random(0)
+    places = models.Place.objects.bulk_create([
+        models.Place(name=str(i), latitude=round(latitude + random_generator.uniform(-0.5, 0.5), 6),
+                     longitude=round((longitude + random_generator.uniform(-0.5, 0.5) + 180) % 360 - 180, 6))
+        for i in range(300)
+    ])
+    distances = dict(zip((place.id for place in places),
+                         _get_distances(latitude, longitude,
+                                       [(float(place.latitude), float(place.longitude)) for place in places])))
+    expected_ids = sorted(distances, key=distances.get)
+
+    nearby = models.Place.objects.nearby(latitude, longitude, 20_000, limit=1000)
+    assert [place.id for place in nearby] == [place_id for place_id in expected_ids if distances[place_id] <= 20_000]
+
+    nearest = models.Place.objects.nearest(latitude, longitude, 15)
+    assert [place.id for place in nearest] == expected_ids[:15]
+
+
+def test_nearest_places__fallback(django_assert_max_num_queries):
+    """ Если в ячейках geohash недостаточно мест, ближайшие места выбираются в БД с ограничением количества """
+    places = models.Place.objects.bulk_create([
+        models.Place(name='Рядом', latitude=54.71, longitude=20.45),
+        models.Place(name='Далеко', latitude=-33.86, longitude=151.2),
+        models.Place(name='Очень далеко', latitude=-54.71, longitude=-159.55),
+    ])
+
+    with django_assert_max_num_queries(geo.GEOHASH_PRECISION + 1):
+        nearest = models.Place.objects.filter(id__in=[place.id for place in places]).nearest(54.71, 20.45, 2)
+    assert [place.id for place in nearest] == [places[0].id, places[1].id]
+    assert nearest[0].distance_m == 0
+
+
+def test_filter_places__several_criteria():
+    """ Фильтр мест по нескольким критериям одновременно, без дублей """
+    rating = models.Criterion.objects.create(name='Рейтинг', internal_name='rating', value_type='numeric')
+    parking = models.Criterion.objects.create(name='Парковка', internal_name='parking', value_type='boolean')
+
+    both, only_rating, _ = [models.Place.objects.create(name=str(i), latitude=i, longitude=i) for i in range(3)]
+    models.PlaceCriterion.objects.bulk_create([
+        models.PlaceCriterion(place=both, criterion=rating, value='5'),
+        models.PlaceCriterion(place=both, criterion=parking, value='true'),
+        models.PlaceCriterion(place=only_rating, criterion=rating, value='5'),
+    ])
+
+    request_filters = filters.PlaceFilterSchema(criteria=['rating:5', 'parking:true'])
+    assert list(request_filters.filter(models.Place.objects.all())) == [both]
+
+    request_filters = filters.PlaceFilterSchema(criteria=['rating:5'])
+    assert list(request_filters.filter(models.Place.objects.order_by('id'))) == [both, only_rating]
+
+    request_filters = filters.PlaceFilterSchema(criteria=['unknown:5'])
+    assert not request_filters.filter(models.Place.objects.all()).exists()
+
+
+def test_filter_places__numeric_and_boolean_criteria():
+    """ Фильтр мест по диапазону числового критерия и логическому критерию """
+    rating = models.Criterion.objects.create(name='Рейтинг', internal_name='rating', value_type='numeric')
+    parking = models.Criterion.objects.create(name='Парковка', internal_name='parking', value_type='boolean')
+
+    places = [models.Place.objects.create(name=str(i), latitude=i, longitude=i) for i in range(3)]
+    for i, place in enumerate(places):
+        models.PlaceCriterion.objects.create(place=place, criterion=rating, value=str(3 + i))
+        models.PlaceCriterion.objects.create(place=place, criterion=parking, value='1' if i else 'false')
+
+    def filter_places(*criteria):
+        request_filters = filters.PlaceFilterSchema(criteria=list(criteria))
+        return list(request_filters.filter(models.Place.objects.order_by('id')))
+
+    assert filter_places('rating>=4') == places[1:]
+    assert filter_places('rating<4.5') == places[:2]
+    assert filter_places('rating:5.0') == [places[2]]
+    assert filter_places('parking:true', 'rating<5') == [places[1]]
+    assert not filter_places('parking>1')
+    assert not filter_places('rating>=many')
+
+    with pytest.raises(ValueError):
+        filters.PlaceFilterSchema(criteria=['rating'])
+
+
+def test_criterion_typed_values_refreshed_on_value_type_change():
+    """ Смена типа значения критерия пересчитывает типизированные значения """
+    criterion = models.Criterion.objects.create(name='Этажность', internal_name='floors')
+    place = models.Place.objects.create(name='Место', latitude=1, longitude=1)
+    place_criterion = models.PlaceCriterion.objects.create(place=place, criterion=criterion, value='12')
+    assert place_criterion.numeric_value is None
+
+    criterion.value_type = 'numeric'
+    criterion.save()
+
+    place_criterion.refresh_from_db()
+    assert place_criterion.numeric_value == 12
+
+
+def _get_distances(latitude, longitude, points):
+    """ Расстояния от точки до набора точек в метрах (формула гаверсинусов) для проверки поиска в БД """
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+
+    return [2 * geo.EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(
+        math.sin((math.radians(point_latitude) - latitude) / 2) ** 2
+        + math.cos(latitude) * math.cos(math.radians(point_latitude))
+        * math.sin((math.radians(point_longitude) - longitude) / 2) ** 2
+    ))) for point_latitude, point_longitude in points]
@@ -0,0 +1,186 @@
+import asyncio
+import contextlib
+import json
+import uuid
+
+import pytest
+
+from asgiref.sync import sync_to_async
+
+from route_settings_builder import gateways, models, models_utils
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+class _Message:
+    """ Сообщение брокера для проверки consumer без подключения """
+
+    def __init__(self, correlation_id: str, body, **properties) -> None:
+        self.correlation_id = correlation_id
+        self.body = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.content_type = properties.get('content_type', 'application/json')
+        self.content_encoding = properties.get('content_encoding')
+        self.headers = properties.get('headers', {})
+        self.redelivered = properties.get('redelivered', False)
+        self.state = None
+
+    @property
+    def processed(self) -> bool:
+        """ Подтверждено или отклонено ли сообщение """
+        return self.state is not None
+
+    @contextlib.asynccontextmanager
+    async def process(self):
+        """ Подтверждение сообщения после обработки """
+        yield
+        self.state = 'ack'
+
+    async def ack(self):
+        """ Подтверждение сообщения """
+        self.state = 'ack'
+
+    async def reject(self):
+        """ Отклонение сообщения """
+        self.state = 'reject'
+
+    async def nack(self, requeue: bool = True):
+        """ Возврат сообщения в очередь """
+        self.state = 'requeue' if requeue else 'reject'
+
+
+async def test_reply_routed_by_correlation_id(admin_user):
+    """ Consumer записывает ответ в маршрут задания с тем же correlation id """
+    first, second = await sync_to_async(lambda: [models.Route.objects.create(name=name, author=admin_user)
+                                                 for name in ('first', 'second')])()
+    claimed = await sync_to_async(models_utils.claim_builds)({first.uuid: 'fingerprint', second.uuid: 'fingerprint'})
+
+    consumer = gateways.ReplyToRouteBuilderConsumer('amqp://', loop=asyncio.get_running_loop())
+    future = asyncio.get_running_loop().create_future()
+    consumer.futures = {claimed[second.uuid]: (future, {})}
+    gateways.build_results.clear()
+
+    message = _Message(claimed[second.uuid], {'path': [1, 2]})
+    await consumer._handle_delivery(message)  # pylint: disable=protected-access
+
+    assert message.state == 'ack' and future.done() and not consumer.futures
+
+    second = await models.Route.objects.aget(pk=second.pk)
+    assert second.details == {'path': [1, 2]}
+    assert second.build_fingerprint == 'fingerprint' and not second.build_claim_fingerprint
+    assert (await second.build_jobs.aget()).status == models.RouteBuildJob.STATUS_DONE
+    assert gateways.build_results.get('fingerprint') == {'path': [1, 2]}
+    assert (await models.Route.objects.aget(pk=first.pk)).details is None
+
+    # Повторный ответ на завершённое задание подтверждается и не применяется
+    late_message = _Message(claimed[second.uuid], {'path': [3]})
+    await consumer._handle_delivery(late_message)  # pylint: disable=protected-access
+
+    assert late_message.state == 'ack'
+    assert (await models.Route.objects.aget(pk=second.pk)).details == {'path': [1, 2]}
+
+
+async def test_outdated_reply_dropped(admin_user):
+    """ Ответ на запрос, захват которого перехвачен более новым построением, не применяется """
+    route = await sync_to_async(models.Route.objects.create)(name='route', author=admin_user)
+    older = await sync_to_async(models_utils.claim_builds)({route.uuid: 'older'})
+    await sync_to_async(models_utils.claim_builds)({route.uuid: 'newer'})
+
+    consumer = gateways.ReplyToRouteBuilderConsumer('amqp://', loop=asyncio.get_running_loop())
+    consumer.futures = {}
+    await consumer._handle_delivery(_Message(older[route.uuid], {'path': [1]}))  # pylint: disable=protected-access
+
+    route = await models.Route.objects.aget(pk=route.pk)
+    assert route.details is None and route.build_claim_fingerprint == 'newer'
+
+
+async def test_replies_batch(admin_user):
+    """ Consumer общей очереди записывает пакет ответов и подтверждает сообщения после записи """
+    routes = await sync_to_async(lambda: [models.Route.objects.create(name=str(i), author=admin_user)
+                                          for i in range(3)])()
+    claimed = await sync_to_async(models_utils.claim_builds)({route.uuid: str(i) for i, route in enumerate(routes)})
+
+    consumer = gateways.RouteBuildRepliesConsumer('amqp://', 'replies', batch_size=10, flush_interval=0,
+                                                  loop=asyncio.get_running_loop())
+    messages = [_Message(claimed[route.uuid], {'path': [i]}) for i, route in enumerate(routes[:2])]
+    messages += [_Message(claimed[routes[2].uuid], b'not json'), _Message('unknown', {'path': []})]
+
+    await consumer.process_batch(messages)
+
+    assert [message.state for message in messages] == ['ack', 'ack', 'reject', 'ack']
+    assert [route.details async for route in models.Route.objects.filter(pk__in=[route.pk for route in routes])
+            .order_by('id')] == [{'path': [0]}, {'path': [1]}, None]
+
+
+async def test_replies_consumer__batch_error(monkeypatch):
+    """ Ошибка обработки пакета не останавливает consumer: сообщения возвращаются в очередь """
+    consumer = gateways.RouteBuildRepliesConsumer('amqp://', 'replies', batch_size=10, flush_interval=0,
+                                                  loop=asyncio.get_running_loop())
+    batches = [[_Message('first', {}), _Message('second', {}, redelivered=True), _Message('third', {})], []]
+    pending_batches = iter(batches)
+
+    async def process_batch(messages):
+        if not messages:
+            # Второй пакет обработан: ошибка первого пакета не остановила consumer
+            raise asyncio.CancelledError
+        await messages[0].ack()
+        raise RuntimeError('unexpected')
+
+    async def get_batch():
+        return next(pending_batches)
+
+    async def noop(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(consumer, 'create_consume_connection', noop)
+    monkeypatch.setattr(consumer, 'close', noop)
+    monkeypatch.setattr(consumer, 'process_batch', process_batch)
+    monkeypatch.setattr(consumer, '_get_batch', get_batch)
+
+    with pytest.raises(asyncio.CancelledError):
+        await consumer.run()
+
+    assert [message.state for message in batches[0]] == ['ack', 'reject', 'requeue']
+
+
+async def test_reuse_build_result(admin_user):
+    """ Известный результат построения применяется без обращения к построителю """
+    request = {'points_coordinates': [(1.0, 2.0)], 'criterion': 'value'}
+    fingerprint = models_utils.get_build_fingerprint(request)
+    gateways.build_results.clear()
+
+    built, route = await sync_to_async(lambda: [
+        models.Route.objects.create(name='built', author=admin_user, details={'path': [1]},
+                                    build_fingerprint=fingerprint),
+        models.Route.objects.create(name='route', author=admin_user),
+    ])()
+
+    assert await gateways.reuse_build_result(built.id, request, fingerprint) == gateways.BUILD_STATUS_UNCHANGED
+    assert await gateways.reuse_build_result(route.id, {**request, 'criterion': 'other'}, None) is None
+
+    # Результат построения другого маршрута с теми же данными
+    assert await gateways.reuse_build_result(route.id, request, None) == gateways.BUILD_STATUS_CACHED
+
+    route = await models.Route.objects.aget(pk=route.pk)
+    assert route.details == {'path': [1]} and route.build_fingerprint == fingerprint
+    assert gateways.build_results.get(fingerprint) == {'path': [1]}
+
+
+async def test_build_route_coalesced(monkeypatch):
+    """ Одновременные запросы на построение маршрута с теми же данными объединяются """
+    builds = []
+
+    async def claim_and_build(route_uuid, request, fingerprint, *_):
+        builds.append((route_uuid, fingerprint))
+        await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(gateways.gateway, '_claim_and_build', claim_and_build)
+    route_uuid, request = uuid.uuid4(), {'points_coordinates': [(1.0, 2.0)]}
+
+    try:
+        await asyncio.gather(*(gateways.build_route(route_uuid, request) for _ in range(3)),
+                             gateways.build_route(route_uuid, {'points_coordinates': []}))
+    finally:
+        gateways.gateway.close()
+
+    assert sorted(builds) == sorted([(route_uuid, models_utils.get_build_fingerprint(request)),
+                                     (route_uuid, models_utils.get_build_fingerprint({'points_coordinates': []}))])
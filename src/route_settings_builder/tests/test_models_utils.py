@@ -3,8 +3,11 @@ from typing import List, Tuple, Optional, Set
 import pytest
 
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-from route_settings_builder import models, models_utils
+from route_settings_builder import models, models_utils, registry, versions
 
 M2M_COUNT = 3
 
@@ -66,6 +69,101 @@ def test_update_route(admin_user, route_data):
         assert getattr(route, field_name) == value
 
 
+def test_update_route__constant_queries_count(admin_user):
+    """ Количество запросов на обновление маршрута не зависит от количества мест и критериев """
+    places = [models.Place.objects.create(name=str(i), latitude=i, longitude=i) for i in range(50)]
+    criteria = [models.Criterion.objects.create(name=str(i), internal_name=f'constant_{i}') for i in range(20)]
+    registry.criteria.get(criteria[0].id)
+
+    queries_counts = []
+    for count in (1, len(places)):
+        route = _create_route(admin_user)
+        route_data = {
+            'author': admin_user,
+            'criteria': [{'criterion_id': criterion.id, 'value': 'v'} for criterion in criteria[:count]],
+            'places': [place.id for place in places[:count]],
+        }
+
+        with CaptureQueriesContext(connection) as context:
+            models_utils.create_or_update_route(route_data, route.uuid)
+        queries_counts.append(len(context.captured_queries))
+
+        _assert_route_relations(route, {criterion.id for criterion in criteria[:count]},
+                                {place.id for place in places[:count]})
+
+    assert queries_counts[0] == queries_counts[1]
+
+
+def test_update_route__remove_relations_constant_queries_count(admin_user):
+    """ Количество запросов на удаление связей маршрута не зависит от количества мест и критериев """
+    places = [models.Place.objects.create(name=str(i), latitude=i, longitude=i) for i in range(50)]
+    criteria = [models.Criterion.objects.create(name=str(i), internal_name=f'remove_{i}') for i in range(20)]
+    registry.criteria.get(criteria[0].id)
+
+    queries_counts = []
+    for count in (1, len(places)):
+        route = _create_route(admin_user)
+        models_utils.create_or_update_route({
+            'author': admin_user,
+            'criteria': [{'criterion_id': criterion.id, 'value': 'v'} for criterion in criteria[:count]],
+            'places': [place.id for place in places[:count]],
+        }, route.uuid)
+
+        with CaptureQueriesContext(connection) as context:
+            models_utils.create_or_update_route({'author': admin_user, 'criteria': [], 'places': []}, route.uuid)
+        queries_counts.append(len(context.captured_queries))
+
+        _assert_route_relations(route, set(), set())
+
+    assert queries_counts[0] == queries_counts[1]
+
+
+def test_delete__versions_touched(admin_user):
+    """ Удаление через QuerySet и объект меняет версию ресурса один раз на операцию """
+    route = _create_route(admin_user)
+    _relate_places_to_route(route, _create_places())
+
+    routes_version = versions.get_versions(versions.ROUTES)[versions.ROUTES]
+    with CaptureQueriesContext(connection) as context:
+        models.RoutePlace.objects.filter(route=route).delete()
+    assert versions.get_versions(versions.ROUTES)[versions.ROUTES] > routes_version
+    assert sum('route_settings_builder_resourceversion' in query['sql'] for query in context.captured_queries) == 1
+
+    routes_version = versions.get_versions(versions.ROUTES)[versions.ROUTES]
+    route.delete()
+    assert versions.get_versions(versions.ROUTES)[versions.ROUTES] > routes_version
+
+
+def test_update_route__other_routes_relations_kept(admin_user):
+    """ Обновление связей маршрута не затрагивает связи других маршрутов """
+    places = _create_places()
+    criteria = _create_criteria()
+
+    route, _ = _relate_criteria_to_route(_create_route(admin_user), criteria)
+    route, _ = _relate_places_to_route(route, places)
+    other_route, _ = _relate_criteria_to_route(_create_route(admin_user), criteria)
+    other_route, _ = _relate_places_to_route(other_route, places)
+
+    models_utils.create_or_update_route({'author': admin_user, 'criteria': [], 'places': []}, route.uuid)
+
+    _assert_route_relations(other_route, {criterion.id for criterion in criteria}, {place.id for place in places})
+    assert not route.criteria.exists()
+    assert not route.places.exists()
+
+
+def test_update_route__invalid_criterion_value(admin_user):
+    """ Некорректное значение критерия не сохраняется """
+    route = _create_route(admin_user)
+    criterion = models.Criterion.objects.create(name='numeric', internal_name='numeric', value_type='numeric')
+
+    with pytest.raises(ValidationError):
+        models_utils.create_or_update_route({'author': admin_user,
+                                             'criteria': [{'criterion_id': criterion.id, 'value': 'NaN'}]},
+                                            route.uuid)
+
+    assert not route.criteria.exists()
+
+
 def test_get_points_coordinates_from_places(admin_user):
     """ Проверка запроса на получение списка точек маршрута """
     route = _create_route(admin_user)
@@ -83,18 +181,116 @@ def test_get_criteria_from_route(admin_user):
     """ Проверка запроса на получение перечня критериев со значениями """
     route = _create_route(admin_user)
     criteria = _create_criteria()
+    criteria.append(models.Criterion.objects.create(internal_name='-9', value_type='boolean', name='boolean'))
     criteria.append(models.Criterion.objects.create(internal_name='-10', value_type='numeric', name='numeric'))
 
     route, route_criteria = _relate_criteria_to_route(route, criteria)
 
     route_criteria_with_values = models_utils.get_criteria_from_route(route)
 
-    for route_criterion in route_criteria[:-1]:
+    for route_criterion in route_criteria[:-2]:
         assert route_criteria_with_values[route_criterion.criterion.internal_name] == route_criterion.value
 
+    assert route_criteria_with_values[route_criteria[-2].criterion.internal_name] is True
+
     assert route_criteria_with_values[route_criteria[-1].criterion.internal_name] == float(route_criteria[-1].value)
 
 
+def test_get_build_requests(admin_user):
+    """ Запросы на построение набора маршрутов собираются двумя запросами к БД """
+    places = _create_places()
+    criteria = _create_criteria()
+    criteria.append(models.Criterion.objects.create(internal_name='-9', value_type='boolean', name='boolean'))
+
+    routes = [_create_route(admin_user) for _ in range(3)]
+    _relate_places_to_route(routes[0], places)
+    _relate_criteria_to_route(routes[0], criteria)
+    _relate_places_to_route(routes[1], places[:1])
+    registry.criteria.get(criteria[0].id)
+
+    with CaptureQueriesContext(connection) as queries:
+        build_requests = models_utils.get_build_requests([route.id for route in routes])
+
+    assert len(queries) == 2
+
+    for route in routes:
+        assert build_requests[route.id] == {
+            'points_coordinates': models_utils.get_points_coordinates_from_route_places(route),
+            **models_utils.get_criteria_from_route(route),
+        }
+
+    assert build_requests[routes[2].id] == {'points_coordinates': []}
+
+
+def test_get_build_fingerprint():
+    """ Отпечаток зависит от порядка координат и не зависит от порядка критериев """
+    points_coordinates = [(1.0, 2.0), (3.0, 4.0)]
+    fingerprint = models_utils.get_build_fingerprint({'points_coordinates': points_coordinates, 'a': 1, 'b': 't'})
+
+    assert fingerprint == models_utils.get_build_fingerprint({'b': 't', 'a': 1,
+                                                              'points_coordinates': points_coordinates})
+    assert fingerprint != models_utils.get_build_fingerprint({'points_coordinates': points_coordinates[::-1],
+                                                              'a': 1, 'b': 't'})
+
+
+def test_claim_builds(admin_user):
+    """ Построение с теми же данными не захватывается повторно до ответа или истечения захвата """
+    first, second = _create_route(admin_user), _create_route(admin_user)
+
+    assert set(models_utils.claim_builds({first.uuid: 'a', second.uuid: 'a'})) == {first.uuid, second.uuid}
+    assert not models_utils.claim_builds({first.uuid: 'a'})
+
+    # Новые данные перехватывают захват, снятие захвата старыми данными его не затрагивает
+    assert set(models_utils.claim_builds({first.uuid: 'b'})) == {first.uuid}
+    models_utils.release_build_claims({first.uuid: 'a', second.uuid: 'a'})
+
+    assert models.Route.objects.get(pk=first.pk).build_claim_fingerprint == 'b'
+    assert set(models_utils.claim_builds({second.uuid: 'a'})) == {second.uuid}
+
+    models.Route.objects.filter(pk=first.pk).update(build_claimed_at=None)
+    assert set(models_utils.claim_builds({first.uuid: 'b'})) == {first.uuid}
+
+
+def test_claim_builds__jobs(admin_user, settings):
+    """ Захват построения создаёт задание, прежние задания маршрута заменяются, число заданий ограничено """
+    settings.ROUTE_BUILD_MAX_IN_FLIGHT_PER_USER = 2
+    first, second = _create_route(admin_user), _create_route(admin_user)
+    capacity = models_utils.get_build_capacity()
+
+    models_utils.claim_builds({first.uuid: 'a'})
+    models_utils.mark_builds_published([first.uuid])
+    assert models_utils.get_build_capacity(admin_user) == 1
+
+    models_utils.claim_builds({first.uuid: 'b', second.uuid: 'a'})
+    models_utils.release_build_claims({second.uuid: 'a'})
+
+    assert list(first.build_jobs.order_by('id').values_list('fingerprint', 'status')) == [
+        ('a', models.RouteBuildJob.STATUS_SUPERSEDED), ('b', models.RouteBuildJob.STATUS_QUEUED)]
+    assert second.build_jobs.get().status == models.RouteBuildJob.STATUS_FAILED
+    assert models_utils.get_build_capacity(admin_user) == 1
+    assert models_utils.get_build_capacity() == capacity - 1
+
+    # Задания без ответа за ROUTE_BUILD_CLAIM_TTL секунд истекают и не учитываются в ограничении
+    settings.ROUTE_BUILD_CLAIM_TTL = 0
+    assert models_utils.get_build_capacity(admin_user) == 2
+    assert first.build_jobs.latest('id').status == models.RouteBuildJob.STATUS_EXPIRED
+
+
+def test_claim_builds__capacity(admin_user, settings):
+    """ Ограничение проверяется при захвате и только для маршрутов, для которых создаётся новое задание """
+    settings.ROUTE_BUILD_MAX_IN_FLIGHT_PER_USER = 1
+    first, second = _create_route(admin_user), _create_route(admin_user)
+
+    claimed = models_utils.claim_builds({first.uuid: 'a', second.uuid: 'a'}, author=admin_user, limit_capacity=True)
+    assert claimed[first.uuid] is not None and claimed[second.uuid] is None
+    assert not second.build_jobs.exists()
+
+    # Повторный запрос выполняемого построения не создаёт задания и не ограничивается
+    assert not models_utils.claim_builds({first.uuid: 'a'}, author=admin_user, limit_capacity=True)
+    assert models_utils.claim_builds({second.uuid: 'a'}, author=admin_user, limit_capacity=True) == {
+        second.uuid: None}
+
+
 def _assert_route_relations(route: models.Route, criteria_ids: Optional[Set[int]], places_ids: Optional[Set[int]]):
     """
     Проверка наличия всех необходимых связей
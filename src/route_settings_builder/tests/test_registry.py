@@ -0,0 +1,65 @@
+import pytest
+
+from django.utils import timezone
+
+from route_settings_builder import models, registry
+
+pytestmark = pytest.mark.django_db
+
+
+def test_criteria_registry(django_assert_num_queries):
+    """ Критерии загружаются одним запросом и далее берутся из памяти """
+    criterion = models.Criterion.objects.create(name='Рейтинг', internal_name='rating', value_type='numeric')
+
+    with django_assert_num_queries(1):
+        assert registry.criteria.get(criterion.id).internal_name == 'rating'
+        assert registry.criteria.get_by_internal_name('rating').id == criterion.id
+        assert registry.criteria.get_value_types([criterion.id]) == {criterion.id: 'numeric'}
+
+
+def test_criteria_registry__invalidated_on_change():
+    """ Изменение критерия сбрасывает реестр и меняет его версию """
+    criterion = models.Criterion.objects.create(name='Рейтинг', internal_name='rating', value_type='numeric')
+    version = registry.criteria.version
+
+    criterion.value_type = 'string'
+    criterion.save()
+
+    assert registry.criteria.version != version
+    assert registry.criteria.get(criterion.id).value_type == 'string'
+
+    criterion.delete()
+    assert registry.criteria.get(criterion.id) is None
+
+
+def test_criteria_registry__stale_version(settings):
+    """ Изменение критерия другим процессом обнаруживается по версии в БД """
+    settings.CRITERIA_REGISTRY_CHECK_INTERVAL = 0
+    criterion = models.Criterion.objects.create(name='Рейтинг', internal_name='rating')
+    assert registry.criteria.get(criterion.id).name == 'Рейтинг'
+
+    models.Criterion.objects.filter(id=criterion.id).update(name='Оценка')
+    assert registry.criteria.get(criterion.id).name == 'Рейтинг'
+
+    models.Criterion.objects.filter(id=criterion.id).update(updated_at=timezone.now())
+    assert registry.criteria.get(criterion.id).name == 'Оценка'
+
+
+def test_criteria_registry__missing(settings, django_assert_num_queries):
+    """ Отсутствующий критерий не перезагружает реестр и повторно не запрашивается до смены версии """
+    criterion = models.Criterion.objects.create(name='Рейтинг', internal_name='rating')
+    assert registry.criteria.get(criterion.id) is not None
+
+    # По одному запросу строки на каждый отсутствующий ключ
+    with django_assert_num_queries(2):
+        assert registry.criteria.get_by_internal_name('unknown') is None
+        assert registry.criteria.get_by_internal_name('unknown') is None
+        assert registry.criteria.get_value_types([criterion.id, criterion.id + 1]) == {criterion.id: 'string'}
+
+    with django_assert_num_queries(0):
+        assert registry.criteria.get_value_types([criterion.id + 1]) == {}
+
+    # Критерий, созданный без сигналов, находится после проверки версии
+    settings.CRITERIA_REGISTRY_CHECK_INTERVAL = 0
+    models.Criterion.objects.bulk_create([models.Criterion(name='Длина', internal_name='unknown')])
+    assert registry.criteria.get_by_internal_name('unknown').name == 'Длина'
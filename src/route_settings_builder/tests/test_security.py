@@ -0,0 +1,111 @@
+from unittest import mock
+
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.contrib import auth
+from django.contrib.auth.hashers import make_password
+from django.test import RequestFactory
+
+from route_settings_builder import security
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def clear_verified_credentials():
+    """ Очистка кэша проверенных учётных данных между тестами """
+    security.verified_credentials.clear()
+    yield
+    security.verified_credentials.clear()
+
+
+def test_authenticate__cached(auth_credentials):
+    """ Повторная авторизация не запускает хеширование пароля """
+    authenticator = security.HttpBasicDjangoAuth()
+    request = RequestFactory().get('/')
+
+    user = authenticator.authenticate(request, **auth_credentials)
+    assert user is not None
+
+    with mock.patch('django.contrib.auth.authenticate') as authenticate:
+        assert authenticator.authenticate(request, **auth_credentials) == user
+        authenticate.assert_not_called()
+
+
+def test_authenticate__wrong_password_not_cached(auth_credentials):
+    """ Неверный пароль не принимается после успешной авторизации """
+    authenticator = security.HttpBasicDjangoAuth()
+    request = RequestFactory().get('/')
+
+    assert authenticator.authenticate(request, **auth_credentials) is not None
+    assert authenticator.authenticate(request, auth_credentials['username'], 'wrong') is None
+
+
+@pytest.mark.parametrize('update_user', [
+    lambda user: user.set_password('An0therVeryHardPASSWORD.'),
+    lambda user: setattr(user, 'is_active', False),
+])
+def test_authenticate__invalidated(auth_credentials, update_user):
+    """ Смена пароля или деактивация пользователя сбрасывают кэш """
+    authenticator = security.HttpBasicDjangoAuth()
+    request = RequestFactory().get('/')
+
+    assert authenticator.authenticate(request, **auth_credentials) is not None
+
+    user = get_user_model().objects.get(username=auth_credentials['username'])
+    update_user(user)
+    user.save()
+
+    assert len(security.verified_credentials) == 0
+    assert authenticator.authenticate(request, **auth_credentials) is None
+
+
+async def test_async_authenticate(async_auth_credentials):
+    """ Асинхронная авторизация без обёртки sync_to_async """
+    authenticator = security.AsyncHttpBasicDjangoAuth()
+    request = RequestFactory().get('/')
+
+    assert authenticator.is_async
+    assert await authenticator.authenticate(request, async_auth_credentials['username'], 'wrong') is None
+    assert await authenticator.authenticate(request, 'unknown', 'wrong') is None
+
+    user = await authenticator.authenticate(request, **async_auth_credentials)
+    assert user is not None
+
+    with mock.patch('route_settings_builder.security._run_hasher') as run_hasher:
+        assert await authenticator.authenticate(request, **async_auth_credentials) == user
+        run_hasher.assert_not_called()
+
+
+@pytest.mark.django_db(transaction=True)
+async def test_async_authenticate__model_backend(async_auth_credentials, settings):
+    """ Асинхронная авторизация обновляет хеш пароля и не принимает неактивных пользователей, как ModelBackend """
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.PBKDF2PasswordHasher',
+                                 'django.contrib.auth.hashers.MD5PasswordHasher']
+    authenticator = security.AsyncHttpBasicDjangoAuth()
+    request = RequestFactory().get('/')
+
+    user = await get_user_model().objects.aget(username=async_auth_credentials['username'])
+    user.password = make_password(async_auth_credentials['password'], hasher='md5')
+    await user.asave()
+
+    assert await authenticator.authenticate(request, **async_auth_credentials) is not None
+    await user.arefresh_from_db()
+    assert user.password.startswith('pbkdf2_sha256$')
+
+    user.is_active = False
+    await user.asave()
+    assert await authenticator.authenticate(request, **async_auth_credentials) is None
+
+
+@pytest.mark.django_db(transaction=True)
+async def test_async_authenticate__custom_backends(async_auth_credentials, settings):
+    """ При собственных AUTHENTICATION_BACKENDS используется auth.authenticate """
+    settings.AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.AllowAllUsersModelBackend']
+    authenticator = security.AsyncHttpBasicDjangoAuth()
+    request = RequestFactory().get('/')
+
+    with mock.patch('django.contrib.auth.authenticate', wraps=auth.authenticate) as backend_authenticate:
+        assert await authenticator.authenticate(request, **async_auth_credentials) is not None
+        backend_authenticate.assert_called_once()
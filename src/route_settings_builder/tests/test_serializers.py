@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from django.contrib.auth import get_user_model
+from ninja.responses import NinjaJSONEncoder
+
+from route_settings_builder import models, schemas, serializers
+
+pytestmark = pytest.mark.django_db
+
+
+def _serialize_with_schema(schema, objects) -> str:
+    """ Сериализация перечня схемой, как в ответах ninja """
+    return json.dumps([schema.from_orm(obj).model_dump(by_alias=True) for obj in objects], cls=NinjaJSONEncoder)
+
+
+def test_fast_list_serializer__places():
+    """ Быстрая сериализация мест совпадает с сериализацией PlaceSchema, координаты приводятся к float """
+    models.Place.objects.bulk_create([models.Place(name=f'Место {i}', longitude=20.123456 + i, latitude=-54.5)
+                                      for i in range(3)])
+    places = models.Place.objects.order_by('id')
+
+    serializer = serializers.FastListSerializer(schemas.PlaceSchema)
+    items = serializer.serialize(places)
+
+    assert json.dumps(items) == _serialize_with_schema(schemas.PlaceSchema, places)
+    assert all(isinstance(item['longitude'], float) for item in items)
+
+
+def test_fast_list_serializer__routes():
+    """ Быстрая сериализация маршрутов совпадает с сериализацией ListRouteSchema, включая is_draft """
+    user = get_user_model().objects.create(username='fast-serializer')
+    models.Route.objects.create(name='draft', author=user)
+    models.Route.objects.create(name='built', author=user, details={'path': []})
+    routes = models.Route.objects.filter(author=user).add_is_draft_field().order_by('id')
+
+    items = serializers.FastListSerializer(schemas.ListRouteSchema).serialize(routes)
+
+    assert json.dumps(items) == _serialize_with_schema(schemas.ListRouteSchema, routes)
+    assert [item['is_draft'] for item in items] == [True, False]
+
+
+def test_fast_list_serializer__alias_not_supported():
+    """ Схемы с alias не поддерживаются быстрой сериализацией """
+    with pytest.raises(ValueError):
+        serializers.FastListSerializer(schemas.DetailedPlaceSchema)
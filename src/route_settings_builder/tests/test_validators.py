@@ -3,7 +3,7 @@ import pytest
 
 from django.core.exceptions import ValidationError
 
-from route_settings_builder import validators
+from route_settings_builder import models, validators
 from route_settings_builder.models import validate_value
 
 
@@ -40,3 +40,23 @@ def test_validate_criterion_value(value_type: str, value: str, is_error):
 
     with pytest.raises(ValidationError):
         validate_value(value_type, value)
+
+
+@pytest.mark.django_db
+def test_bulk_create_criterion_values_validation(django_assert_num_queries):
+    """ Пакетная валидация значений критериев при массовом создании """
+    place = models.Place.objects.create(name='Место', latitude=10, longitude=10)
+    other_place = models.Place.objects.create(name='Другое место', latitude=20, longitude=20)
+    criteria = [models.Criterion.objects.create(name=str(i), internal_name=f'numeric_{i}', value_type='numeric')
+                for i in range(10)]
+
+    with pytest.raises(ValidationError):
+        models.PlaceCriterion.objects.bulk_create([models.PlaceCriterion(place=place, criterion=criterion, value='x')
+                                                   for criterion in criteria])
+    assert not models.PlaceCriterion.objects.exists()
+
+    # Реестр критериев уже загружен: выполняются только смена версии ресурса и вставка
+    with django_assert_num_queries(2):
+        models.PlaceCriterion.objects.bulk_create([models.PlaceCriterion(place=other_place, criterion=criterion,
+                                                                         value=str(i))
+                                                   for i, criterion in enumerate(criteria)])
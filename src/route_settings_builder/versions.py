@@ -0,0 +1,192 @@
+import functools
+import hashlib
+import inspect
+import json
+import time
+from typing import Callable, Dict, Optional
+
+from django.apps import apps
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+PLACES = 'places'
+CRITERIA = 'criteria'
+ROUTES = 'routes'
+
+# Атрибут запроса с уже полученными версиями ресурсов
+REQUEST_VERSIONS_ATTR = '_resources_versions'
+
+# Ресурсы API, ответы которых зависят от модели
+RESOURCES_BY_MODEL = {
+    'route_settings_builder.place': (PLACES, ROUTES),
+    'route_settings_builder.placecriterion': (PLACES,),
+    'route_settings_builder.criterion': (CRITERIA, PLACES, ROUTES),
+    'route_settings_builder.route': (ROUTES,),
+    'route_settings_builder.routeplace': (ROUTES,),
+    'route_settings_builder.routecriterion': (ROUTES,),
+}
+
+
+def get_versions(*resources: str) -> Dict[str, int]:
+    """
+    Получение версий ресурсов из БД одним запросом.
+    Версия – время последнего изменения ресурса в наносекундах
+    :param resources: ресурсы
+    :return: словарь вида {ресурс: версия}
+    """
+    resource_version_model = _get_resource_version_model()
+    versions = dict(resource_version_model.objects.filter(resource__in=resources).values_list('resource', 'version'))
+
+    if missing_resources := [resource for resource in resources if resource not in versions]:
+        # Версия ещё не задана: ресурс считается изменённым
+        _create_versions(missing_resources)
+        versions.update(resource_version_model.objects.filter(resource__in=missing_resources)
+                        .values_list('resource', 'version'))
+
+    return {resource: versions.get(resource, 0) for resource in resources}
+
+
+def get_request_versions(request: HttpRequest, *resources: str) -> Dict[str, int]:
+    """
+    Получение версий ресурсов для запроса.
+    Версии запоминаются в запросе: ETag и ключ кэша ответа вычисляются по одним версиям одним запросом к БД
+    :param request: запрос
+    :param resources: ресурсы
+    :return: словарь вида {ресурс: версия}
+    """
+    request_versions = getattr(request, REQUEST_VERSIONS_ATTR, {})
+
+    if missing_resources := [resource for resource in resources if resource not in request_versions]:
+        request_versions = {**request_versions, **get_versions(*missing_resources)}
+        setattr(request, REQUEST_VERSIONS_ATTR, request_versions)
+
+    return {resource: request_versions[resource] for resource in resources}
+
+
+def touch(*resources: str) -> None:
+    """
+    Смена версий ресурсов при их изменении.
+    Версии меняются в текущей транзакции: другие процессы видят новую версию вместе с изменёнными данными
+    :param resources: ресурсы
+    :return: None
+    """
+    resources = sorted(set(resources))
+    resource_versions = _get_resource_version_model().objects.filter(resource__in=resources)
+    # Версия растёт монотонно, даже если часы процессов расходятся
+    new_version = Greatest(F('version') + 1, Value(time.time_ns()))
+
+    if resource_versions.update(version=new_version) < len(resources):
+        _create_versions(resources)
+        resource_versions.update(version=new_version)
+
+
+def touch_model(model) -> None:
+    """
+    Смена версий ресурсов, зависящих от модели. Вызывается сигналами и массовыми операциями,
+    которые сигналов не отправляют
+    :param model: модель
+    :return: None
+    """
+    if resources := RESOURCES_BY_MODEL.get(model._meta.label_lower):  # pylint: disable=protected-access
+        touch(*resources)
+
+
+def conditional(*resources: str) -> Callable:
+    """
+    Декоратор операции API для условных запросов (If-None-Match, If-Modified-Since).
+    ETag и Last-Modified вычисляются по версиям ресурсов одним запросом без выборки данных и сериализации ответа,
+    при совпадении возвращается 304
+    :param resources: ресурсы, от которых зависит ответ
+    :return: декоратор
+    """
+    def decorator(view_func: Callable) -> Callable:
+        has_response_param = 'response' in inspect.signature(view_func).parameters
+
+        @functools.wraps(view_func)
+        def wrapper(request: HttpRequest, *args, response: HttpResponse, **kwargs):
+            etag, last_modified = _get_validators(request, get_request_versions(request, *resources))
+
+            if (not_modified := get_conditional_response(request, etag=etag, last_modified=last_modified)) is not None:
+                return not_modified
+
+            patch_conditional_headers(response, etag, last_modified)
+
+            if has_response_param:
+                kwargs['response'] = response
+            return view_func(request, *args, **kwargs)
+
+        return add_response_param(wrapper, view_func)
+
+    return decorator
+
+
+def add_response_param(wrapper: Callable, view_func: Callable) -> Callable:
+    """
+    Добавление параметра response в сигнатуру обёртки операции API.
+    Ninja передаёт по параметру с типом HttpResponse ответ, заголовки которого попадают в итоговый ответ
+    :param wrapper: обёртка операции
+    :param view_func: операция
+    :return: обёртка операции
+    """
+    signature = inspect.signature(view_func)
+
+    if 'response' not in signature.parameters:
+        wrapper.__signature__ = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter('response', inspect.Parameter.KEYWORD_ONLY, annotation=HttpResponse),
+        ])
+
+    return wrapper
+
+
+def patch_conditional_headers(response: HttpResponse, etag: str, last_modified: Optional[int]) -> None:
+    """
+    Установка заголовков для условных запросов.
+    Ответы зависят от пользователя, поэтому кэшируются клиентом с обязательной проверкой актуальности
+    :param response: ответ
+    :param etag: ETag
+    :param last_modified: время последнего изменения (timestamp)
+    :return: None
+    """
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+
+    patch_cache_control(response, private=True, no_cache=True)
+
+
+def _get_validators(request: HttpRequest, versions: Dict[str, int]):
+    """
+    Получение ETag и Last-Modified ответа
+    :param request: запрос
+    :param versions: версии ресурсов
+    :return: (ETag, timestamp последнего изменения)
+    """
+    user_id = getattr(getattr(request, 'auth', None), 'pk', None)
+    state = [request.get_full_path(), user_id, sorted(versions.items())]
+    etag = quote_etag(hashlib.sha256(json.dumps(state).encode()).hexdigest())
+
+    return etag, (max(versions.values()) // 1_000_000_000 if versions else None)
+
+
+def _create_versions(resources) -> None:
+    """
+    Создание отсутствующих версий ресурсов
+    :param resources: ресурсы
+    :return: None
+    """
+    resource_version_model = _get_resource_version_model()
+    now = time.time_ns()
+    resource_version_model.objects.bulk_create(
+        [resource_version_model(resource=resource, version=now) for resource in resources], ignore_conflicts=True)
+
+
+def _get_resource_version_model():
+    """
+    Получение модели версии ресурса. Модуль используется querysets, поэтому модель не импортируется
+    :return: модель
+    """
+    return apps.get_model('route_settings_builder', 'ResourceVersion')